@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Local receiver address book with instant prefix search.
+
+Receivers are kept in a SQLite database with an FTS5 index over name,
+address, postal code and phone. Indexed text is normalised first
+(persian_text.normalize_persian), so Persian and Arabic digits and letter
+variants find each other, and phone and postal codes are indexed as plain
+digits. Searches are prefix matches on every typed word, ranked by
+relevance and then by how recently a receiver was used. Index rows are
+re-inserted whenever a receiver is added or used, so the index's rowid
+order is "most recently used first" and broad queries need no ranking.
+
+    IMAGETOOLS_ADDRESS_BOOK=/path/book.sqlite3    database location
+
+Usage:
+    python app.py book import receivers.csv
+    python app.py book export book.jsonl
+    python app.py book search "تهران آزادی"
+    python app.py book stats
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+from persian_text import normalize_persian
+
+ADDRESS_BOOK_ENV = "IMAGETOOLS_ADDRESS_BOOK"
+RECEIVER_FIELDS = ["name", "address", "postal", "phone"]
+DEFAULT_LIMIT = 10
+
+# Queries matching more receivers than this skip relevance ranking
+RANK_CANDIDATES = 250
+
+# Rows per transaction during import
+IMPORT_BATCH = 5000
+
+# bm25 column weights: a name match outranks an address match
+RANK_WEIGHTS = (10.0, 2.0, 4.0, 4.0)
+
+_WORD_RE = re.compile(r"\w+")
+_NON_DIGIT_RE = re.compile(r"\D+")
+_DIGITS_QUERY_RE = re.compile(r"[\d\s\-+()]+")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS receivers (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    address TEXT NOT NULL,
+    postal TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    key TEXT NOT NULL UNIQUE,
+    use_count INTEGER NOT NULL DEFAULT 0,
+    last_used REAL,
+    fts_rowid INTEGER
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS receivers_fts USING fts5(
+    name, address, postal, phone, receiver_id UNINDEXED,
+    prefix='1 2 3', tokenize='unicode61 remove_diacritics 2'
+);
+"""
+
+
+def default_address_book_path():
+    if os.environ.get(ADDRESS_BOOK_ENV):
+        return os.environ[ADDRESS_BOOK_ENV]
+    if sys.platform == "win32":
+        base = os.environ.get("APPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+    return os.path.join(base, "imagetools", "address_book.sqlite3")
+
+
+def index_fields(receiver_info):
+    """The normalised text indexed for a receiver; phone and postal as bare digits"""
+    name, address, postal, phone = (normalize_persian(value) for value in receiver_info)
+    return name, address, _NON_DIGIT_RE.sub("", postal), _NON_DIGIT_RE.sub("", phone)
+
+
+def receiver_key(receiver_info):
+    """Identity of a receiver for de-duplication: the normalised fields"""
+    return "\x1f".join(" ".join(_WORD_RE.findall(value)) for value in index_fields(receiver_info))
+
+
+def match_query(text):
+    """FTS5 MATCH expression for as-you-type text, or None if nothing to search"""
+    text = normalize_persian(text)
+    if _DIGITS_QUERY_RE.fullmatch(text):
+        # "0912 123 45" is one phone number, not three words
+        words = [_NON_DIGIT_RE.sub("", text)]
+    else:
+        words = _WORD_RE.findall(text)
+    words = [word for word in words if word]
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+class AddressBook:
+    def __init__(self, path=None):
+        self.path = path or default_address_book_path()
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # The GUI searches on the UI thread and saves from job threads
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    # Writes
+
+    def _upsert(self, receiver_info, used):
+        """Insert or refresh one receiver inside the caller's transaction; returns its id"""
+        receiver_info = [str(value).strip() for value in receiver_info]
+        row_id, fts_rowid = self._db.execute(
+            """INSERT INTO receivers (name, address, postal, phone, key, use_count, last_used)
+               VALUES (?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(key) DO UPDATE SET
+                   name = excluded.name, address = excluded.address,
+                   postal = excluded.postal, phone = excluded.phone,
+                   use_count = use_count + excluded.use_count,
+                   last_used = coalesce(excluded.last_used, last_used)
+               RETURNING id, fts_rowid""",
+            (*receiver_info, receiver_key(receiver_info), int(used), time.time() if used else None),
+        ).fetchall()[0]
+
+        # Re-insert at the top of the index: newest rowid = most recent, and
+        # the latest spelling is the one indexed
+        if fts_rowid is not None:
+            self._db.execute("DELETE FROM receivers_fts WHERE rowid = ?", (fts_rowid,))
+        fts_rowid = self._db.execute(
+            "INSERT INTO receivers_fts (name, address, postal, phone, receiver_id) "
+            "VALUES (?, ?, ?, ?, ?)", (*index_fields(receiver_info), row_id)).lastrowid
+        self._db.execute("UPDATE receivers SET fts_rowid = ? WHERE id = ?", (fts_rowid, row_id))
+        return row_id
+
+    def add(self, receiver_info, used=True):
+        """Store a receiver (or refresh an existing one) and return its id.
+
+        used counts it as used now, which ranks it higher in searches.
+        """
+        if not any(str(value).strip() for value in receiver_info):
+            raise ValueError("Empty receiver")
+        with self._lock, self._db:
+            return self._upsert(receiver_info, used)
+
+    def remove(self, row_id):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM receivers_fts WHERE rowid = "
+                             "(SELECT fts_rowid FROM receivers WHERE id = ?)", (row_id,))
+            return self._db.execute("DELETE FROM receivers WHERE id = ?", (row_id,)).rowcount > 0
+
+    def import_receivers(self, receivers, progress=None):
+        """Add (label_id, receiver_info) pairs, e.g. from label_batch.iter_receivers.
+
+        Returns (added, updated). Duplicates (after normalisation) update the
+        existing entry instead of adding another.
+        """
+        before = self.count()
+        seen = 0
+        batch = []
+
+        def flush():
+            with self._lock, self._db:
+                for receiver_info in batch:
+                    self._upsert(receiver_info, used=False)
+            batch.clear()
+
+        for _, receiver_info in receivers:
+            if not any(receiver_info):
+                continue
+            batch.append(receiver_info)
+            seen += 1
+            if len(batch) >= IMPORT_BATCH:
+                flush()
+                if progress:
+                    progress(seen)
+        flush()
+
+        added = self.count() - before
+        return added, seen - added
+
+    def import_file(self, path, progress=None):
+        """Import a CSV or JSONL receivers file (the label_batch format)"""
+        from label_batch import iter_receivers
+        return self.import_receivers(iter_receivers(path), progress)
+
+    # Reads
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT count(*) FROM receivers").fetchone()[0]
+
+    def get(self, row_id):
+        with self._lock:
+            row = self._db.execute("SELECT name, address, postal, phone FROM receivers WHERE id = ?",
+                                   (row_id,)).fetchone()
+        return list(row) if row else None
+
+    def search(self, text, limit=DEFAULT_LIMIT):
+        """[(id, receiver_info)] whose words start with every word of text, best first.
+
+        Up to RANK_CANDIDATES matches are ranked by relevance, then by how
+        recently they were used. A broader query (the first letter or two)
+        returns the most recently used or added matches instead: scoring
+        costs about 10 us per match, too much per keystroke for thousands.
+        """
+        query = match_query(text)
+        if query is None:
+            return []
+
+        with self._lock:
+            matches = self._db.execute(
+                "SELECT count(*) FROM (SELECT 1 FROM receivers_fts WHERE receivers_fts MATCH ? LIMIT ?)",
+                (query, RANK_CANDIDATES + 1)).fetchone()[0]
+
+            # Equal scores fall back to rowid order, i.e. most recently used first
+            if matches <= RANK_CANDIDATES:
+                order = "rank, rowid DESC"
+                rank = "AND rank MATCH 'bm25({})'".format(", ".join(map(str, RANK_WEIGHTS)))
+            else:
+                order = "rowid DESC"
+                rank = ""
+
+            # CROSS JOIN keeps the few matches as the outer loop
+            rows = self._db.execute(
+                f"""SELECT r.id, r.name, r.address, r.postal, r.phone
+                    FROM (SELECT receiver_id, row_number() OVER () AS position
+                          FROM (SELECT receiver_id FROM receivers_fts
+                                WHERE receivers_fts MATCH ? {rank}
+                                ORDER BY {order} LIMIT ?)) AS f
+                    CROSS JOIN receivers AS r ON r.id = f.receiver_id
+                    ORDER BY f.position""",
+                (query, limit)).fetchall()
+        return [(row[0], list(row[1:])) for row in rows]
+
+    def iter_all(self):
+        """Yield every receiver_info, most used first"""
+        with self._lock:
+            rows = self._db.execute("SELECT name, address, postal, phone FROM receivers "
+                                    "ORDER BY use_count DESC, id").fetchall()
+        for row in rows:
+            yield list(row)
+
+    def export_file(self, path):
+        """Write every receiver to a CSV or JSONL file; returns the count"""
+        count = 0
+        ext = os.path.splitext(path)[1].lower()
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            if ext in (".jsonl", ".json", ".ndjson"):
+                for receiver_info in self.iter_all():
+                    f.write(json.dumps(dict(zip(RECEIVER_FIELDS, receiver_info)),
+                                       ensure_ascii=False) + "\n")
+                    count += 1
+            else:
+                writer = csv.writer(f)
+                writer.writerow(RECEIVER_FIELDS)
+                for receiver_info in self.iter_all():
+                    writer.writerow(receiver_info)
+                    count += 1
+        return count
+
+    def stats(self):
+        with self._lock:
+            entries, used = self._db.execute(
+                "SELECT count(*), count(last_used) FROM receivers").fetchone()
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        return {"path": self.path, "entries": entries, "used": used, "bytes": size}
+
+
+# CLI
+
+def build_parser(parser=None):
+    parser = parser or argparse.ArgumentParser(description="Receiver address book")
+    parser.add_argument("--db", help=f"Database file (default: ${ADDRESS_BOOK_ENV} or the user data dir)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="Add receivers from CSV or JSONL files")
+    import_parser.add_argument("files", nargs="+")
+    export_parser = commands.add_parser("export", help="Write all receivers to CSV or JSONL")
+    export_parser.add_argument("file")
+    search = commands.add_parser("search", help="Prefix search like the GUI completion")
+    search.add_argument("text")
+    search.add_argument("-n", "--limit", type=int, default=DEFAULT_LIMIT)
+    commands.add_parser("stats", help="Show entries and database size")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    with AddressBook(args.db) as book:
+        if args.command == "import":
+            for path in args.files:
+                start = time.perf_counter()
+                try:
+                    added, updated = book.import_file(path)
+                except (OSError, ValueError) as e:
+                    print(f"❌ {path}: {e}")
+                    return 1
+                print(f"✅ {path}: {added} added, {updated} already known "
+                      f"({time.perf_counter() - start:.2f}s)")
+
+        elif args.command == "export":
+            count = book.export_file(args.file)
+            print(f"✅ Wrote {count} receivers to {args.file}")
+
+        elif args.command == "search":
+            start = time.perf_counter()
+            results = book.search(args.text, args.limit)
+            elapsed = (time.perf_counter() - start) * 1000
+            for row_id, receiver_info in results:
+                print(f"{row_id:>7}  " + " | ".join(receiver_info))
+            print(f"ℹ️ {len(results)} result(s) in {elapsed:.1f} ms")
+
+        else:
+            stats = book.stats()
+            print(f"📊 {stats['path']}")
+            print(f"   {stats['entries']} receivers ({stats['used']} used for labels), "
+                  f"{stats['bytes'] / 2**20:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,10 +3,41 @@
 
 import sys
 import os
-from PIL import Image, ImageDraw, ImageFont
-from PyQt6.QtWidgets import QTabWidget, QSpinBox, QGroupBox
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import mm
+
+# Must come before the other imports so their cost can be measured
+STARTUP_PROFILE = "--startup-profile" in sys.argv
+if STARTUP_PROFILE:
+    import startup_profile
+    startup_profile.install()
+
+# Headless subcommands: python app.py <command> [args...]
+CLI_COMMANDS = {
+    "batch": "label_batch",
+    "bench": "benchmarks",
+    "print": "printer_raster",
+    "cache": "render_cache",
+    "sheet": "label_sheet",
+    "serve": "label_server",
+    "crop": "crop_batch",
+    "stream": "label_stream",
+    "book": "address_book",
+    "watch": "hot_folder",
+}
+
+def run_cli_command(command, argv):
+    import importlib
+    module = importlib.import_module(CLI_COMMANDS[command])
+    return module.main(argv)
+
+# Headless commands run before the GUI imports below, so they work without
+# PyQt6 and don't pay for loading Qt
+if __name__ == "__main__" and len(sys.argv) > 1 and sys.argv[1] in CLI_COMMANDS:
+    # Needed for process pools inside the frozen PyInstaller EXE
+    import multiprocessing
+    multiprocessing.freeze_support()
+    sys.exit(run_cli_command(sys.argv[1], sys.argv[2:]))
+
+from PIL import Image
 from pathlib import Path
 
 try:
@@ -14,62 +45,217 @@ try:
                                 QHBoxLayout, QGridLayout, QLabel, QLineEdit, 
                                 QPushButton, QTextEdit, QFrame, QFileDialog, 
                                 QMessageBox, QGroupBox, QSpacerItem, QSizePolicy)
-    from PyQt6.QtCore import Qt, QThread, pyqtSignal
-    from PyQt6.QtGui import QFont, QPalette, QPixmap, QFontDatabase
+    from PyQt6.QtWidgets import QCompleter, QTabWidget, QSpinBox, QCheckBox
+    from PyQt6.QtCore import Qt, QThread, QThreadPool, QTimer, QModelIndex, pyqtSignal
+    from PyQt6.QtGui import (QFont, QPalette, QPixmap, QFontDatabase, QImage, QPainter,
+                             QStandardItem, QStandardItemModel)
     PYQT_AVAILABLE = True
 except ImportError:
     PYQT_AVAILABLE = False
     print("❌ PyQt6 not found. Install with: pip install PyQt6")
 
-# Safe BiDi imports with fallback
-BIDI_AVAILABLE = False
-try:
-    from arabic_reshaper import arabic_reshaper
-    from bidi.algorithm import get_display
-    BIDI_AVAILABLE = True
-except ImportError:
-    BIDI_AVAILABLE = False
+from label_renderer import (DEFAULT_SENDER_INFO, debug_fonts, fix_persian_text,
+                            wrap_text, create_address_label, render_address_label,
+                            redraw_receiver_fields, get_label_template)
+from background_jobs import Job, JobProgressWidget, JobRunner, format_timings
+from instrumentation import trace_run
 
-def debug_fonts():
-    """Debug font paths and availability"""
-    if getattr(sys, 'frozen', False):
-        base_path = Path(sys._MEIPASS)
-        font_path = base_path / 'fonts'
-    else:
-        base_path = Path(__file__).parent
-        font_path = base_path
-    
-    font_names = ["Vazir-Bold.ttf", "Vazir-Medium.ttf", "Vazir-Regular.ttf", "Vazir.ttf"]
-    found_font = None
-    
-    for font_name in font_names:
-        font_file = font_path / font_name
-        if font_file.exists():
-            found_font = str(font_file)
-            break
-        else:
-            font_file = base_path / font_name
-            if font_file.exists():
-                found_font = str(font_file)
-                break
+# label_pdf, label_batch and image_cropper pull in ReportLab and
+# multiprocessing (~150 ms); they are imported inside the jobs that use
+# them, on a worker thread, the first time they are needed. The address
+# book is opened on the first keystroke in a receiver field.
+
+# Label preview pane: delay between the last keystroke and the redraw
+LIVE_PREVIEW_DEBOUNCE_MS = 150
+LIVE_PREVIEW_SIZE = (378, 236)
+
+# Cropper outputs: "<w>x<h>[@dpi][:format]" per target, see image_cropper.parse_crop_targets
+CROP_TARGETS_TEXT = "34, 34:pdf"
+CROP_TARGETS_EXAMPLE = "34, 34:pdf, 30x40@300:jpeg, 35x45@600:tiff"
+
+# Receiver completion: suggestions shown, and the shortest text searched
+COMPLETION_LIMIT = 8
+COMPLETION_MIN_CHARS = 1
+
+def pil_to_qpixmap(pil_image):
+    """Build a QPixmap straight from a PIL image's pixel buffer (no disk I/O)"""
+    formats = {
+        'L': (QImage.Format.Format_Grayscale8, 1),
+        'RGB': (QImage.Format.Format_RGB888, 3),
+        'RGBA': (QImage.Format.Format_RGBA8888, 4),
+    }
+    if pil_image.mode not in formats:
+        pil_image = pil_image.convert('RGB')
+    
+    qformat, channels = formats[pil_image.mode]
+    data = pil_image.tobytes()
+    # The QImage only borrows data; fromImage() copies it into the pixmap
+    # while data is still alive
+    qimage = QImage(data, pil_image.width, pil_image.height, pil_image.width * channels, qformat)
+    return QPixmap.fromImage(qimage)
+
+def make_preview(pil_image, max_size=400):
+    """Scale an image to fit max_size x max_size for the preview label"""
+    ratio = min(max_size / pil_image.width, max_size / pil_image.height)
+    new_size = (int(pil_image.width * ratio), int(pil_image.height * ratio))
+    
+    # reducing_gap lets PIL reduce() large images before the LANCZOS pass
+    return pil_image.resize(new_size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+def load_image_job(job, file_path):
+    from lazy_image import LazyImage, MemoryBudgetExceeded
+    
+    # Only the header is read here; crops decode just the region they need
+    with job.stage("open"):
+        image = LazyImage(file_path)
+    
+    job.report(30, "preview")
+    with job.stage("preview"):
+        try:
+            preview_image = image.preview(400)
+        except MemoryBudgetExceeded as e:
+            # The crop itself may still fit, so the image stays usable
+            preview_image = str(e)
     
-    return found_font
+    return image, preview_image
 
-def fix_persian_text(text):
-    """Fix Persian/Arabic text for proper display in PIL"""
-    if not text or not text.strip():
-        return text
+def crop_and_save_job(job, image, dpi, targets_text, save_dir, base_name):
+    from image_cropper import crop_targets, parse_crop_targets, save_crop_targets
+    
+    targets = parse_crop_targets(targets_text)
+    
+    # One decode for every output size and DPI
+    with job.stage("crop"):
+        cropped_images = crop_targets(image, dpi, targets)
+    
+    job.report(30, "encode")
+    with job.stage("encode"):
+        paths = save_crop_targets(cropped_images, targets, save_dir, base_name)
+    
+    with job.stage("preview"):
+        preview_image = make_preview(cropped_images[0])
+    
+    return cropped_images[0], preview_image, paths
+
+def batch_crop_job(job, folder, dpi, output_dir, pdf_path=None):
+    from crop_batch import crop_batch, find_images
+    
+    with job.stage("scan"):
+        paths = find_images([folder])
+    
+    done = []
+    def on_result(result):
+        done.append(result)
+        job.report(100 * len(done) // max(len(paths), 1), f"{len(done)}/{len(paths)}")
+    
+    with job.stage("crop"):
+        return crop_batch(paths, output_dir, dpi, pdf_path=pdf_path, progress=on_result)
+
+def generate_label_job(job, sender_info, receiver_info, filename, pdf_backend, output_mode="rgb",
+                       use_cache=True):
+    from label_pdf import write_label_pdf
+    from render_cache import default_cache
+    
+    files = [filename]
+    cache = default_cache() if use_cache else None
+    
+    if filename.endswith('.pdf'):
+        with job.stage("pdf"):
+            write_label_pdf(sender_info, receiver_info, filename, backend=pdf_backend,
+                            output_mode=output_mode, cache=cache)
+        return files
+    
+    with job.stage("render"):
+        img = create_address_label(sender_info, receiver_info, filename, output_mode=output_mode,
+                                   cache=cache)
+    
+    base, ext = os.path.splitext(filename)
+    if ext.lower() in ('.png', '.tif', '.tiff'):
+        job.report(60, "pdf")
+        pdf_filename = base + '.pdf'
+        with job.stage("pdf"):
+            write_label_pdf(sender_info, receiver_info, pdf_filename, backend=pdf_backend, img=img,
+                            output_mode=output_mode, cache=cache)
+        files.append(pdf_filename)
+    
+    return files
+
+def batch_labels_job(job, sender_info, receivers_path, output_dir, pdf_backend, output_mode="rgb",
+                     use_cache=True):
+    from label_batch import read_receivers, render_batch
+    
+    with job.stage("read"):
+        receivers = read_receivers(receivers_path)
+    
+    done = []
+    def on_result(result):
+        done.append(result)
+        job.report(100 * len(done) // max(len(receivers), 1), f"{len(done)}/{len(receivers)}")
+    
+    with job.stage("render"):
+        return render_batch(receivers, output_dir, sender_info=sender_info,
+                            pdf_backend=pdf_backend, progress=on_result,
+                            output_mode=output_mode, use_cache=use_cache)
+
+def sheet_labels_job(job, sender_info, receivers_path, pdf_filename):
+    from label_batch import read_receivers
+    from label_sheet import write_label_sheet
+    
+    with job.stage("read"):
+        receivers = read_receivers(receivers_path)
+    
+    def on_progress(placed):
+        job.report(100 * placed // max(len(receivers), 1), f"{placed}/{len(receivers)}")
+    
+    with job.stage("impose"):
+        return write_label_sheet(receivers, pdf_filename, sender_info=sender_info,
+                                 progress=on_progress)
+
+def import_address_book_job(job, book, path):
+    def on_progress(seen):
+        job.report(0, f"{seen}")
+    
+    with job.stage("import"):
+        added, updated = book.import_file(path, progress=on_progress)
+    return {"added": added, "updated": updated, "entries": book.count()}
+
+def export_address_book_job(job, book, path):
+    with job.stage("export"):
+        return book.export_file(path)
+
+def warm_up_job(job, sender_info):
+    """Load fonts, the shaping libraries and the label template off the UI thread"""
+    from font_registry import warm_fonts
+    
+    with job.stage("fonts"):
+        warm_fonts()
+    
+    with job.stage("template"):
+        get_label_template(sender_info)
+    
+    return job.timings
+
+def show_trace_summary(widget, trace):
+    """Show a traced per-stage breakdown in the main window's status bar"""
+    if trace is not None and trace.totals:
+        widget.window().statusBar().showMessage(f"⏱️ {trace.name}: {trace.summary()}")
+
+class LazyTab(QWidget):
+    """Tab placeholder that builds the real widget the first time it is shown"""
+    
+    def __init__(self, factory):
+        super().__init__()
+        self.factory = factory
+        self.widget = None
         
-    if not BIDI_AVAILABLE:
-        # Simple fallback - reverse Persian text
-        return text[::-1] if any('\u0600' <= c <= '\u06FF' for c in text) else text
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
     
-    try:
-        reshaped_text = arabic_reshaper.reshape(text)
-        bidi_text = get_display(reshaped_text)
-        return bidi_text
-    except Exception:
-        return text[::-1] if any('\u0600' <= c <= '\u06FF' for c in text) else text
+    def showEvent(self, event):
+        if self.widget is None:
+            self.widget = self.factory()
+            self.layout().addWidget(self.widget)
+        super().showEvent(event)
 
 class ImageCropperWidget(QWidget):
     def __init__(self):
@@ -77,6 +263,8 @@ class ImageCropperWidget(QWidget):
         self.original_image = None
         self.cropped_image = None
         self.input_file_path = ""
+        self.jobs = JobRunner(self)
+        self.jobs.busy_changed.connect(self.set_busy)
         self.init_ui()
         
     def init_ui(self):
@@ -113,6 +301,15 @@ class ImageCropperWidget(QWidget):
         dpi_layout.addStretch()
         input_layout.addLayout(dpi_layout)
         
+        # Every target is cut from the same decode of the image
+        targets_layout = QHBoxLayout()
+        targets_layout.addWidget(QLabel("خروجی‌ها (mm@DPI:فرمت):"))
+        self.targets_edit = QLineEdit(CROP_TARGETS_TEXT)
+        self.targets_edit.setPlaceholderText(CROP_TARGETS_EXAMPLE)
+        self.targets_edit.setToolTip(f"e.g. {CROP_TARGETS_EXAMPLE}")
+        targets_layout.addWidget(self.targets_edit)
+        input_layout.addLayout(targets_layout)
+        
         main_layout.addWidget(input_group)
         
         preview_group = QGroupBox("پیش نمایش")
@@ -132,9 +329,16 @@ class ImageCropperWidget(QWidget):
         self.process_button.clicked.connect(self.process_and_save)
         self.process_button.setEnabled(False)
         
+        self.batch_button = QPushButton("برش گروهی پوشه")
+        self.batch_button.clicked.connect(self.crop_folder)
+        
         button_layout.addWidget(self.process_button)
+        button_layout.addWidget(self.batch_button)
         main_layout.addLayout(button_layout)
         
+        self.job_progress = JobProgressWidget(self.jobs)
+        main_layout.addWidget(self.job_progress)
+        
         self.status_label = QLabel("آماده")
         self.status_label.setStyleSheet("padding: 5px; background-color: #f0f0f0;")
         main_layout.addWidget(self.status_label)
@@ -149,36 +353,36 @@ class ImageCropperWidget(QWidget):
             self.file_label.setText(os.path.basename(file_path))
             self.load_image(file_path)
             
+    def set_busy(self, busy):
+        self.select_button.setEnabled(not busy)
+        self.batch_button.setEnabled(not busy)
+        self.process_button.setEnabled(not busy and self.original_image is not None)
+    
+    def start_job(self, job, on_finished, error_prefix):
+        job.signals.done.connect(lambda: show_trace_summary(self, job.trace))
+        job.signals.finished.connect(lambda result: on_finished(result, job.timings))
+        job.signals.failed.connect(
+            lambda message: QMessageBox.critical(self, "Error", f"{error_prefix}: {message}"))
+        job.signals.cancelled.connect(lambda: self.status_label.setText("Cancelled"))
+        self.jobs.start(job)
+    
     def load_image(self, file_path):
-        try:
-            self.original_image = Image.open(file_path)
-            
-            if self.original_image.mode != 'RGB':
-                self.original_image = self.original_image.convert('RGB')
-            
-            self.show_preview(self.original_image, "Original Image")
-            self.process_button.setEnabled(True)
-            self.status_label.setText(f"Loaded: {self.original_image.size[0]}x{self.original_image.size[1]} pixels")
-            
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to load image: {str(e)}")
-            
+        self.status_label.setText(f"Loading {os.path.basename(file_path)}...")
+        self.start_job(Job(load_image_job, file_path), self.on_image_loaded,
+                       "Failed to load image")
+    
+    def on_image_loaded(self, result, timings):
+        self.original_image, preview_image = result
+        if isinstance(preview_image, str):
+            self.preview_label.setText(f"No preview: {preview_image}")
+        else:
+            self.preview_label.setPixmap(pil_to_qpixmap(preview_image))
+        self.process_button.setEnabled(True)
+        self.status_label.setText(f"Loaded: {self.original_image.size[0]}x{self.original_image.size[1]} pixels"
+                                  f"  ({format_timings(timings)})")
+    
     def show_preview(self, pil_image, title="Preview"):
-        preview_image = pil_image.copy()
-        
-        max_size = 400
-        ratio = min(max_size / preview_image.width, max_size / preview_image.height)
-        new_size = (int(preview_image.width * ratio), int(preview_image.height * ratio))
-        preview_image = preview_image.resize(new_size, Image.Resampling.LANCZOS)
-        
-        preview_image.save('temp_preview.png')
-        pixmap = QPixmap('temp_preview.png')
-        self.preview_label.setPixmap(pixmap)
-        
-        try:
-            os.remove('temp_preview.png')
-        except:
-            pass
+        self.preview_label.setPixmap(pil_to_qpixmap(make_preview(pil_image)))
     
     def process_and_save(self):
         if not self.original_image:
@@ -187,85 +391,83 @@ class ImageCropperWidget(QWidget):
         save_dir = QFileDialog.getExistingDirectory(self, "Select Save Directory")
         if not save_dir:
             return
-            
-        try:
-            dpi = self.dpi_spinbox.value()
-            
-            mm_to_inch = 1 / 25.4
-            size_in_inches = 34 * mm_to_inch
-            size_in_pixels = int(size_in_inches * dpi)
-            
-            original_width, original_height = self.original_image.size
-            
-            left = (original_width - size_in_pixels) // 2
-            top = (original_height - size_in_pixels) // 2
-            right = left + size_in_pixels
-            bottom = top + size_in_pixels
-            
-            if left < 0 or top < 0 or right > original_width or bottom > original_height:
-                scale_factor = max(
-                    size_in_pixels / original_width,
-                    size_in_pixels / original_height
-                )
-                
-                new_width = int(original_width * scale_factor * 1.1)
-                new_height = int(original_height * scale_factor * 1.1)
-                
-                resized_image = self.original_image.resize(
-                    (new_width, new_height), Image.Resampling.LANCZOS
-                )
-                
-                left = (new_width - size_in_pixels) // 2
-                top = (new_height - size_in_pixels) // 2
-                right = left + size_in_pixels
-                bottom = top + size_in_pixels
-                
-                self.cropped_image = resized_image.crop((left, top, right, bottom))
-            else:
-                self.cropped_image = self.original_image.crop((left, top, right, bottom))
-            
-            self.show_preview(self.cropped_image, "Cropped Image (34mm x 34mm)")
-            
-            base_name = os.path.splitext(os.path.basename(self.input_file_path))[0]
-            
-            image_path = os.path.join(save_dir, f"{base_name}_34mm.png")
-            self.cropped_image.save(image_path, quality=95)
-            
-            pdf_path = os.path.join(save_dir, f"{base_name}_34mm.pdf")
-            
-            page_size = (34 * mm, 34 * mm)
-            c = canvas.Canvas(pdf_path, pagesize=page_size)
-            
-            temp_image_path = "temp_for_pdf.png"
-            self.cropped_image.save(temp_image_path)
-            
-            c.drawImage(temp_image_path, 0, 0, width=34*mm, height=34*mm)
-            c.save()
-            
-            try:
-                os.remove(temp_image_path)
-            except:
-                pass
-            
-            self.status_label.setText(f"Saved: {image_path} and {pdf_path}")
-            QMessageBox.information(self, "Success", f"Files saved successfully:\n{image_path}\n{pdf_path}")
-            
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to process and save: {str(e)}")
+        
+        dpi = self.dpi_spinbox.value()
+        base_name = os.path.splitext(os.path.basename(self.input_file_path))[0]
+        
+        targets_text = self.targets_edit.text().strip() or CROP_TARGETS_TEXT
+        
+        self.start_job(Job(crop_and_save_job, self.original_image, dpi, targets_text, save_dir,
+                           base_name),
+                       self.on_crop_saved, "Failed to process and save")
+    
+    def on_crop_saved(self, result, timings):
+        self.cropped_image, preview_image, paths = result
+        self.preview_label.setPixmap(pil_to_qpixmap(preview_image))
+        
+        names = ", ".join(os.path.basename(path) for path in paths)
+        self.status_label.setText(f"Saved: {names}  ({format_timings(timings)})")
+        QMessageBox.information(self, "Success", "Files saved successfully:\n" + "\n".join(paths))
+    
+    def crop_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, "Select Image Folder")
+        if not folder:
+            return
+        
+        save_dir = QFileDialog.getExistingDirectory(self, "Select Save Directory")
+        if not save_dir:
+            return
+        
+        reply = QMessageBox.question(
+            self, "PDF", "یک PDF چندصفحه‌ای از همه برش‌ها هم ساخته شود؟",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+            QMessageBox.StandardButton.Yes
+        )
+        pdf_path = None
+        if reply == QMessageBox.StandardButton.Yes:
+            pdf_path = os.path.join(save_dir, f"{os.path.basename(os.path.normpath(folder))}_34mm.pdf")
+        
+        self.status_label.setText(f"Cropping {folder}...")
+        self.start_job(Job(batch_crop_job, folder, self.dpi_spinbox.value(), save_dir, pdf_path),
+                       self.on_folder_cropped, "Failed to crop folder")
+    
+    def on_folder_cropped(self, summary, timings):
+        message = (f"Cropped {summary['succeeded']} of {summary['total']} images "
+                   f"({summary['images_per_second']:.1f} images/s)")
+        if summary["pdf"]:
+            message += f"\nPDF: {summary['pdf']}"
+        self.status_label.setText(f"{message.splitlines()[0]}  ({format_timings(timings)})")
+        if summary["errors"]:
+            message += "\n\n" + "\n".join(f"{os.path.basename(source)}: {error}"
+                                            for source, error in summary["errors"][:10])
+        QMessageBox.information(self, "Success", message)
 
 class AddressLabelWidget(QWidget):
     def __init__(self):
         super().__init__()
         
-        self.sender_info = [
-            "شرکت هوش مصنوعی اندیشمندان برتر",
-            "شیراز،شهرک آرین بلوار سفیر امید ۲، کوچه ۲/۶",
-            "۷۱۴۵۶۸۳۲۱۰",
-            "۰۲۱۹۱۰۹۱۷۲۲"
-        ]
+        self.sender_info = list(DEFAULT_SENDER_INFO)
+        self.jobs = JobRunner(self)
+        self.jobs.busy_changed.connect(self.set_busy)
+        
+        # Live preview: full render once, then only the receiver region
+        self.live_image = None
+        self.live_pixmap = None
+        self.live_sender_info = None
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(LIVE_PREVIEW_DEBOUNCE_MS)
+        self.preview_timer.timeout.connect(self.refresh_live_preview)
+        
+        # Opened on first use; False once it failed to open
+        self.book = None
         
         self.init_ui()
         self.load_sample_data()
+        # Filling in the sample data started the debounce timer; the first
+        # preview is rendered once MainApp's warm-up job has loaded the
+        # fonts instead, so building this tab stays cheap
+        self.preview_timer.stop()
     
     def init_ui(self):
         font = QFont()
@@ -279,8 +481,13 @@ class AddressLabelWidget(QWidget):
         
         self.create_header(main_layout)
         self.create_sender_section(main_layout)
-        self.create_receiver_section(main_layout)
+        receiver_row = QHBoxLayout()
+        self.create_receiver_section(receiver_row)
+        self.create_live_preview(receiver_row)
+        main_layout.addLayout(receiver_row)
         self.create_control_buttons(main_layout)
+        self.job_progress = JobProgressWidget(self.jobs)
+        main_layout.addWidget(self.job_progress)
         self.create_footer(main_layout)
         self.apply_styles()
     
@@ -436,9 +643,123 @@ class AddressLabelWidget(QWidget):
             receiver_layout.addWidget(entry, row, 1)
             
             self.receiver_entries[field_name] = entry
+            entry.textChanged.connect(self.preview_timer.start)
+        
+        # As-you-type suggestions from the address book on the one-line fields
+        self.completers = {field_name: self.create_completer(entry)
+                           for field_name, entry in self.receiver_entries.items()
+                           if isinstance(entry, QLineEdit)}
+        
+        book_row = QHBoxLayout()
+        for button_text, callback in (("📥 ورود به دفترچه آدرس", self.import_address_book),
+                                      ("📤 خروجی دفترچه آدرس", self.export_address_book)):
+            btn = QPushButton(button_text)
+            btn.clicked.connect(callback)
+            book_row.addWidget(btn)
+        receiver_layout.addLayout(book_row, len(fields), 0, 1, 2)
         
         layout.addWidget(receiver_group)
     
+    def create_completer(self, entry):
+        """Popup of address book matches under entry; picking one fills every field"""
+        completer = QCompleter(QStandardItemModel(self), self)
+        completer.setWidget(entry)
+        completer.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        completer.setMaxVisibleItems(COMPLETION_LIMIT)
+        completer.activated[QModelIndex].connect(self.fill_receiver)
+        entry.textEdited.connect(lambda text: self.suggest_receivers(completer, text))
+        return completer
+    
+    def address_book(self):
+        if self.book is None:
+            try:
+                from address_book import AddressBook
+                self.book = AddressBook()
+            except Exception as e:
+                print(f"⚠️ Address book unavailable: {e}")
+                self.book = False
+        return self.book or None
+    
+    def suggest_receivers(self, completer, text):
+        book = self.address_book() if len(text.strip()) >= COMPLETION_MIN_CHARS else None
+        results = book.search(text, COMPLETION_LIMIT) if book else []
+        
+        model = completer.model()
+        model.clear()
+        for row_id, receiver_info in results:
+            item = QStandardItem(" | ".join(value for value in receiver_info if value))
+            item.setData(receiver_info, Qt.ItemDataRole.UserRole)
+            model.appendRow(item)
+        
+        if results:
+            completer.complete()
+        else:
+            completer.popup().hide()
+    
+    def fill_receiver(self, index):
+        receiver_info = index.data(Qt.ItemDataRole.UserRole)
+        if not receiver_info:
+            return
+        for field_name, value in zip(("receiver_name", "receiver_address",
+                                      "receiver_postal", "receiver_phone"), receiver_info):
+            entry = self.receiver_entries[field_name]
+            if isinstance(entry, QTextEdit):
+                entry.setPlainText(value)
+            else:
+                entry.setText(value)
+    
+    def remember_receiver(self, receiver_info):
+        """Add a receiver that was just used to the address book"""
+        book = self.address_book()
+        if book:
+            try:
+                book.add(receiver_info)
+            except Exception as e:
+                print(f"⚠️ Could not save receiver to the address book: {e}")
+    
+    def import_address_book(self):
+        path, _ = QFileDialog.getOpenFileName(
+            self, "فایل گیرندگان", "", "Receivers (*.csv *.jsonl);;All files (*.*)"
+        )
+        book = self.address_book() if path else None
+        if not book:
+            return
+        
+        self.start_job(Job(import_address_book_job, book, path),
+                       self.on_address_book_imported, "خطا در ورود دفترچه آدرس")
+    
+    def on_address_book_imported(self, result, timings):
+        QMessageBox.information(
+            self, "موفقیت",
+            f"{result['added']} گیرنده جدید، {result['updated']} تکراری\n"
+            f"دفترچه آدرس: {result['entries']} گیرنده\n\n{format_timings(timings)}"
+        )
+    
+    def export_address_book(self):
+        path, _ = QFileDialog.getSaveFileName(
+            self, "خروجی دفترچه آدرس", "address_book.csv",
+            "CSV files (*.csv);;JSON Lines (*.jsonl)"
+        )
+        book = self.address_book() if path else None
+        if not book:
+            return
+        
+        self.start_job(Job(export_address_book_job, book, path),
+                       lambda count, timings: QMessageBox.information(
+                           self, "موفقیت", f"{count} گیرنده در {path} ذخیره شد"),
+                       "خطا در خروجی دفترچه آدرس")
+    
+    def create_live_preview(self, layout):
+        preview_group = QGroupBox("🔍 پیش‌نمایش زنده")
+        preview_layout = QVBoxLayout(preview_group)
+        
+        self.live_preview_label = QLabel()
+        self.live_preview_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.live_preview_label.setFixedSize(*LIVE_PREVIEW_SIZE)
+        preview_layout.addWidget(self.live_preview_label)
+        
+        layout.addWidget(preview_group)
+    
     def create_control_buttons(self, layout):
         button_frame = QFrame()
         button_layout = QHBoxLayout(button_frame)
@@ -447,10 +768,14 @@ class AddressLabelWidget(QWidget):
         buttons = [
             ("🔍 پیش‌نمایش برچسب", "#3498db", self.preview_label),
             ("🏷️ تولید برچسب", "#27ae60", self.generate_label),
+            ("📦 برچسب گروهی", "#d35400", self.generate_batch),
+            ("📄 برگه A4", "#16a085", self.generate_sheet),
             ("🗑️ پاک کردن فیلدها", "#e74c3c", self.clear_fields),
             ("💾 ذخیره به فایل", "#8e44ad", self.save_to_file)
         ]
         
+        self.action_buttons = []
+        
         for button_text, color, callback in buttons:
             btn = QPushButton(button_text)
             btn.setMinimumHeight(50)
@@ -474,6 +799,18 @@ class AddressLabelWidget(QWidget):
             """)
             btn.clicked.connect(callback)
             button_layout.addWidget(btn)
+            self.action_buttons.append(btn)
+        
+        self.vector_pdf_checkbox = QCheckBox("PDF برداری (کم‌حجم)")
+        self.vector_pdf_checkbox.setChecked(True)
+        button_layout.addWidget(self.vector_pdf_checkbox)
+        
+        self.thermal_checkbox = QCheckBox("تک‌رنگ ۱ بیتی (چاپگر حرارتی)")
+        button_layout.addWidget(self.thermal_checkbox)
+        
+        # Reprints come from the render cache unless this is checked
+        self.no_cache_checkbox = QCheckBox("بدون کش (رندر دوباره)")
+        button_layout.addWidget(self.no_cache_checkbox)
         
         layout.addWidget(button_frame)
     
@@ -560,46 +897,138 @@ class AddressLabelWidget(QWidget):
         
         return True
     
+    def set_busy(self, busy):
+        for btn in self.action_buttons:
+            btn.setEnabled(not busy)
+    
+    def pdf_backend(self):
+        return "vector" if self.vector_pdf_checkbox.isChecked() else "raster"
+    
+    def output_mode(self):
+        return "mono" if self.thermal_checkbox.isChecked() else "rgb"
+    
+    def use_cache(self):
+        return not self.no_cache_checkbox.isChecked()
+    
+    def start_job(self, job, on_finished, error_prefix):
+        job.signals.done.connect(lambda: show_trace_summary(self, job.trace))
+        job.signals.finished.connect(lambda result: on_finished(result, job.timings))
+        job.signals.failed.connect(
+            lambda message: QMessageBox.critical(self, "خطا", f"{error_prefix}:\n{message}"))
+        self.jobs.start(job)
+    
     def preview_label(self):
         if not self.validate_fields():
             return
         
-        try:
-            receiver_info = self.get_receiver_info()
-            img = self.create_address_label(self.sender_info, receiver_info, "preview_label.png")
-            
-            img.show()
-            QMessageBox.information(self, "موفقیت", "پیش‌نمایش برچسب نمایش داده شد!")
-            
-        except Exception as e:
-            QMessageBox.critical(self, "خطا", f"خطا در ایجاد پیش‌نمایش:\n{str(e)}")
+        self.preview_timer.stop()
+        self.live_image = None
+        self.refresh_live_preview()
+    
+    def refresh_live_preview(self):
+        """Redraw the preview pane; after the first render only the receiver region"""
+        receiver_info = self.get_receiver_info()
+        
+        with trace_run("live_preview") as trace:
+            try:
+                self.update_live_image(receiver_info)
+            except Exception as e:
+                self.live_image = None
+                self.live_preview_label.setText(f"خطا در ایجاد پیش‌نمایش:\n{str(e)}")
+                return
+        show_trace_summary(self, trace)
+        
+        self.live_preview_label.setPixmap(self.live_pixmap.scaled(
+            self.live_preview_label.size(), Qt.AspectRatioMode.KeepAspectRatio,
+            Qt.TransformationMode.SmoothTransformation))
+    
+    def update_live_image(self, receiver_info):
+        """Render the label in full, or redraw only its receiver region"""
+        if self.live_image is None or self.live_sender_info != self.sender_info:
+            self.live_image = render_address_label(self.sender_info, receiver_info)
+            self.live_sender_info = list(self.sender_info)
+            self.live_pixmap = pil_to_qpixmap(self.live_image)
+        else:
+            box = redraw_receiver_fields(self.live_image, self.sender_info, receiver_info)
+            painter = QPainter(self.live_pixmap)
+            painter.drawPixmap(box[0], box[1], pil_to_qpixmap(self.live_image.crop(box)))
+            painter.end()
     
     def generate_label(self):
         if not self.validate_fields():
             return
         
-        try:
-            filename, _ = QFileDialog.getSaveFileName(
-                self, "ذخیره برچسب", "", "PNG files (*.png);;PDF files (*.pdf);;All files (*.*)"
-            )
-            
-            if not filename:
-                return
-            
-            receiver_info = self.get_receiver_info()
-            img = self.create_address_label(self.sender_info, receiver_info, filename)
-            
-            if filename.endswith('.png'):
-                pdf_filename = filename.replace('.png', '.pdf')
-                img.save(pdf_filename, "PDF", resolution=300.0)
-                success_msg = f"برچسب با موفقیت ذخیره شد!\n\nفایل‌های ایجاد شده:\n- {filename}\n- {pdf_filename}"
-                QMessageBox.information(self, "موفقیت", success_msg)
-            else:
-                success_msg = f"برچسب با موفقیت در {filename} ذخیره شد!"
-                QMessageBox.information(self, "موفقیت", success_msg)
-            
-        except Exception as e:
-            QMessageBox.critical(self, "خطا", f"خطا در تولید برچسب:\n{str(e)}")
+        filename, _ = QFileDialog.getSaveFileName(
+            self, "ذخیره برچسب", "",
+            "PNG files (*.png);;TIFF files (*.tif);;PDF files (*.pdf);;All files (*.*)"
+        )
+        
+        if not filename:
+            return
+        
+        receiver_info = self.get_receiver_info()
+        self.start_job(Job(generate_label_job, self.sender_info, receiver_info, filename,
+                           self.pdf_backend(), self.output_mode(), self.use_cache()),
+                       lambda files, timings: self.on_label_generated(files, timings, receiver_info),
+                       "خطا در تولید برچسب")
+    
+    def on_label_generated(self, files, timings, receiver_info=None):
+        if receiver_info:
+            self.remember_receiver(receiver_info)
+        
+        if len(files) > 1:
+            success_msg = f"برچسب با موفقیت ذخیره شد!\n\nفایل‌های ایجاد شده:\n- {files[0]}\n- {files[1]}"
+        else:
+            success_msg = f"برچسب با موفقیت در {files[0]} ذخیره شد!"
+        QMessageBox.information(self, "موفقیت", f"{success_msg}\n\n{format_timings(timings)}")
+    
+    def generate_batch(self):
+        receivers_path, _ = QFileDialog.getOpenFileName(
+            self, "فایل گیرندگان", "", "Receivers (*.csv *.jsonl);;All files (*.*)"
+        )
+        if not receivers_path:
+            return
+        
+        output_dir = QFileDialog.getExistingDirectory(self, "پوشه خروجی")
+        if not output_dir:
+            return
+        
+        self.start_job(Job(batch_labels_job, self.sender_info, receivers_path, output_dir,
+                           self.pdf_backend(), self.output_mode(), self.use_cache()),
+                       self.on_batch_finished, "خطا در تولید برچسب‌ها")
+    
+    def on_batch_finished(self, summary, timings):
+        message = (f"{summary['succeeded']} از {summary['total']} برچسب ساخته شد "
+                   f"({summary['labels_per_second']:.1f} برچسب در ثانیه)")
+        if summary["cache"]["render_hits"]:
+            message += f"\n{summary['cache']['render_hits']} فایل از کش برداشته شد"
+        if summary["errors"]:
+            message += "\n\n" + "\n".join(f"{label_id}: {error}"
+                                            for label_id, error in summary["errors"][:10])
+        QMessageBox.information(self, "موفقیت", message)
+    
+    def generate_sheet(self):
+        receivers_path, _ = QFileDialog.getOpenFileName(
+            self, "فایل گیرندگان", "", "Receivers (*.csv *.jsonl);;All files (*.*)"
+        )
+        if not receivers_path:
+            return
+        
+        pdf_filename, _ = QFileDialog.getSaveFileName(
+            self, "ذخیره برگه برچسب", "labels_sheet.pdf", "PDF files (*.pdf)"
+        )
+        if not pdf_filename:
+            return
+        
+        self.start_job(Job(sheet_labels_job, self.sender_info, receivers_path, pdf_filename),
+                       self.on_sheet_finished, "خطا در ساخت برگه برچسب")
+    
+    def on_sheet_finished(self, summary, timings):
+        QMessageBox.information(
+            self, "موفقیت",
+            f"{summary['labels']} برچسب در {summary['pages']} صفحه ({summary['per_page']} در هر صفحه) "
+            f"در {summary['file']} ذخیره شد\n\n{format_timings(timings)}"
+        )
     
     def clear_fields(self):
         reply = QMessageBox.question(
@@ -631,231 +1060,25 @@ class AddressLabelWidget(QWidget):
                 f.write(f"کدپستی: {receiver_info[2]}\n")
                 f.write(f"تلفن: {receiver_info[3]}\n")
             
+            self.remember_receiver(receiver_info)
+            
             QMessageBox.information(self, "موفقیت", f"اطلاعات در {filename} ذخیره شد!")
             
         except Exception as e:
             QMessageBox.critical(self, "خطا", f"خطا در ذخیره فایل:\n{str(e)}")
     
     def wrap_text(self, draw, text, font, max_width):
-        words = text.split()
-        lines = []
-        current_line = ""
-        
-        for word in words:
-            test_line = current_line + (" " if current_line else "") + word
-            bbox = draw.textbbox((0, 0), test_line, font=font)
-            text_width = bbox[2] - bbox[0]
-            
-            if text_width <= max_width:
-                current_line = test_line
-            else:
-                if current_line:
-                    lines.append(current_line)
-                    current_line = word
-                else:
-                    lines.append(word)
-        
-        if current_line:
-            lines.append(current_line)
-        
-        return lines
+        return wrap_text(draw, text, font, max_width)
     
     def create_address_label(self, sender_info, receiver_info, output_filename="address_label.png"):
-        persian_font = debug_fonts()
-        
-        width = 945
-        height = 591
-        
-        white = 255
-        black = 0
-        gray = 100
-        light_gray = 220
-        dark_gray = 60
-        
-        img = Image.new('L', (width, height), white)
-        draw = ImageDraw.Draw(img)
-        
-        font_loaded = False
-        try:
-            if persian_font and os.path.exists(persian_font):
-                font_title = ImageFont.truetype(persian_font, 42)
-                font_label = ImageFont.truetype(persian_font, 30)
-                font_main = ImageFont.truetype(persian_font, 35)
-                font_info = ImageFont.truetype(persian_font, 36)
-                font_website = ImageFont.truetype(persian_font, 24)
-                font_phone = ImageFont.truetype(persian_font, 22)
-                font_tiny = ImageFont.truetype(persian_font, 18)
-                
-                font_loaded = True
-            else:
-                raise Exception("No Persian font found")
-                
-        except Exception:
-            font_title = ImageFont.load_default()
-            font_label = ImageFont.load_default() 
-            font_main = ImageFont.load_default()
-            font_info = ImageFont.load_default()
-            font_website = ImageFont.load_default()
-            font_phone = ImageFont.load_default()
-            font_tiny = ImageFont.load_default()
-        
-        # Main border
-        draw.rounded_rectangle([(10, 10), (width-10, height-10)], radius=20, outline=black, width=4)
-        
-        # Header
-        header_height = 75
-        
-        draw.rounded_rectangle([(10, 10), (width-10, header_height)], radius=20, fill=light_gray, outline=None)
-        draw.rectangle([(10, header_height-20), (width-10, header_height)], fill=light_gray, outline=None)
-        draw.line([(10, header_height), (width-10, header_height)], fill=black, width=3)
-        
-        title_text = fix_persian_text("برچسب پستی")
-        bbox = draw.textbbox((0, 0), title_text, font=font_title)
-        text_width = bbox[2] - bbox[0]
-        text_height = bbox[3] - bbox[1]
-        x = (width - text_width) // 2
-        y = (header_height - text_height) // 2 - 5
-        draw.text((x, y), title_text, black, font=font_title)
-        
-        # Sender section
-        section1_start = header_height + 20
-        
-        label_width = 140
-        label_height = 50
-        label_x = 50
-        label_y = section1_start
-        
-        draw.rounded_rectangle([(label_x+3, label_y+3), (label_x + label_width+3, label_y + label_height+3)], 
-                              radius=10, fill=gray, outline=None)
-        draw.rounded_rectangle([(label_x, label_y), (label_x + label_width, label_y + label_height)], 
-                              radius=10, fill=dark_gray, outline=black, width=2)
-        
-        sender_label_text = fix_persian_text("فرستنده")
-        bbox = draw.textbbox((0, 0), sender_label_text, font=font_label)
-        text_width = bbox[2] - bbox[0]
-        text_height = bbox[3] - bbox[1]
-        x_label = label_x + (label_width - text_width) // 2
-        y_label = label_y + (label_height - text_height) // 2 - 3
-        draw.text((x_label, y_label), sender_label_text, white, font=font_label)
-        
-        right_margin = 60
-        info_y = section1_start + 5
-        max_text_width = width - right_margin - 220
-        
-        text = fix_persian_text(f"نام: {sender_info[0]}")
-        bbox = draw.textbbox((0, 0), text, font=font_main)
-        text_width = bbox[2] - bbox[0]
-        draw.text((width - right_margin - text_width, info_y), text, black, font=font_main)
-        info_y += 35
-        
-        text = fix_persian_text(f"آدرس: {sender_info[1]}")
-        bbox = draw.textbbox((0, 0), text, font=font_info)
-        text_width = bbox[2] - bbox[0]
-        draw.text((width - right_margin - text_width, info_y), text, black, font=font_info)
-        info_y += 35
-        
-        text = fix_persian_text(f"کدپستی: {sender_info[2]}  |  تلفن: {sender_info[3]}")
-        bbox = draw.textbbox((0, 0), text, font=font_info)
-        text_width = bbox[2] - bbox[0]
-        draw.text((width - right_margin - text_width, info_y), text, black, font=font_info)
-        
-        # Separator
-        middle_y = section1_start + 140
-        for x in range(30, width-30, 15):
-            draw.ellipse([(x, middle_y-2), (x+8, middle_y+2)], fill=gray)
-        
-        # Receiver section
-        section2_start = middle_y + 20
-        label_y = section2_start
-        
-        draw.rounded_rectangle([(label_x+3, label_y+3), (label_x + label_width+3, label_y + label_height+3)], 
-                              radius=10, fill=gray, outline=None)
-        draw.rounded_rectangle([(label_x, label_y), (label_x + label_width, label_y + label_height)], 
-                              radius=10, fill=dark_gray, outline=black, width=2)
-        
-        receiver_label_text = fix_persian_text("گیرنده")
-        bbox = draw.textbbox((0, 0), receiver_label_text, font=font_label)
-        text_width = bbox[2] - bbox[0]
-        text_height = bbox[3] - bbox[1]
-        x_label = label_x + (label_width - text_width) // 2
-        y_label = label_y + (label_height - text_height) // 2 - 3
-        draw.text((x_label, y_label), receiver_label_text, white, font=font_label)
-        
-        info_y = section2_start + 5
-        
-        text = fix_persian_text(f"نام: {receiver_info[0]}")
-        bbox = draw.textbbox((0, 0), text, font=font_main)
-        text_width = bbox[2] - bbox[0]
-        draw.text((width - right_margin - text_width, info_y), text, black, font=font_main)
-        info_y += 35
-        
-        address_prefix = fix_persian_text("آدرس: ")
-        address_text = fix_persian_text(receiver_info[1])
-        full_address = address_prefix + address_text
-        
-        bbox = draw.textbbox((0, 0), full_address, font=font_info)
-        text_width = bbox[2] - bbox[0]
-        
-        if text_width <= max_text_width:
-            draw.text((width - right_margin - text_width, info_y), full_address, black, font=font_info)
-            info_y += 35
-        else:
-            wrapped_lines = self.wrap_text(draw, full_address, font_info, max_text_width)
-            for line in wrapped_lines:
-                fixed_line = fix_persian_text(line)
-                bbox = draw.textbbox((0, 0), fixed_line, font=font_info)
-                text_width = bbox[2] - bbox[0]
-                draw.text((width - right_margin - text_width, info_y), fixed_line, black, font=font_info)
-                info_y += 35
-        
-        text = fix_persian_text(f"کدپستی: {receiver_info[2]}  |  تلفن: {receiver_info[3]}")
-        bbox = draw.textbbox((0, 0), text, font=font_info)
-        text_width = bbox[2] - bbox[0]
-        draw.text((width - right_margin - text_width, info_y), text, black, font=font_info)
-        
-        # Footer
-        footer_y = height - 85
-        
-        draw.rounded_rectangle([(10, footer_y), (width-10, height-10)], radius=20, fill=light_gray, outline=None)
-        draw.rectangle([(10, footer_y), (width-10, footer_y+20)], fill=light_gray, outline=None)
-        draw.line([(10, footer_y), (width-10, footer_y)], fill=black, width=3)
-        
-        first_line_y = footer_y + 15
-        
-        website_text = "NokhbehSho.com"
-        phone_text = "021-91091722"
-        separator = " | "
-        
-        bbox_website = draw.textbbox((0, 0), website_text, font=font_website)
-        website_width = bbox_website[2] - bbox_website[0]
-        
-        bbox_sep = draw.textbbox((0, 0), separator, font=font_website)
-        sep_width = bbox_sep[2] - bbox_sep[0]
-        
-        bbox_phone = draw.textbbox((0, 0), phone_text, font=font_phone)
-        phone_width = bbox_phone[2] - bbox_phone[0]
-        
-        total_width = website_width + sep_width + phone_width
-        start_x = (width - total_width) // 2
-        
-        draw.text((start_x, first_line_y), website_text, black, font=font_website)
-        draw.text((start_x + website_width, first_line_y), separator, dark_gray, font=font_website)
-        draw.text((start_x + website_width + sep_width, first_line_y + 2), phone_text, black, font=font_phone)
-        
-        desc_text = fix_persian_text("مرجع تخصصی آموزش رباتیک و هوش مصنوعی کودکان و نوجوانان")
-        bbox = draw.textbbox((0, 0), desc_text, font=font_tiny)
-        text_width = bbox[2] - bbox[0]
-        x = (width - text_width) // 2
-        draw.text((x, footer_y + 45), desc_text, dark_gray, font=font_tiny)
-        
-        img = img.convert('RGB')
-        img.save(output_filename, dpi=(300, 300), quality=100)
-        
-        return img
+        return create_address_label(sender_info, receiver_info, output_filename)
 
 class MainApp(QMainWindow):
+    warmed_up = pyqtSignal()
+    
     def __init__(self):
         super().__init__()
+        self.warm_up = None
         self.init_ui()
     
     def init_ui(self):
@@ -869,20 +1092,63 @@ class MainApp(QMainWindow):
         
         tab_widget = QTabWidget()
         
-        address_widget = AddressLabelWidget()
-        tab_widget.addTab(address_widget, "🏷️ Address Labels")
+        self.address_widget = AddressLabelWidget()
+        tab_widget.addTab(self.address_widget, "🏷️ Address Labels")
         
-        cropper_widget = ImageCropperWidget()
-        tab_widget.addTab(cropper_widget, "✂️ Image Cropper")
+        # Built on first switch to the tab
+        self.cropper_tab = LazyTab(ImageCropperWidget)
+        tab_widget.addTab(self.cropper_tab, "✂️ Image Cropper")
         
         main_layout.addWidget(tab_widget)
+    
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.warm_up is None:
+            # Let the first frame paint before starting
+            QTimer.singleShot(0, self.start_warm_up)
+    
+    def start_warm_up(self):
+        if self.warm_up is not None:
+            return
+        
+        self.warm_up = Job(warm_up_job, list(self.address_widget.sender_info))
+        self.warm_up.signals.finished.connect(self.on_warmed_up)
+        self.warm_up.signals.failed.connect(lambda message: self.on_warmed_up(None))
+        QThreadPool.globalInstance().start(self.warm_up)
+    
+    def on_warmed_up(self, timings):
+        if STARTUP_PROFILE:
+            startup_profile.mark("fonts warm")
+        self.address_widget.refresh_live_preview()
+        self.warmed_up.emit()
+
+def profile_startup(app, window):
+    """Report startup timings and quit once the window is painted and warm"""
+    pending = {"paint", "warm"}
+    
+    def finished(step):
+        pending.discard(step)
+        if not pending:
+            startup_profile.mark("live preview")
+            startup_profile.report()
+            app.quit()
+    
+    startup_profile.watch_first_paint(app, lambda: finished("paint"))
+    window.warmed_up.connect(lambda: finished("warm"))
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] in CLI_COMMANDS:
+        sys.exit(run_cli_command(sys.argv[1], sys.argv[2:]))
+    
     if not PYQT_AVAILABLE:
         print("❌ PyQt6 در دسترس نیست. لطفاً نصب کنید:")
         print("pip install PyQt6")
         return
     
+    if STARTUP_PROFILE:
+        startup_profile.mark("imports done")
+        sys.argv.remove("--startup-profile")
+    
     try:
         app = QApplication(sys.argv)
         
@@ -894,6 +1160,9 @@ def main():
         app.setLayoutDirection(Qt.LayoutDirection.RightToLeft)
         
         window = MainApp()
+        if STARTUP_PROFILE:
+            startup_profile.mark("window built")
+            profile_startup(app, window)
         window.show()
         
         sys.exit(app.exec())
@@ -904,4 +1173,7 @@ def main():
         traceback.print_exc()
 
 if __name__ == "__main__":
+    # Needed for process pools inside the frozen PyInstaller EXE
+    import multiprocessing
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -27,6 +27,25 @@ a = Analysis(
         'arabic_reshaper',
         'bidi.algorithm',
         'bidi',
+        'label_renderer',
+        'label_batch',
+        'benchmarks',
+        # Imported lazily inside functions
+        'label_pdf',
+        'image_cropper',
+        'font_registry',
+        'persian_text',
+        'startup_profile',
+        'instrumentation',
+        'printer_raster',
+        'lazy_image',
+        'render_cache',
+        'label_sheet',
+        'label_server',
+        'crop_batch',
+        'label_stream',
+        'address_book',
+        'hot_folder',
     ],
     hookspath=[],
     hooksconfig={},
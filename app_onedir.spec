@@ -0,0 +1,95 @@
+# -*- mode: python ; coding: utf-8 -*-
+# One-folder build of the same app as app.spec, for startup comparisons.
+#
+# The onefile EXE unpacks everything to a temp directory on every launch;
+# this variant starts straight from dist/ImageTools/. Compare with:
+#     pyinstaller app_onedir.spec
+#     dist\ImageTools\ImageTools.exe --startup-profile
+
+block_cipher = None
+
+a = Analysis(
+    ['app.py'],
+    pathex=[],
+    binaries=[],
+    datas=[
+        ('Vazir-Bold.ttf', 'fonts'),
+        ('Vazir-Medium.ttf', 'fonts'),
+        ('Vazir-Regular.ttf', 'fonts'),
+        ('Vazir-Black.ttf', 'fonts'),
+        ('Vazir-Light.ttf', 'fonts'),
+        ('Vazir-Thin.ttf', 'fonts'),
+        ('Vazir-Variable.ttf', 'fonts'),
+    ],
+    hiddenimports=[
+        'PyQt6.QtCore',
+        'PyQt6.QtGui', 
+        'PyQt6.QtWidgets',
+        'PIL.Image',
+        'PIL.ImageDraw', 
+        'PIL.ImageFont',
+        'reportlab.pdfgen.canvas',
+        'reportlab.lib.units',
+        'arabic_reshaper',
+        'bidi.algorithm',
+        'bidi',
+        'label_renderer',
+        'label_batch',
+        'benchmarks',
+        # Imported lazily inside functions
+        'label_pdf',
+        'image_cropper',
+        'font_registry',
+        'persian_text',
+        'startup_profile',
+        'instrumentation',
+        'printer_raster',
+        'lazy_image',
+        'render_cache',
+        'label_sheet',
+        'label_server',
+        'crop_batch',
+        'label_stream',
+        'address_book',
+        'hot_folder',
+    ],
+    hookspath=[],
+    hooksconfig={},
+    runtime_hooks=[],
+    excludes=['tkinter', 'matplotlib', 'numpy', 'scipy'],
+    win_no_prefer_redirects=False,
+    win_private_assemblies=False,
+    cipher=block_cipher,
+    noarchive=False,
+)
+
+pyz = PYZ(a.pure, a.zipped_data, cipher=block_cipher)
+
+exe = EXE(
+    pyz,
+    a.scripts,
+    [],
+    exclude_binaries=True,
+    name='ImageTools',
+    debug=False,
+    bootloader_ignore_signals=False,
+    strip=False,
+    upx=False,
+    console=False,
+    disable_windowed_traceback=False,
+    argv_emulation=False,
+    target_arch=None,
+    codesign_identity=None,
+    entitlements_file=None,
+)
+
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.zipfiles,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='ImageTools',
+)
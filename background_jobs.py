@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Run slow work (decode, render, encode) off the Qt UI thread.
+
+A Job wraps a plain function and runs it on QThreadPool. The function gets
+the job as its first argument and uses it to time stages, report progress
+and check for cancellation:
+
+    def work(job, path):
+        with job.stage("decode"):
+            img = Image.open(path)
+            img.load()
+        job.report(50, "decoded")
+        ...
+        return img
+
+    job = Job(work, path)
+    job.signals.finished.connect(on_done)
+    runner.start(job)
+
+Signals are emitted from the worker thread and delivered on the UI thread,
+so slots may touch widgets. Results must not contain QPixmaps (build those
+in the slot).
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from PyQt6.QtWidgets import QHBoxLayout, QLabel, QProgressBar, QPushButton, QWidget
+
+from instrumentation import trace_run
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when cancel() was requested"""
+
+
+class JobSignals(QObject):
+    progress = pyqtSignal(int, str)         # percent, message
+    stage_finished = pyqtSignal(str, float)  # stage name, seconds
+    finished = pyqtSignal(object)           # return value of the job function
+    failed = pyqtSignal(str)                # error message
+    cancelled = pyqtSignal()
+    done = pyqtSignal()                     # always emitted last
+
+
+class Job(QRunnable):
+    def __init__(self, fn, *args, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = JobSignals()
+        self.timings = {}
+        # TraceRun with the fine-grained stages when IMAGETOOLS_TRACE is set
+        self.trace = None
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def check_cancelled(self):
+        if self._cancel_event.is_set():
+            raise JobCancelled()
+
+    def report(self, percent, message=""):
+        self.check_cancelled()
+        self.signals.progress.emit(int(percent), message)
+
+    @contextmanager
+    def stage(self, name):
+        """Time a stage and check for cancellation before and after it"""
+        self.check_cancelled()
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+        self.timings[name] = self.timings.get(name, 0.0) + elapsed
+        self.signals.stage_finished.emit(name, elapsed)
+        self.check_cancelled()
+
+    def run(self):
+        try:
+            with trace_run(self.fn.__name__) as trace:
+                self.trace = trace
+                result = self.fn(self, *self.args, **self.kwargs)
+        except JobCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(result)
+        finally:
+            self.signals.done.emit()
+
+
+class JobRunner(QObject):
+    """Starts jobs on the global QThreadPool and tracks the ones in flight"""
+
+    busy_changed = pyqtSignal(bool)
+    progress = pyqtSignal(int, str)
+    stage_finished = pyqtSignal(str, float)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool.globalInstance()
+        self.active_jobs = []
+
+    def start(self, job):
+        # Keep a reference until the job is done so its signals stay alive
+        self.active_jobs.append(job)
+        job.signals.progress.connect(self.progress)
+        job.signals.stage_finished.connect(self.stage_finished)
+        job.signals.done.connect(lambda: self._job_done(job))
+        if len(self.active_jobs) == 1:
+            self.busy_changed.emit(True)
+        self.pool.start(job)
+        return job
+
+    def _job_done(self, job):
+        if job in self.active_jobs:
+            self.active_jobs.remove(job)
+        if not self.active_jobs:
+            self.busy_changed.emit(False)
+
+    def is_busy(self):
+        return bool(self.active_jobs)
+
+    def cancel_all(self):
+        for job in self.active_jobs:
+            job.cancel()
+
+
+def format_timings(timings):
+    """'decode 120 ms, encode 45 ms' for a status bar"""
+    return ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in timings.items())
+
+
+class JobProgressWidget(QWidget):
+    """Progress bar, stage timings and a cancel button bound to a JobRunner"""
+
+    def __init__(self, runner, cancel_text="لغو", parent=None):
+        super().__init__(parent)
+        self.runner = runner
+
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        self.message_label = QLabel("")
+        self.cancel_button = QPushButton(cancel_text)
+        self.cancel_button.clicked.connect(runner.cancel_all)
+
+        layout.addWidget(self.progress_bar, 1)
+        layout.addWidget(self.message_label)
+        layout.addWidget(self.cancel_button)
+
+        runner.progress.connect(self.on_progress)
+        runner.stage_finished.connect(self.on_stage_finished)
+        runner.busy_changed.connect(self.on_busy_changed)
+        self.setVisible(False)
+
+    def on_progress(self, percent, message):
+        self.progress_bar.setValue(percent)
+        self.message_label.setText(message)
+
+    def on_stage_finished(self, name, seconds):
+        self.message_label.setText(f"{name}: {seconds * 1000:.0f} ms")
+
+    def on_busy_changed(self, busy):
+        if busy:
+            self.progress_bar.setValue(0)
+            self.message_label.setText("")
+        self.setVisible(busy)
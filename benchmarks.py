@@ -0,0 +1,556 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Headless benchmarks for label rendering, shaping, wrapping and cropping.
+
+Usage:
+    python benchmarks.py                      # run everything, write benchmark_results.json
+    python benchmarks.py --quick -k crop      # fewer iterations, only crop cases
+    python benchmarks.py --save-baseline      # store the results as the baseline
+    python app.py bench ...                   # same, through the app entry point
+
+Each case runs in a fresh process so its peak memory is its own. Results
+report ops/s, latency percentiles and peak RSS above the process baseline,
+and are compared against benchmarks_baseline.json when it exists; a p50
+slowdown beyond --threshold makes the run exit with status 1.
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+BASELINE_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 "benchmarks_baseline.json")
+RESULTS_FILENAME = "benchmark_results.json"
+FIXTURES_DIR = os.path.join(tempfile.gettempdir(), "imagetools-bench-fixtures")
+
+# A p50 (or peak memory) this much above the baseline counts as a regression
+DEFAULT_THRESHOLD = 0.15
+DEFAULT_MEMORY_THRESHOLD = 0.25
+# Memory deltas below this are noise
+MIN_MEMORY_MB = 5.0
+
+PERCENTILES = (50, 90, 99)
+
+# Fixtures
+RECEIVER_NAME = "زهرا محمدی"
+RECEIVER_POSTAL = "9187654321"
+RECEIVER_PHONE = "09151234567"
+SHORT_ADDRESS = "تهران، خیابان آزادی، پلاک ۱۲"
+LONG_ADDRESS = ("استان خراسان رضوی، شهرستان مشهد، بلوار وکیل‌آباد، بین وکیل‌آباد ۱۲ و ۱۴، "
+                "خیابان شهید صادقی، کوچه گلستان ۳، مجتمع مسکونی بهاران، بلوک ب، "
+                "طبقه چهارم، واحد ۱۷")
+ADDRESSES = {"short": SHORT_ADDRESS, "long": LONG_ADDRESS}
+IMAGE_MEGAPIXELS = (2, 12, 50)
+# Deflate TIFF scans for the lazy-crop cases: the same crop from a 4x
+# larger scan should cost the same memory
+SCAN_MEGAPIXELS = (40, 160)
+SCAN_TILE = 256
+SCAN_ROWS_PER_STRIP = 16
+
+
+# Timing and memory helpers
+
+def memory_counters():
+    """(current, peak) resident set size of this process in bytes.
+
+    Either value is None when the platform does not report it.
+    """
+    if sys.platform.startswith("linux"):
+        counters = {}
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    key, value = line.split(":", 1)
+                    counters[key] = int(value.split()[0]) * 1024
+        return counters.get("VmRSS"), counters.get("VmHWM")
+
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize, counters.PeakWorkingSetSize
+        return None, None
+
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    # macOS reports bytes
+    return None, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def reset_peak_rss():
+    """Restart the peak RSS counter at the current RSS where supported (Linux)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def percentile(sorted_values, pct):
+    """Linearly interpolated percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = (len(sorted_values) - 1) * pct / 100.0
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def summarize(latencies):
+    """ops/s and latency statistics (ms) for a list of per-op seconds"""
+    ordered = sorted(latencies)
+    total = sum(ordered)
+    stats = {
+        "iterations": len(ordered),
+        "ops_per_second": len(ordered) / total if total else 0.0,
+        "mean_ms": total / len(ordered) * 1000 if ordered else 0.0,
+        "min_ms": ordered[0] * 1000 if ordered else 0.0,
+        "max_ms": ordered[-1] * 1000 if ordered else 0.0,
+    }
+    for pct in PERCENTILES:
+        stats[f"p{pct}_ms"] = percentile(ordered, pct) * 1000
+    return stats
+
+
+# Fixtures
+
+def receiver_info(address):
+    return [RECEIVER_NAME, address, RECEIVER_POSTAL, RECEIVER_PHONE]
+
+
+def image_size(megapixels):
+    """3:2 photo dimensions for a megapixel count"""
+    width = int(math.sqrt(megapixels * 1_000_000 * 3 / 2))
+    return width, int(width * 2 / 3)
+
+
+def fixture_image(fixtures_dir, megapixels):
+    """Path of a synthetic JPEG photo, generated once and reused between runs"""
+    from PIL import Image
+
+    path = os.path.join(fixtures_dir, f"photo_{megapixels}mp.jpg")
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(fixtures_dir, exist_ok=True)
+    size = image_size(megapixels)
+    gradient = Image.linear_gradient("L").resize(size)
+    noise = Image.effect_noise(size, 48)
+    photo = Image.merge("RGB", (gradient, noise, Image.blend(gradient, noise, 0.5)))
+    photo.save(path + ".tmp", format="JPEG", quality=90)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def fixture_scan(fixtures_dir, megapixels, tiled):
+    """Path of a synthetic deflate-compressed scan (tiled or striped TIFF).
+
+    Written block by block from a small pool of compressed blocks, so even
+    the largest fixture is generated without holding it in memory.
+    """
+    import zlib
+    from PIL import Image, TiffTags
+    from lazy_image import tiff_header
+
+    layout = "tiled" if tiled else "striped"
+    path = os.path.join(fixtures_dir, f"scan_{megapixels}mp_{layout}.tif")
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(fixtures_dir, exist_ok=True)
+    width, height = image_size(megapixels)
+    # Whole blocks only, so every block holds the same number of pixels
+    if tiled:
+        width = width // SCAN_TILE * SCAN_TILE
+        block = (SCAN_TILE, SCAN_TILE)
+    else:
+        block = (width, SCAN_ROWS_PER_STRIP)
+    height = height // block[1] * block[1]
+
+    pool = []
+    for seed in range(7):
+        gradient = Image.linear_gradient("L").resize(block).rotate(seed * 45)
+        noise = Image.effect_noise(block, 24)
+        pool.append(zlib.compress(Image.merge("RGB", (gradient, noise, gradient)).tobytes(), 6))
+
+    count = (width // block[0]) * (height // block[1])
+    blocks = [pool[index % len(pool)] for index in range(count)]
+    tags = {
+        258: ((8, 8, 8), TiffTags.SHORT),   # BitsPerSample
+        259: (8, TiffTags.SHORT),           # Compression: deflate
+        262: (2, TiffTags.SHORT),           # PhotometricInterpretation: RGB
+        277: (3, TiffTags.SHORT),           # SamplesPerPixel
+        284: (1, TiffTags.SHORT),           # PlanarConfiguration: contiguous
+    }
+
+    with open(path + ".tmp", "wb") as f:
+        f.write(tiff_header(tags, (width, height), block, tiled, [len(data) for data in blocks]))
+        for data in blocks:
+            f.write(data)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+# Cases: setup(fixtures_dir, workdir) returns (op, reset); reset runs
+# untimed before every op (e.g. to measure a cold cache)
+
+def shaping_case(text, cold):
+    def setup(fixtures_dir, workdir):
+        from persian_text import clear_shaping_cache, fix_persian_text
+        return (lambda: fix_persian_text(text)), (clear_shaping_cache if cold else None)
+    return setup
+
+
+def wrap_case(address, cold):
+    def setup(fixtures_dir, workdir):
+        from font_registry import get_label_fonts
+        from label_renderer import (LABEL_HEIGHT, LABEL_WIDTH, label_layout,
+                                    shaped_text_width, wrap_text)
+        from persian_text import clear_shaping_cache
+
+        font = get_label_fonts()["info"]
+        max_width = label_layout(LABEL_WIDTH, LABEL_HEIGHT)["max_text_width"]
+        text = "آدرس: " + address
+
+        def reset():
+            shaped_text_width.cache_clear()
+            clear_shaping_cache()
+
+        return (lambda: wrap_text(None, text, font, max_width)), (reset if cold else None)
+    return setup
+
+
+def label_case(address):
+    def setup(fixtures_dir, workdir):
+        from label_renderer import DEFAULT_SENDER_INFO, create_address_label
+
+        path = os.path.join(workdir, "label.png")
+        receiver = receiver_info(address)
+        return (lambda: create_address_label(DEFAULT_SENDER_INFO, receiver, path)), None
+    return setup
+
+
+def crop_case(megapixels, dpi):
+    def setup(fixtures_dir, workdir):
+        from PIL import Image
+        from image_cropper import crop_image, save_crop_outputs
+
+        path = fixture_image(fixtures_dir, megapixels)
+
+        # Same steps as the cropper tab: decode, convert, crop, encode PNG + PDF
+        def op():
+            with Image.open(path) as image:
+                image.load()
+                if image.mode != 'RGB':
+                    image = image.convert('RGB')
+                cropped = crop_image(image, dpi)
+            save_crop_outputs(cropped, workdir, "bench")
+
+        return op, None
+    return setup
+
+
+def scan_crop_case(megapixels, tiled, dpi):
+    def setup(fixtures_dir, workdir):
+        from image_cropper import crop_file, save_crop_outputs
+
+        path = fixture_scan(fixtures_dir, megapixels, tiled)
+
+        # The cropper tab's path for files: decode only the crop, then encode
+        def op():
+            save_crop_outputs(crop_file(path, dpi), workdir, "bench")
+
+        return op, None
+    return setup
+
+
+# Passport and printer outputs for the multi-target cases, from a 600 DPI source
+CROP_TARGETS = "34, 34:pdf, 30x40@300:jpeg, 35x45@300:jpeg, 35x45@600:tiff, 34@203"
+
+
+def crop_targets_case(megapixels, shared):
+    def setup(fixtures_dir, workdir):
+        from image_cropper import (crop_box, crop_file_targets, mm_to_pixels, parse_crop_targets,
+                                   save_crop_targets)
+        from lazy_image import LazyImage
+
+        path = fixture_image(fixtures_dir, megapixels)
+        targets = parse_crop_targets(CROP_TARGETS)
+
+        def op():
+            crop_file_targets(path, 600, targets, workdir, "bench")
+
+        # Baseline: decode and resample the full-size region once per target
+        def op_per_target():
+            images = []
+            for width_mm, height_mm, dpi, _ in targets:
+                image = LazyImage(path)
+                region_px = (mm_to_pixels(width_mm, 600), mm_to_pixels(height_mm, 600))
+                size = (mm_to_pixels(width_mm, dpi), mm_to_pixels(height_mm, dpi)) if dpi else region_px
+                images.append(image.resize(size, box=crop_box(image.size, region_px)[0]))
+            save_crop_targets(images, targets, workdir, "bench")
+
+        return (op if shared else op_per_target), None
+    return setup
+
+
+def stream_case(count, fmt):
+    def setup(fixtures_dir, workdir):
+        from label_stream import stream_labels
+
+        path = os.path.join(workdir, "run." + fmt)
+
+        # Every label differs (postal code), like a real run; peak memory
+        # should not grow with count
+        def receivers():
+            for index in range(count):
+                yield str(index), [RECEIVER_NAME, SHORT_ADDRESS, f"{index:010d}", RECEIVER_PHONE]
+
+        return (lambda: stream_labels(receivers(), path, fmt=fmt, output_mode="mono")), None
+    return setup
+
+
+# name: (setup, iterations, warm-up ops, fixture(fixtures_dir) to generate
+# before timing, or None)
+CASES = {}
+for _kind, _address in ADDRESSES.items():
+    CASES[f"shaping/{_kind}/cold"] = (shaping_case(_address, True), 500, 5, None)
+    CASES[f"shaping/{_kind}/warm"] = (shaping_case(_address, False), 5000, 50, None)
+for _kind, _address in ADDRESSES.items():
+    CASES[f"wrap/{_kind}/cold"] = (wrap_case(_address, True), 300, 5, None)
+    CASES[f"wrap/{_kind}/warm"] = (wrap_case(_address, False), 3000, 50, None)
+for _kind, _address in ADDRESSES.items():
+    CASES[f"label/{_kind}"] = (label_case(_address), 30, 2, None)
+for _mp, _iterations in zip(IMAGE_MEGAPIXELS, (10, 5, 3)):
+    CASES[f"crop/{_mp}mp/300dpi"] = (crop_case(_mp, 300), _iterations, 1,
+                                     lambda fixtures_dir, mp=_mp: fixture_image(fixtures_dir, mp))
+# 34 mm at 1200 DPI is larger than a 2 MP photo, so this takes the upscale path
+CASES["crop/2mp/1200dpi"] = (crop_case(2, 1200), 5, 1,
+                             lambda fixtures_dir: fixture_image(fixtures_dir, 2))
+for _mp in SCAN_MEGAPIXELS:
+    for _tiled in (True, False):
+        _layout = "tiled" if _tiled else "striped"
+        CASES[f"crop/scan-{_layout}/{_mp}mp/600dpi"] = (
+            scan_crop_case(_mp, _tiled, 600), 10, 1,
+            lambda fixtures_dir, mp=_mp, tiled=_tiled: fixture_scan(fixtures_dir, mp, tiled))
+for _shared in (True, False):
+    CASES[f"crop/targets/12mp/{'pyramid' if _shared else 'per-target'}"] = (
+        crop_targets_case(12, _shared), 5, 1, lambda fixtures_dir: fixture_image(fixtures_dir, 12))
+for _fmt in ("pdf", "tiff"):
+    for _count, _iterations in ((100, 3), (1000, 1)):
+        CASES[f"stream/{_fmt}-mono/{_count}"] = (stream_case(_count, _fmt), _iterations, 0, None)
+
+
+def run_case(name, fixtures_dir, iterations, warmup):
+    """Run one case in the current process and return its statistics"""
+    setup = CASES[name][0]
+
+    with tempfile.TemporaryDirectory(prefix="imagetools-bench-") as workdir:
+        op, reset = setup(fixtures_dir, workdir)
+        reset_peak_rss()
+        rss_before, peak_before = memory_counters()
+        rss_before = rss_before if rss_before is not None else peak_before
+
+        for _ in range(warmup):
+            if reset:
+                reset()
+            op()
+
+        latencies = []
+        for _ in range(iterations):
+            if reset:
+                reset()
+            start = time.perf_counter()
+            op()
+            latencies.append(time.perf_counter() - start)
+
+        _, rss_peak = memory_counters()
+
+    stats = summarize(latencies)
+    stats["peak_rss_mb"] = rss_peak / 2**20 if rss_peak is not None else None
+    stats["peak_mb_above_baseline"] = (max(rss_peak - rss_before, 0) / 2**20
+                                       if None not in (rss_peak, rss_before) else None)
+    return stats
+
+
+def run_isolated(name, fixtures_dir, iterations, warmup):
+    """Run a case in a fresh spawned process"""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(run_case, name, fixtures_dir, iterations, warmup).result()
+
+
+def select_cases(patterns):
+    if not patterns:
+        return list(CASES)
+    return [name for name in CASES if any(pattern in name for pattern in patterns)]
+
+
+def run_benchmarks(names, fixtures_dir=FIXTURES_DIR, scale=1.0, isolated=True, progress=None):
+    """Run the named cases and return a results dict ready for JSON"""
+    from PIL import __version__ as pillow_version
+
+    # Generate image fixtures up front so their cost is not measured
+    for name in names:
+        fixture = CASES[name][3]
+        if fixture:
+            fixture(fixtures_dir)
+
+    cases = {}
+    for name in names:
+        _, iterations, warmup, _ = CASES[name]
+        iterations = max(2, int(iterations * scale))
+        runner = run_isolated if isolated else run_case
+        cases[name] = runner(name, fixtures_dir, iterations, warmup)
+        if progress:
+            progress(name, cases[name])
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "pillow": pillow_version,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "scale": scale,
+        "cases": cases,
+    }
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD,
+            memory_threshold=DEFAULT_MEMORY_THRESHOLD):
+    """Return (rows, regressions) comparing results with a baseline.
+
+    rows are (case, metric, baseline, current, relative change) for every
+    case present in both; regressions is the subset over the thresholds.
+    """
+    rows = []
+    regressions = []
+
+    for name, current in results["cases"].items():
+        base = baseline.get("cases", {}).get(name)
+        if not base:
+            continue
+
+        if base.get("p50_ms"):
+            change = current["p50_ms"] / base["p50_ms"] - 1
+            row = (name, "p50_ms", base["p50_ms"], current["p50_ms"], change)
+            rows.append(row)
+            if change > threshold:
+                regressions.append(row)
+
+        base_mb = base.get("peak_mb_above_baseline")
+        current_mb = current.get("peak_mb_above_baseline")
+        if base_mb is not None and current_mb is not None and max(base_mb, current_mb) >= MIN_MEMORY_MB:
+            change = current_mb / max(base_mb, MIN_MEMORY_MB) - 1
+            row = (name, "peak_mb", base_mb, current_mb, change)
+            rows.append(row)
+            if change > memory_threshold:
+                regressions.append(row)
+
+    return rows, regressions
+
+
+# CLI
+
+def print_case(name, stats):
+    memory = stats["peak_mb_above_baseline"]
+    memory_text = f"{memory:7.1f} MB" if memory is not None else "      n/a"
+    print(f"   {name:<32} {stats['ops_per_second']:10.1f} ops/s  "
+          f"p50 {stats['p50_ms']:8.2f}  p90 {stats['p90_ms']:8.2f}  "
+          f"p99 {stats['p99_ms']:8.2f} ms  peak +{memory_text}")
+
+
+def print_comparison(rows, regressions, baseline_path):
+    print(f"📊 Compared with {baseline_path}")
+    for name, metric, base, current, change in rows:
+        marker = "❌" if (name, metric, base, current, change) in regressions else "  "
+        print(f" {marker} {name:<32} {metric:<8} {base:10.2f} → {current:10.2f}  ({change:+.0%})")
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s) over the threshold")
+    else:
+        print("✅ No regressions")
+
+
+def build_parser(parser=None):
+    parser = parser or argparse.ArgumentParser(description="Benchmark label and cropper code paths")
+    parser.add_argument("-k", "--filter", action="append", default=[],
+                        help="Only run cases whose name contains this (repeatable)")
+    parser.add_argument("--list", action="store_true", help="List case names and exit")
+    parser.add_argument("--quick", action="store_true", help="Run a fifth of the iterations")
+    parser.add_argument("-o", "--output", default=RESULTS_FILENAME, help="Results JSON file")
+    parser.add_argument("--baseline", default=BASELINE_FILENAME, help="Baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Write the results to the baseline file as well")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed relative p50 slowdown (default: 0.15)")
+    parser.add_argument("--memory-threshold", type=float, default=DEFAULT_MEMORY_THRESHOLD,
+                        help="Allowed relative peak memory growth (default: 0.25)")
+    parser.add_argument("--fixtures-dir", default=FIXTURES_DIR,
+                        help="Where generated fixture images are kept")
+    parser.add_argument("--in-process", action="store_true",
+                        help="Run cases in this process (faster, memory figures overlap)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    names = select_cases(args.filter)
+    if args.list:
+        print("\n".join(names))
+        return 0
+    if not names:
+        print(f"❌ No benchmark matches {args.filter}")
+        return 1
+
+    print(f"⏱️ Running {len(names)} benchmark(s)")
+    results = run_benchmarks(names, args.fixtures_dir, scale=0.2 if args.quick else 1.0,
+                             isolated=not args.in_process, progress=print_case)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Saved {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"✅ Saved baseline {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"ℹ️ No baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    rows, regressions = compare(results, baseline, args.threshold, args.memory_threshold)
+    print_comparison(rows, regressions, args.baseline)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Crop whole folders of photos to 34mm x 34mm over a process pool.
+
+Usage:
+    python crop_batch.py photos/ -o crops --dpi 300
+    python crop_batch.py "intake/*.jpg" -o crops --pdf intake.pdf --workers 4
+    python app.py crop photos/ -o crops --pdf all.pdf
+    python app.py crop photos/ -o crops --dpi 600 -t 30x40@300:jpeg -t 35x45@600:tiff
+
+Sources are folders (every image inside, --recursive for subfolders),
+glob patterns or single files. Each image produces <name>_34mm.png in the
+output directory; a file that can't be read or cropped is reported and
+skipped without stopping the run. --pdf also writes every crop as one page
+of a single PDF, in source order. With --target options each image instead
+produces one file per (size, DPI, format) target, all cut from a single
+decode (see image_cropper.crop_targets).
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from reportlab.lib.units import mm
+from reportlab.pdfgen import canvas
+
+from image_cropper import (CROP_SIZE_MM, crop_file, crop_file_targets, parse_crop_targets,
+                           save_crop_png)
+from instrumentation import trace_stage
+
+# Extensions picked up from folders; explicit files and globs are taken as given
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".jfif", ".bmp", ".gif", ".tif", ".tiff", ".webp")
+
+
+def find_images(sources, recursive=False):
+    """Image paths from folders, glob patterns and files, sorted and without duplicates"""
+    found = []
+    for source in sources:
+        if os.path.isdir(source):
+            if recursive:
+                paths = [os.path.join(root, name)
+                         for root, _, names in os.walk(source) for name in names]
+            else:
+                paths = [entry.path for entry in os.scandir(source) if entry.is_file()]
+            found += sorted(path for path in paths if path.lower().endswith(IMAGE_EXTENSIONS))
+        elif glob.has_magic(source):
+            found += sorted(path for path in glob.glob(source, recursive=recursive)
+                            if os.path.isfile(path))
+        else:
+            found.append(source)
+
+    seen = set()
+    return [path for path in found
+            if not (os.path.abspath(path) in seen or seen.add(os.path.abspath(path)))]
+
+
+def output_bases(paths):
+    """Output base name per path; repeated names (from different folders) get _2, _3...
+
+    Suffixed names skip every name already in the batch, so x.jpg, x.jpg
+    and x_2.jpg become x, x_3 and x_2.
+    """
+    names = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    taken = {name.lower() for name in names}
+    seen = set()
+    bases = []
+    for base in names:
+        if base.lower() in seen:
+            count = 2
+            while f"{base}_{count}".lower() in taken:
+                count += 1
+            base = f"{base}_{count}"
+            taken.add(base.lower())
+        seen.add(base.lower())
+        bases.append(base)
+    return bases
+
+
+def output_names(paths, size_mm=CROP_SIZE_MM):
+    """<name>_<size>mm.png per path (see output_bases)"""
+    return [f"{base}_{size_mm:g}mm.png" for base in output_bases(paths)]
+
+
+def crop_one(job):
+    """Crop one image and save its file(s). Runs in a worker; errors are returned, not raised."""
+    source, output_dir, base, dpi, size_mm, targets = job
+    start = time.perf_counter()
+    try:
+        if targets:
+            paths = crop_file_targets(source, dpi, targets, output_dir, base)
+        else:
+            paths = [save_crop_png(crop_file(source, dpi, size_mm),
+                                   os.path.join(output_dir, f"{base}_{size_mm:g}mm.png"))]
+        return source, paths, time.perf_counter() - start, None
+    except Exception as e:
+        return source, [], time.perf_counter() - start, f"{type(e).__name__}: {e}"
+
+
+def write_combined_pdf(image_paths, pdf_path, size_mm=CROP_SIZE_MM):
+    """One size_mm x size_mm page per image, in order"""
+    page = size_mm * mm
+    with trace_stage("encode_pdf", pages=len(image_paths)) as stage:
+        c = canvas.Canvas(pdf_path, pagesize=(page, page), pageCompression=1)
+        for path in image_paths:
+            c.drawImage(path, 0, 0, width=page, height=page)
+            c.showPage()
+        c.save()
+        stage.set(bytes=os.path.getsize(pdf_path))
+    return pdf_path
+
+
+def crop_batch(paths, output_dir, dpi=300, size_mm=CROP_SIZE_MM, workers=None, pdf_path=None,
+               progress=None, targets=None):
+    """Crop many images, spreading the work over a process pool.
+
+    workers=1 crops in-process. pdf_path, if given, also collects every
+    successful crop into one PDF. targets, a list of (width_mm, height_mm,
+    dpi, format) tuples, replaces the single size_mm PNG per image and
+    can't be combined with pdf_path. progress, if given, is called with
+    each (source, output_paths, seconds, error) result as it completes and
+    may raise to cancel the run. Returns a summary dict with counts,
+    timings and errors.
+    """
+    if targets and pdf_path:
+        raise ValueError("A combined PDF needs the default crop; add a :pdf target instead")
+
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = [(path, output_dir, base, dpi, size_mm, targets)
+            for path, base in zip(paths, output_bases(paths))]
+    workers = workers or os.cpu_count() or 1
+    workers = max(1, min(workers, len(jobs) or 1))
+
+    results = []
+    start = time.perf_counter()
+
+    if workers == 1:
+        for job in jobs:
+            result = crop_one(job)
+            results.append(result)
+            if progress:
+                progress(result)
+    else:
+        # Big scans vary a lot in cost, so hand them out a few at a time
+        chunksize = max(1, min(8, len(jobs) // (workers * 4)))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            try:
+                for result in pool.map(crop_one, jobs, chunksize=chunksize):
+                    results.append(result)
+                    if progress:
+                        progress(result)
+            except BaseException:
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+
+    files = [path for result in results if not result[3] for path in result[1]]
+    if pdf_path and files:
+        write_combined_pdf(files, pdf_path, size_mm)
+
+    elapsed = time.perf_counter() - start
+    errors = [(result[0], result[3]) for result in results if result[3]]
+    crop_times = [result[2] for result in results if not result[3]]
+
+    return {
+        "total": len(jobs),
+        "succeeded": len(results) - len(errors),
+        "failed": len(errors),
+        "errors": errors,
+        "workers": workers,
+        "elapsed": elapsed,
+        "images_per_second": (len(results) - len(errors)) / elapsed if elapsed > 0 else 0.0,
+        "mean_crop_ms": 1000 * sum(crop_times) / len(crop_times) if crop_times else 0.0,
+        "files": files,
+        "pdf": pdf_path if pdf_path and files else None,
+    }
+
+
+def print_summary(summary):
+    print(f"✅ Cropped {summary['succeeded']}/{summary['total']} images "
+          f"with {summary['workers']} worker(s) in {summary['elapsed']:.2f}s")
+    print(f"   Throughput: {summary['images_per_second']:.1f} images/s, "
+          f"mean {summary['mean_crop_ms']:.1f} ms per image")
+    if summary["pdf"]:
+        print(f"   Combined PDF: {summary['pdf']}")
+    for source, error in summary["errors"]:
+        print(f"❌ {source}: {error}")
+
+
+def build_parser(parser=None):
+    parser = parser or argparse.ArgumentParser(description="Crop folders of images to 34mm x 34mm")
+    parser.add_argument("sources", nargs="+", help="Folders, glob patterns or image files")
+    parser.add_argument("-o", "--output-dir", default="crops", help="Directory for the PNG files")
+    parser.add_argument("--dpi", type=float, default=300, help="Image DPI used to size the crop")
+    parser.add_argument("--size-mm", type=float, default=CROP_SIZE_MM)
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Worker processes (default: CPU count)")
+    parser.add_argument("--pdf", help="Also write all crops to this multi-page PDF")
+    parser.add_argument("-r", "--recursive", action="store_true",
+                        help="Include subfolders (and ** in glob patterns)")
+    parser.add_argument("-t", "--target", action="append",
+                        help="Output WxH[@DPI][:png|jpeg|tiff|pdf] in mm, repeatable "
+                             "(default: one <size-mm> PNG at the image DPI)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    targets = None
+    if args.target:
+        try:
+            targets = parse_crop_targets(",".join(args.target))
+        except ValueError as e:
+            print(f"❌ {e}")
+            return 1
+        if args.pdf:
+            print("❌ --pdf combines the default crops; add a :pdf target instead")
+            return 1
+
+    paths = find_images(args.sources, args.recursive)
+    if not paths:
+        print(f"❌ No images found in {', '.join(args.sources)}")
+        return 1
+
+    summary = crop_batch(paths, args.output_dir, args.dpi, args.size_mm, args.workers, args.pdf,
+                         targets=targets)
+    print_summary(summary)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Process-wide font registry.
+
+Resolves the Vazir font file once and keeps loaded FreeType faces in a
+bounded LRU cache keyed by (path, size), so rendering many labels does not
+probe the filesystem or reopen the TTF for every label.
+"""
+
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from PIL import ImageFont
+
+from instrumentation import trace_stage
+
+FONT_NAMES = ["Vazir-Bold.ttf", "Vazir-Medium.ttf", "Vazir-Regular.ttf", "Vazir.ttf"]
+
+# Sizes used by the address label layout
+LABEL_FONT_SIZES = {
+    "title": 42,
+    "label": 30,
+    "main": 35,
+    "info": 36,
+    "website": 24,
+    "phone": 22,
+    "tiny": 18,
+}
+
+MAX_CACHED_FACES = 32
+
+_lock = threading.Lock()
+_faces = OrderedDict()
+_resolved_path = None
+_path_resolved = False
+_generation = 0
+_digest = None
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "path_lookups": 0}
+
+
+def debug_fonts():
+    """Debug font paths and availability"""
+    if getattr(sys, 'frozen', False):
+        base_path = Path(sys._MEIPASS)
+        font_path = base_path / 'fonts'
+    else:
+        base_path = Path(__file__).parent
+        font_path = base_path
+
+    found_font = None
+
+    for font_name in FONT_NAMES:
+        font_file = font_path / font_name
+        if font_file.exists():
+            found_font = str(font_file)
+            break
+        else:
+            font_file = base_path / font_name
+            if font_file.exists():
+                found_font = str(font_file)
+                break
+
+    return found_font
+
+
+def get_font_path():
+    """Return the Persian font path, probing the filesystem only once"""
+    global _resolved_path, _path_resolved
+
+    if not _path_resolved:
+        with _lock:
+            if not _path_resolved:
+                _resolved_path = debug_fonts()
+                _path_resolved = True
+                _stats["path_lookups"] += 1
+
+    return _resolved_path
+
+
+def font_digest():
+    """SHA-256 of the resolved font file ("none" without one), for cache keys"""
+    global _digest
+
+    if _digest is None:
+        path = get_font_path()
+        if not path:
+            _digest = "none"
+        else:
+            with open(path, "rb") as f:
+                _digest = hashlib.sha256(f.read()).hexdigest()
+    return _digest
+
+
+def get_font(size, path=None):
+    """Return a cached FreeTypeFont for (path, size).
+
+    path defaults to the resolved Persian font. Falls back to PIL's default
+    font if no font file is available or it cannot be opened.
+    """
+    path = path or get_font_path()
+    key = (path, size)
+
+    with _lock:
+        font = _faces.get(key)
+        if font is not None:
+            _faces.move_to_end(key)
+            _stats["hits"] += 1
+            return font
+        _stats["misses"] += 1
+
+    with trace_stage("font_load", size=size):
+        try:
+            if not path:
+                raise OSError("No Persian font found")
+            font = ImageFont.truetype(path, size)
+        except Exception:
+            font = ImageFont.load_default()
+
+    with _lock:
+        _faces[key] = font
+        _faces.move_to_end(key)
+        while len(_faces) > MAX_CACHED_FACES:
+            _faces.popitem(last=False)
+            _stats["evictions"] += 1
+
+    return font
+
+
+def get_label_fonts():
+    """Return {role: font} for every size in the label layout"""
+    return {role: get_font(size) for role, size in LABEL_FONT_SIZES.items()}
+
+
+def warm_fonts(sizes=None):
+    """Resolve the font path and load the label faces ahead of time.
+
+    Meant to be used as a process pool initializer so each worker pays the
+    font loading cost once at startup.
+    """
+    for size in (sizes or LABEL_FONT_SIZES.values()):
+        get_font(size)
+
+
+def font_cache_stats():
+    """Return a copy of the cache counters plus the current cache size"""
+    with _lock:
+        stats = dict(_stats)
+        stats["cached_faces"] = len(_faces)
+    return stats
+
+
+def font_generation():
+    """Counter bumped by clear_font_cache(), for caches built from fonts"""
+    return _generation
+
+
+def clear_font_cache():
+    """Forget cached faces and the resolved path (e.g. after fonts change)"""
+    global _resolved_path, _path_resolved, _generation, _digest
+
+    with _lock:
+        _faces.clear()
+        _resolved_path = None
+        _path_resolved = False
+        _digest = None
+        _generation += 1
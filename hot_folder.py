@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Hot folders: labels and crops for files dropped into watched folders.
+
+Usage:
+    python app.py watch --orders inbox/orders --photos inbox/photos -o outbox
+    python app.py watch --orders inbox/orders -o outbox --workers 2 --poll 5
+    python app.py watch --photos scans -o outbox --once     # process what is there, then exit
+
+New or changed CSV/JSONL order files are rendered with label_batch into
+<output>/labels/<file name>/, and new or changed photos are cropped with
+crop_batch into <output>/crops/. A manifest of content hashes in the
+output directory records what has been done, so restarts, touched files
+and re-saved copies of the same content are skipped. Arrivals are
+collected until the folders have been quiet for --settle seconds (or
+--max-batch files are waiting) and then processed together, one batch at
+a time on at most --workers processes.
+
+Folders are watched with inotify on Linux and rescanned every --poll
+seconds elsewhere (or when --poll is given). Subfolders are not watched.
+The exit status is 1 if any file (or label) failed while it was running.
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import os
+import select
+import signal
+import struct
+import sys
+import time
+
+from crop_batch import IMAGE_EXTENSIONS, crop_batch
+from crop_batch import print_summary as print_crop_summary
+from image_cropper import CROP_SIZE_MM
+from label_batch import _normalize_record, read_receivers, render_batch
+from label_batch import print_summary as print_label_summary
+from label_pdf import PDF_BACKENDS
+from label_renderer import OUTPUT_MODES
+
+ORDER_EXTENSIONS = (".csv", ".jsonl", ".json", ".ndjson")
+MANIFEST_NAME = ".hot_folder_manifest.json"
+MANIFEST_VERSION = 1
+
+DEFAULT_SETTLE = 1.0
+DEFAULT_POLL = 2.0
+DEFAULT_MAX_BATCH = 200
+
+# Editors and downloads write these first and rename when done
+PARTIAL_SUFFIXES = (".tmp", ".part", ".crdownload", ".partial", "~")
+
+HASH_CHUNK = 1024 * 1024
+
+# inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def is_candidate(path):
+    name = os.path.basename(path)
+    return not (name.startswith(".") or name.lower().endswith(PARTIAL_SUFFIXES))
+
+
+def scan_folder(folder):
+    """Regular files directly inside folder"""
+    try:
+        return [entry.path for entry in os.scandir(folder)
+                if entry.is_file() and is_candidate(entry.path)]
+    except FileNotFoundError:
+        return []
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Manifest
+
+class Manifest:
+    """Content hashes already processed, plus a stat cache to avoid re-hashing.
+
+    Saved as JSON next to the outputs; written to a temporary file and
+    renamed so a crash never leaves it half-written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = {}     # digest -> {"source", "kind", "outputs", "error", "time"}
+        self.stats = {}    # source path -> [size, mtime_ns, digest]
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError:
+            print(f"⚠️ Ignoring unreadable manifest {path}")
+            return
+        if data.get("version") == MANIFEST_VERSION:
+            self.done = data.get("done", {})
+            self.stats = data.get("stats", {})
+
+    def digest(self, path):
+        """Content hash of path, re-reading the file only if its size or mtime changed"""
+        st = os.stat(path)
+        cached = self.stats.get(path)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        digest = file_digest(path)
+        self.stats[path] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+    def record(self, digest, source, kind, outputs, error=None):
+        """Mark content as handled. Failures are recorded too: a fixed file
+        has a different hash and is picked up again."""
+        self.done[digest] = {"source": source, "kind": kind, "outputs": outputs,
+                             "error": error, "time": time.time()}
+
+    def save(self):
+        # Forget the stat cache of files that were moved away or deleted
+        self.stats = {path: stat for path, stat in self.stats.items() if os.path.exists(path)}
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "done": self.done, "stats": self.stats},
+                      f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+# Watchers: wait(timeout) returns the paths that changed, possibly none
+
+class PollingWatcher:
+    """Rescan the folders and report files whose size or mtime changed"""
+
+    def __init__(self, folders, interval=DEFAULT_POLL):
+        self.folders = folders
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        for folder in self.folders:
+            for path in scan_folder(folder):
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                snapshot[path] = (st.st_size, st.st_mtime_ns)
+        return snapshot
+
+    def wait(self, timeout=None):
+        time.sleep(self.interval if timeout is None else min(self.interval, timeout))
+        snapshot = self._scan()
+        changed = [path for path, stat in snapshot.items() if self.snapshot.get(path) != stat]
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Files closed after writing or moved into the folders, via inotify(7)"""
+
+    def __init__(self, folders):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.folders = folders
+        self._watches = {}
+        for folder in folders:
+            wd = libc.inotify_add_watch(self._fd, os.fsencode(folder),
+                                        IN_CLOSE_WRITE | IN_MOVED_TO | IN_ONLYDIR)
+            if wd < 0:
+                self.close()
+                raise OSError(ctypes.get_errno(), f"Cannot watch {folder}")
+            self._watches[wd] = folder
+
+    def wait(self, timeout=None):
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        changed = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped: fall back to everything in the folders
+                return [path for folder in self.folders for path in scan_folder(folder)]
+            if wd in self._watches and name:
+                path = os.path.join(self._watches[wd], os.fsdecode(name))
+                if is_candidate(path):
+                    changed.append(path)
+        return changed
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def make_watcher(folders, poll=None):
+    """inotify where available unless poll (seconds) is given, else polling"""
+    if poll is None and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(folders)
+        except (OSError, AttributeError) as e:
+            print(f"ℹ️ inotify unavailable ({e}), polling every {DEFAULT_POLL:g}s")
+    return PollingWatcher(folders, poll or DEFAULT_POLL)
+
+
+# Processing
+
+class HotFolder:
+    def __init__(self, output_dir, orders_dir=None, photos_dir=None, workers=None,
+                 sender_info=None, pdf_backend="vector", output_mode="rgb",
+                 dpi=300, size_mm=CROP_SIZE_MM, log=print):
+        self.output_dir = output_dir
+        self.orders_dir = orders_dir and os.path.abspath(orders_dir)
+        self.photos_dir = photos_dir and os.path.abspath(photos_dir)
+        self.workers = workers
+        self.sender_info = sender_info
+        self.pdf_backend = pdf_backend
+        self.output_mode = output_mode
+        self.dpi = dpi
+        self.size_mm = size_mm
+        self.log = log
+        # Files (or labels within them) that failed since start-up
+        self.failed = 0
+        self.manifest = Manifest(os.path.join(output_dir, MANIFEST_NAME))
+
+    @property
+    def folders(self):
+        return [folder for folder in (self.orders_dir, self.photos_dir) if folder]
+
+    def kind(self, path):
+        folder = os.path.dirname(os.path.abspath(path))
+        ext = os.path.splitext(path)[1].lower()
+        if folder == self.orders_dir and ext in ORDER_EXTENSIONS:
+            return "orders"
+        if folder == self.photos_dir and ext in IMAGE_EXTENSIONS:
+            return "photo"
+        return None
+
+    def scan(self):
+        return [path for folder in self.folders for path in scan_folder(folder)]
+
+    def new_files(self, paths):
+        """(path, kind, digest) for paths not processed before in their current content"""
+        found = []
+        seen = set()
+        for path in paths:
+            path = os.path.abspath(path)
+            kind = self.kind(path)
+            if kind is None or path in seen:
+                continue
+            seen.add(path)
+            try:
+                digest = self.manifest.digest(path)
+            except OSError:
+                continue    # gone again, or not readable yet
+            if digest not in self.manifest.done and digest not in seen:
+                seen.add(digest)
+                found.append((path, kind, digest))
+        return found
+
+    def render_orders(self, path, digest):
+        try:
+            receivers = read_receivers(path)
+        except (OSError, ValueError, UnicodeDecodeError) as e:
+            self.log(f"❌ {path}: {e}")
+            self.failed += 1
+            self.manifest.record(digest, path, "orders", 0, f"{type(e).__name__}: {e}")
+            return
+        stem = os.path.splitext(os.path.basename(path))[0]
+        output_dir = os.path.join(self.output_dir, "labels", stem)
+        if receivers:
+            summary = render_batch(receivers, output_dir, workers=self.workers,
+                                   sender_info=self.sender_info, pdf_backend=self.pdf_backend,
+                                   output_mode=self.output_mode)
+            self.log(f"📄 {os.path.basename(path)} -> {output_dir}")
+            print_label_summary(summary)
+            self.failed += summary["failed"]
+            outputs = len(summary["files"])
+        else:
+            self.log(f"ℹ️ {path}: no receivers")
+            outputs = 0
+        self.manifest.record(digest, path, "orders", outputs)
+
+    def crop_photos(self, photos):
+        if not photos:
+            return
+
+        digests = {path: digest for path, digest in photos}
+        summary = crop_batch(list(digests), os.path.join(self.output_dir, "crops"), self.dpi,
+                             self.size_mm, self.workers)
+        print_crop_summary(summary)
+        errors = dict(summary["errors"])
+        self.failed += len(errors)
+        for path, digest in photos:
+            self.manifest.record(digest, path, "photo", 0 if path in errors else 1,
+                                 errors.get(path))
+
+    def process(self, paths):
+        """Handle one batch of changed paths; returns the number of files processed"""
+        files = self.new_files(paths)
+        if files:
+            self.log(f"📥 {len(files)} new file(s)")
+            for path, kind, digest in files:
+                if kind == "orders":
+                    self.render_orders(path, digest)
+            self.crop_photos([(path, digest) for path, kind, digest in files if kind == "photo"])
+        self.manifest.save()
+        return len(files)
+
+    def run(self, watcher, settle=DEFAULT_SETTLE, max_batch=DEFAULT_MAX_BATCH, once=False):
+        """Process what is already there, then every burst of changes until interrupted"""
+        pending = dict.fromkeys(self.scan(), 0.0)
+        while True:
+            if pending:
+                now = time.monotonic()
+                quiet = now - max(pending.values()) >= settle
+                if quiet or len(pending) >= max_batch:
+                    batch = sorted(pending, key=pending.get)[:max_batch]
+                    for path in batch:
+                        del pending[path]
+                    self.process(batch)
+                    continue
+            elif once:
+                return
+
+            if once:
+                changed = []
+            else:
+                changed = watcher.wait(settle if pending else None)
+            now = time.monotonic()
+            for path in changed:
+                pending[path] = now
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def build_parser(parser=None):
+    parser = parser or argparse.ArgumentParser(description="Turn files dropped into folders into "
+                                                           "labels and crops")
+    parser.add_argument("--orders", help="Folder of CSV/JSONL order files to render as labels")
+    parser.add_argument("--photos", help="Folder of photos to crop")
+    parser.add_argument("-o", "--output-dir", default="hot_folder_out",
+                        help="Where labels/, crops/ and the manifest go")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Processes per batch (default: CPU count)")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE,
+                        help="Quiet seconds before a burst of arrivals is processed")
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH,
+                        help="Process a burst early once this many files are waiting")
+    parser.add_argument("--poll", type=float, default=None,
+                        help="Rescan every N seconds instead of using inotify")
+    parser.add_argument("--once", action="store_true",
+                        help="Process the files already there and exit")
+    parser.add_argument("--pdf-backend", choices=PDF_BACKENDS, default="vector")
+    parser.add_argument("--mode", choices=OUTPUT_MODES, default="rgb",
+                        help="Label image encoding")
+    parser.add_argument("--sender", help="JSON file with a 4-item sender info list")
+    parser.add_argument("--dpi", type=float, default=300, help="Photo DPI used to size the crop")
+    parser.add_argument("--size-mm", type=float, default=CROP_SIZE_MM)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not (args.orders or args.photos):
+        parser.error("give --orders and/or --photos")
+
+    sender_info = None
+    if args.sender:
+        with open(args.sender, encoding='utf-8') as f:
+            sender_info = _normalize_record(json.load(f))
+
+    for folder in (args.orders, args.photos):
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+    hot_folder = HotFolder(args.output_dir, args.orders, args.photos, args.workers, sender_info,
+                           args.pdf_backend, args.mode, args.dpi, args.size_mm)
+    watcher = None if args.once else make_watcher(hot_folder.folders, args.poll)
+    if watcher:
+        how = "inotify" if isinstance(watcher, InotifyWatcher) else f"polling every {watcher.interval:g}s"
+        print(f"👀 Watching {', '.join(hot_folder.folders)} ({how}); Ctrl+C to stop")
+
+    # Stop the same way on SIGTERM (service managers) as on Ctrl+C
+    signal.signal(signal.SIGTERM, _interrupt)
+    try:
+        hot_folder.run(watcher, args.settle, args.max_batch, once=args.once)
+    except KeyboardInterrupt:
+        print("⏹️ Stopped")
+    finally:
+        hot_folder.manifest.save()
+        if watcher:
+            watcher.close()
+    return 1 if hot_folder.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
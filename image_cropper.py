@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Headless 34mm x 34mm image cropping.
+
+The crop is taken from the centre of the image at the chosen DPI. Images
+smaller than the target are enlarged first; only the region that ends up in
+the output is resampled, in a single resize(..., box=...) step.
+
+crop_file() works from the file through lazy_image, so a huge scan is
+never decoded (or converted to RGB) in full.
+
+crop_targets() cuts several outputs (passport sizes, printer DPIs, file
+formats) from one source: the region they cover is decoded once, reduced
+2x, 4x... as needed, and every output is resampled from the smallest
+reduction that still has enough pixels.
+"""
+
+import contextvars
+import math
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from PIL import Image
+from reportlab import rl_config
+from reportlab.pdfgen import canvas
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+
+from instrumentation import trace_stage
+from lazy_image import RESAMPLE_MARGIN, LazyImage
+
+CROP_SIZE_MM = 34
+
+# Crop targets are (width_mm, height_mm, dpi, format) tuples; dpi None
+# keeps the source pixels, like crop_image()
+CROP_FORMATS = {"png": ".png", "jpeg": ".jpg", "tiff": ".tif", "pdf": ".pdf"}
+DEFAULT_CROP_TARGETS = [(CROP_SIZE_MM, CROP_SIZE_MM, None, "png"),
+                        (CROP_SIZE_MM, CROP_SIZE_MM, None, "pdf")]
+JPEG_QUALITY = 95
+
+# A reduced level is used while it keeps at least this many times the
+# output's pixels per side, so the final LANCZOS pass still looks as good
+# as resampling the full-size region (PIL's reducing_gap)
+PYRAMID_GAP = 2.0
+
+_TARGET_RE = re.compile(r"(\d+(?:\.\d+)?)(?:\s*[x×]\s*(\d+(?:\.\d+)?))?\s*(?:mm)?"
+                        r"(?:\s*@\s*(\d+(?:\.\d+)?)\s*(?:dpi)?)?(?:\s*:\s*(\w+))?", re.IGNORECASE)
+_FORMAT_ALIASES = {"jpg": "jpeg", "tif": "tiff"}
+
+# ASCII85 makes binary image streams 25% bigger and is encoded in pure
+# Python; plain Flate is enough for crop PDFs written to disk. The switch
+# is process-wide in ReportLab, so it is only turned off while a crop PDF
+# is being written (several at once when variants are saved in parallel)
+_a85_lock = threading.Lock()
+_a85_users = 0
+_a85_saved = None
+
+# Images smaller than the target are enlarged 10% past the minimum
+UPSCALE_MARGIN = 1.1
+
+
+def mm_to_pixels(size_mm, dpi):
+    """Pixel length of size_mm at dpi"""
+    mm_to_inch = 1 / 25.4
+    return int(size_mm * mm_to_inch * dpi)
+
+
+def crop_box(source_size, size_px):
+    """Return (box, resample) for a centred size_px x size_px crop.
+
+    size_px may also be a (width, height) pair for a rectangular crop.
+
+    box is in source coordinates. When the source is large enough, box is
+    an integer pixel box and resample is False. Otherwise the source is
+    conceptually enlarged by UPSCALE_MARGIN past the minimum scale, the
+    centre is cropped from that, and box is the matching fractional region
+    of the source to resample.
+    """
+    original_width, original_height = source_size
+    width_px, height_px = size_px if isinstance(size_px, tuple) else (size_px, size_px)
+
+    left = (original_width - width_px) // 2
+    top = (original_height - height_px) // 2
+    right = left + width_px
+    bottom = top + height_px
+
+    if left >= 0 and top >= 0 and right <= original_width and bottom <= original_height:
+        return (left, top, right, bottom), False
+
+    scale_factor = max(
+        width_px / original_width,
+        height_px / original_height
+    )
+
+    new_width = int(original_width * scale_factor * UPSCALE_MARGIN)
+    new_height = int(original_height * scale_factor * UPSCALE_MARGIN)
+
+    left = (new_width - width_px) // 2
+    top = (new_height - height_px) // 2
+
+    # Map the crop in the enlarged image back to source coordinates
+    scale_x = new_width / original_width
+    scale_y = new_height / original_height
+    box = (left / scale_x, top / scale_y, (left + width_px) / scale_x, (top + height_px) / scale_y)
+
+    return box, True
+
+
+def crop_image(image, dpi, size_mm=CROP_SIZE_MM):
+    """Return the centred size_mm x size_mm crop of image at dpi.
+
+    image is a PIL image or a LazyImage (which decodes only the crop).
+    """
+    size_px = mm_to_pixels(size_mm, dpi)
+    box, resample = crop_box(image.size, size_px)
+
+    with trace_stage("crop", source_size=image.size, image_size=(size_px, size_px),
+                     resample=resample):
+        if not resample:
+            return image.crop(box)
+
+        return image.resize((size_px, size_px), Image.Resampling.LANCZOS, box=box)
+
+
+def crop_file(path, dpi, size_mm=CROP_SIZE_MM, memory_budget_mb=None):
+    """crop_image() straight from a file, decoding only the region it needs"""
+    return crop_image(LazyImage(path, memory_budget_mb), dpi, size_mm)
+
+
+@contextmanager
+def _without_a85():
+    """Turn off ReportLab's ASCII85 stream encoding until the last overlapping caller is done"""
+    global _a85_users, _a85_saved
+    with _a85_lock:
+        if not _a85_users:
+            _a85_saved = rl_config.useA85
+            rl_config.useA85 = 0
+        _a85_users += 1
+    try:
+        yield
+    finally:
+        with _a85_lock:
+            _a85_users -= 1
+            if not _a85_users:
+                rl_config.useA85 = _a85_saved
+
+
+def save_crop_pdf(image, pdf_path, size_mm=CROP_SIZE_MM, height_mm=None):
+    """Write image as a size_mm x size_mm (or x height_mm) single-page PDF, straight from memory"""
+    page_size = (size_mm * mm, (height_mm or size_mm) * mm)
+    with trace_stage("encode_pdf", image_size=image.size) as stage, _without_a85():
+        c = canvas.Canvas(pdf_path, pagesize=page_size)
+        c.drawImage(ImageReader(image), 0, 0, width=page_size[0], height=page_size[1])
+        c.save()
+        stage.set(bytes=os.path.getsize(pdf_path))
+    return pdf_path
+
+
+def save_crop_png(image, image_path):
+    """Write image as PNG and return the path"""
+    with trace_stage("encode_png", image_size=image.size) as stage:
+        image.save(image_path)
+        stage.set(bytes=os.path.getsize(image_path))
+    return image_path
+
+
+def save_crop_outputs(image, save_dir, base_name, size_mm=CROP_SIZE_MM):
+    """Write <base_name>_<size>mm.png and .pdf and return both paths.
+
+    The PNG is encoded on a worker thread while the PDF is built on the
+    calling thread; both encoders release the GIL while compressing.
+    """
+    image_path = os.path.join(save_dir, f"{base_name}_{size_mm}mm.png")
+    pdf_path = os.path.join(save_dir, f"{base_name}_{size_mm}mm.pdf")
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # Run in a copy of this context so traced stages reach the caller's run
+        png_future = executor.submit(contextvars.copy_context().run,
+                                     save_crop_png, image, image_path)
+        save_crop_pdf(image, pdf_path, size_mm)
+        png_future.result()
+
+    return image_path, pdf_path
+
+
+# Several outputs from one decode
+
+def parse_crop_targets(text):
+    """Targets from text like "34x34:pdf, 30x40@300, 35x45@600:jpeg".
+
+    Sizes are in mm (one number for a square), @dpi resamples to that
+    resolution and :format is png (the default), jpeg, tiff or pdf.
+    Raises ValueError for anything else.
+    """
+    targets = []
+    for part in text.split(","):
+        if not part.strip():
+            continue
+        match = _TARGET_RE.fullmatch(part.strip())
+        if not match:
+            raise ValueError(f"Bad crop target {part.strip()!r} (expected e.g. 35x45@300:jpeg)")
+        width, height, dpi, fmt = match.groups()
+        fmt = (fmt or "png").lower()
+        fmt = _FORMAT_ALIASES.get(fmt, fmt)
+        if fmt not in CROP_FORMATS:
+            raise ValueError(f"Unknown crop format {fmt!r} (use {', '.join(CROP_FORMATS)})")
+        targets.append((float(width), float(height or width), float(dpi) if dpi else None, fmt))
+    if not targets:
+        raise ValueError("No crop targets given")
+    return targets
+
+
+def crop_target_name(base_name, target):
+    """<base>_<w>mm[_<dpi>dpi].<ext>, or <base>_<w>x<h>mm... for rectangles"""
+    width_mm, height_mm, dpi, fmt = target
+    size = f"{width_mm:g}mm" if width_mm == height_mm else f"{width_mm:g}x{height_mm:g}mm"
+    resolution = f"_{dpi:g}dpi" if dpi else ""
+    return f"{base_name}_{size}{resolution}{CROP_FORMATS[fmt]}"
+
+
+class CropPyramid:
+    """A decoded source region plus its 2x, 4x... reductions, made on demand"""
+
+    def __init__(self, image, box):
+        self.origin = box[:2]
+        region = image.crop(box)
+        if region.mode not in ("RGB", "RGBA", "L"):
+            region = region.convert("RGB")
+        self.levels = {1: region}
+
+    def level(self, factor):
+        if factor not in self.levels:
+            smaller = self.level(factor // 2)
+            with trace_stage("reduce", image_size=smaller.size, factor=factor):
+                self.levels[factor] = smaller.reduce(2)
+        return self.levels[factor]
+
+    def crop(self, box, size):
+        """size pixels covering box (source coordinates), from the smallest good level"""
+        scale = min((box[2] - box[0]) / size[0], (box[3] - box[1]) / size[1])
+        factor = 1
+        while scale / (factor * 2) >= PYRAMID_GAP:
+            factor *= 2
+
+        left, top = self.origin
+        shifted = ((box[0] - left) / factor, (box[1] - top) / factor,
+                   (box[2] - left) / factor, (box[3] - top) / factor)
+        image = self.level(factor)
+        if factor == 1 and size == (box[2] - box[0], box[3] - box[1]) and \
+                all(float(value).is_integer() for value in shifted):
+            return image.crop(tuple(int(value) for value in shifted))
+        return image.resize(size, Image.Resampling.LANCZOS, box=shifted)
+
+
+def crop_targets(image, source_dpi, targets):
+    """The crop for every (width_mm, height_mm, dpi, format) target, from one decode.
+
+    image is a PIL image or a LazyImage. source_dpi sizes each crop in the
+    source, as in crop_image(); the crop is then resampled to the target's
+    dpi (None keeps the source pixels). Returns one image per target;
+    targets that differ only in format share it.
+    """
+    geometries = {}
+    for width_mm, height_mm, dpi, _ in targets:
+        key = (width_mm, height_mm, dpi)
+        if key not in geometries:
+            region_px = (mm_to_pixels(width_mm, source_dpi), mm_to_pixels(height_mm, source_dpi))
+            box, _ = crop_box(image.size, region_px)
+            size = (mm_to_pixels(width_mm, dpi), mm_to_pixels(height_mm, dpi)) if dpi else region_px
+            geometries[key] = (box, size)
+
+    # Decode the union of the boxes once, with room for the resampling filter
+    padded = [(box, 0 if size == (box[2] - box[0], box[3] - box[1]) else RESAMPLE_MARGIN)
+              for box, size in geometries.values()]
+    width, height = image.size
+    union = (max(0, min(math.floor(box[0]) - pad for box, pad in padded)),
+             max(0, min(math.floor(box[1]) - pad for box, pad in padded)),
+             min(width, max(math.ceil(box[2]) + pad for box, pad in padded)),
+             min(height, max(math.ceil(box[3]) + pad for box, pad in padded)))
+
+    with trace_stage("crop", source_size=image.size, targets=len(targets)) as stage:
+        pyramid = CropPyramid(image, union)
+        crops = {key: pyramid.crop(box, size) for key, (box, size) in geometries.items()}
+        stage.set(image_size=pyramid.levels[1].size, levels=len(pyramid.levels))
+    return [crops[target[:3]] for target in targets]
+
+
+def save_crop_target(image, path, target):
+    """Write one crop_targets() image in its target's format and return the path"""
+    width_mm, height_mm, dpi, fmt = target
+    if fmt == "pdf":
+        return save_crop_pdf(image, path, width_mm, height_mm)
+
+    options = {"dpi": (dpi, dpi)} if dpi else {}
+    if fmt == "jpeg":
+        options["quality"] = JPEG_QUALITY
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+    elif fmt == "tiff":
+        options["compression"] = "tiff_lzw"
+    with trace_stage(f"encode_{fmt}", image_size=image.size) as stage:
+        image.save(path, fmt.upper(), **options)
+        stage.set(bytes=os.path.getsize(path))
+    return path
+
+
+def save_crop_targets(images, targets, save_dir, base_name):
+    """Write every target's file (see crop_target_name) and return the paths in order.
+
+    The files are encoded on a thread pool; the encoders release the GIL
+    while compressing.
+    """
+    paths = [os.path.join(save_dir, crop_target_name(base_name, target)) for target in targets]
+    with ThreadPoolExecutor(max_workers=min(len(targets), os.cpu_count() or 1)) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, save_crop_target,
+                                   image, path, target)
+                   for image, path, target in zip(images, paths, targets)]
+        return [future.result() for future in futures]
+
+
+def crop_file_targets(path, dpi, targets, save_dir, base_name=None, memory_budget_mb=None):
+    """crop_targets() and save_crop_targets() for one image file; returns the paths"""
+    base_name = base_name or os.path.splitext(os.path.basename(path))[0]
+    images = crop_targets(LazyImage(path, memory_budget_mb), dpi, targets)
+    return save_crop_targets(images, targets, save_dir, base_name)
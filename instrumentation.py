@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Opt-in per-stage timing for the label and cropper pipelines.
+
+Set IMAGETOOLS_TRACE to turn it on:
+
+    IMAGETOOLS_TRACE=1              JSON lines on stderr
+    IMAGETOOLS_TRACE=trace.jsonl    JSON lines appended to a file
+
+Every stage produces one record with its name and duration and, where
+known, the bytes written and the image size:
+
+    {"stage": "encode_png", "ms": 18.4, "bytes": 45210, "image_size": [945, 591], ...}
+
+Stages can nest (font_load runs inside a template build on a cache miss),
+so per-stage totals may add up to more than the wall time.
+
+Library code wraps its stages in trace_stage(). When tracing is off that
+returns a shared no-op object, so a stage costs one function call.
+trace_run() groups the stages of one job (a label, a crop) so the GUI can
+show a per-stage summary.
+"""
+
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+ENV_VAR = "IMAGETOOLS_TRACE"
+
+_lock = threading.Lock()
+_sink = None        # callable(line), or None when tracing is off
+_totals = {}        # stage -> {"count", "ms", "bytes"}
+_current_run = contextvars.ContextVar("trace_run", default=None)
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **fields):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class TraceStage:
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.start = None
+
+    def set(self, **fields):
+        """Attach bytes=, image_size= or other fields to the record"""
+        self.fields.update(fields)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        ms = (time.perf_counter() - self.start) * 1000
+        if exc_type is not None:
+            self.fields["error"] = exc_type.__name__
+        _emit(self.name, ms, self.fields)
+        return False
+
+
+class TraceRun:
+    """Per-stage totals for one job; see trace_run()"""
+
+    def __init__(self, name):
+        self.name = name
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, ms, nbytes):
+        with self._lock:
+            _accumulate(self.totals, stage, ms, nbytes)
+
+    def summary(self):
+        with self._lock:
+            return format_summary(self.totals)
+
+
+def _accumulate(totals, stage, ms, nbytes):
+    entry = totals.setdefault(stage, {"count": 0, "ms": 0.0, "bytes": 0})
+    entry["count"] += 1
+    entry["ms"] += ms
+    entry["bytes"] += nbytes or 0
+
+
+def _emit(stage, ms, fields):
+    sink = _sink
+    if sink is None:
+        return
+
+    record = {"ts": round(time.time(), 3), "stage": stage, "ms": round(ms, 3)}
+    record.update(fields)
+
+    run = _current_run.get()
+    if run is not None:
+        record["run"] = run.name
+        run.add(stage, ms, fields.get("bytes"))
+
+    record["pid"] = os.getpid()
+    record["thread"] = threading.current_thread().name
+
+    with _lock:
+        _accumulate(_totals, stage, ms, fields.get("bytes"))
+        sink(json.dumps(record, ensure_ascii=False))
+
+
+def configure(target=None):
+    """Trace to target ("1"/"stderr" or a file path); None, "" or "0" turn tracing off"""
+    global _sink
+
+    if not target or target == "0":
+        _sink = None
+    elif target in ("1", "stderr"):
+        def write(line):
+            # Windowed PyInstaller builds have no stderr
+            if sys.stderr is not None:
+                sys.stderr.write(line + "\n")
+        _sink = write
+    else:
+        def write(line):
+            # Reopened per record so worker processes can share the file
+            with open(target, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        _sink = write
+
+
+def enabled():
+    return _sink is not None
+
+
+def trace_stage(name, **fields):
+    """Context manager timing one stage; use .set() to add bytes/image_size"""
+    if _sink is None:
+        return _NULL_STAGE
+    return TraceStage(name, fields)
+
+
+@contextmanager
+def trace_run(name):
+    """Collect the stages run inside the block (and in copied contexts) as a TraceRun.
+
+    Yields None when tracing is off.
+    """
+    if _sink is None:
+        yield None
+        return
+
+    run = TraceRun(name)
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        _current_run.reset(token)
+
+
+def stage_totals():
+    """Process-wide {stage: {"count", "ms", "bytes"}} since start or the last reset"""
+    with _lock:
+        return {stage: dict(entry) for stage, entry in _totals.items()}
+
+
+def reset_stage_totals():
+    with _lock:
+        _totals.clear()
+
+
+def format_summary(totals):
+    """'template 0.4 · shaping 1.2 · encode_png 18.0 ms · 45 KB written'"""
+    if not totals:
+        return ""
+    text = " · ".join(f"{stage} {entry['ms']:.1f}" for stage, entry in totals.items()) + " ms"
+    written = sum(entry["bytes"] for entry in totals.values())
+    if written:
+        text += f" · {written / 1024:.0f} KB written"
+    return text
+
+
+configure(os.environ.get(ENV_VAR))
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Headless batch label rendering over a process pool.
+
+Usage:
+    python label_batch.py receivers.csv -o labels --workers 4
+
+Receivers are read from CSV (columns name, address, postal, phone) or
+JSONL (one object per line with the same keys). Each receiver produces
+label_<id>.png (or .tif) and label_<id>.pdf in the output directory
+(ids that come out the same, like a repeated id, get _2, _3...);
+--mode mono writes 1-bit images for thermal printers. Labels rendered
+before are copied from the render cache (see render_cache) unless
+--no-cache is given.
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from font_registry import font_cache_stats, warm_fonts
+from label_pdf import PDF_BACKENDS, write_label_pdf
+from label_renderer import (DEFAULT_SENDER_INFO, OUTPUT_MODES, create_address_label,
+                            receiver_strings)
+from persian_text import fix_persian_texts, shaping_stats
+from render_cache import cache_counters, default_cache
+
+RECEIVER_FIELDS = ["name", "address", "postal", "phone"]
+
+# Label image file extension per --image-format
+IMAGE_EXTENSIONS = {"png": ".png", "tiff": ".tif"}
+
+# Accept the widget's field names as well as the short ones
+FIELD_ALIASES = {
+    "receiver_name": "name",
+    "receiver_address": "address",
+    "receiver_postal": "postal",
+    "receiver_phone": "phone",
+}
+
+
+def _normalize_record(record):
+    """Turn a dict or list record into a receiver_info list"""
+    if isinstance(record, (list, tuple)):
+        values = list(record) + [""] * len(RECEIVER_FIELDS)
+        return [str(v).strip() for v in values[:len(RECEIVER_FIELDS)]]
+
+    fields = {}
+    for key, value in record.items():
+        key = FIELD_ALIASES.get(key.strip(), key.strip())
+        fields[key] = "" if value is None else str(value).strip()
+    return [fields.get(name, "") for name in RECEIVER_FIELDS]
+
+
+def iter_receivers(path):
+    """Yield receivers from a CSV or JSONL file one at a time.
+
+    Yields (label_id, receiver_info) tuples. label_id comes from an optional
+    "id" column, otherwise the 1-based row number. The file is read as it
+    is consumed, so runs of any length use constant memory.
+    """
+    ext = os.path.splitext(path)[1].lower()
+
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if ext in ('.jsonl', '.json', '.ndjson'):
+            records = (json.loads(line) for line in f if line.strip())
+            records = ((record.get("id") if isinstance(record, dict) else None, record)
+                       for record in records)
+        else:
+            rows = csv.reader(f)
+            first = next(rows, None)
+            if first is None:
+                return
+
+            header = [FIELD_ALIASES.get(c.strip(), c.strip()) for c in first]
+            if "name" in header and "address" in header:
+                records = ((record.get("id"), record)
+                           for record in (dict(zip(header, row)) for row in rows
+                                          if any(cell.strip() for cell in row)))
+            else:
+                records = ((None, row) for row in itertools.chain([first], rows)
+                           if any(cell.strip() for cell in row))
+
+        for index, (label_id, record) in enumerate(records, start=1):
+            yield (str(label_id) if label_id else f"{index:05d}"), _normalize_record(record)
+
+
+def read_receivers(path):
+    """Read receivers from a CSV or JSONL file.
+
+    Returns a list of (label_id, receiver_info) tuples; see iter_receivers.
+    """
+    return list(iter_receivers(path))
+
+
+def label_basename(label_id):
+    """Predictable, filesystem-safe base name for a label"""
+    safe_id = re.sub(r'[^\w.-]+', '_', str(label_id)).strip('._') or "label"
+    return f"label_{safe_id}"
+
+
+def label_basenames(label_ids):
+    """label_basename per id; ids that map to the same name ("a/b" and "a_b", repeats) get _2, _3...
+
+    Suffixed names skip every name already in the run, as in
+    crop_batch.output_bases, so no label overwrites another's files.
+    """
+    names = [label_basename(label_id) for label_id in label_ids]
+    taken = {name.lower() for name in names}
+    seen = set()
+    bases = []
+    for base in names:
+        if base.lower() in seen:
+            count = 2
+            while f"{base}_{count}".lower() in taken:
+                count += 1
+            base = f"{base}_{count}"
+            taken.add(base.lower())
+        seen.add(base.lower())
+        bases.append(base)
+    return bases
+
+
+def repeated_strings(receivers):
+    """Strings that more than one receiver will shape (shared cities, streets...)"""
+    counts = Counter(text for _, info in receivers for text in receiver_strings(info))
+    return [text for text, count in counts.items() if count > 1]
+
+
+def warm_worker(shared_strings=()):
+    """Pool initializer: load fonts and shape the run's repeated strings once"""
+    warm_fonts()
+    fix_persian_texts(list(shared_strings))
+
+
+def _cache_snapshot():
+    return {"pid": os.getpid(), "shaping": shaping_stats(), "fonts": font_cache_stats(),
+            "render": cache_counters()}
+
+
+def render_one(job):
+    """Render a single label to PNG/TIFF (and optionally PDF). Runs in a worker."""
+    (label_id, basename, sender_info, receiver_info, output_dir, pdf_backend,
+     output_mode, dither, image_format, use_cache) = job
+    start = time.perf_counter()
+
+    try:
+        cache = default_cache() if use_cache else None
+        base = os.path.join(output_dir, basename)
+        image_path = base + IMAGE_EXTENSIONS[image_format]
+        img = create_address_label(sender_info, receiver_info, image_path,
+                                   output_mode=output_mode, dither=dither, cache=cache)
+        paths = [image_path]
+
+        if pdf_backend:
+            paths.append(write_label_pdf(sender_info, receiver_info, base + ".pdf",
+                                         backend=pdf_backend, img=img, output_mode=output_mode,
+                                         dither=dither, cache=cache))
+
+        return label_id, paths, time.perf_counter() - start, None, _cache_snapshot()
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        return label_id, [], time.perf_counter() - start, error, _cache_snapshot()
+
+
+def _merge_cache_stats(results):
+    """Sum the latest per-process cache counters reported by the workers"""
+    latest = {}
+    for result in results:
+        latest[result[4]["pid"]] = result[4]
+
+    totals = {"shaping_hits": 0, "shaping_misses": 0, "font_hits": 0, "font_misses": 0,
+              "render_hits": 0, "render_misses": 0}
+    for snapshot in latest.values():
+        totals["shaping_hits"] += snapshot["shaping"]["hits"]
+        totals["shaping_misses"] += snapshot["shaping"]["misses"]
+        totals["font_hits"] += snapshot["fonts"]["hits"]
+        totals["font_misses"] += snapshot["fonts"]["misses"]
+        totals["render_hits"] += snapshot["render"]["hits"]
+        totals["render_misses"] += snapshot["render"]["misses"]
+
+    lookups = totals["shaping_hits"] + totals["shaping_misses"]
+    totals["shaping_hit_rate"] = totals["shaping_hits"] / lookups if lookups else 0.0
+    return totals
+
+
+def render_batch(receivers, output_dir, workers=None, sender_info=None, pdf_backend="vector",
+                 progress=None, output_mode="rgb", dither=False, image_format="png",
+                 use_cache=True):
+    """Render many labels, spreading the work over a process pool.
+
+    receivers is a list of (label_id, receiver_info) as returned by
+    read_receivers. workers=1 renders in-process. pdf_backend is "vector",
+    "raster" or None to skip the PDF. output_mode and dither choose the
+    image encoding (see label_renderer.OUTPUT_MODES) and image_format is
+    "png" or "tiff"; raster PDFs embed the same image. use_cache=False
+    renders every label even if the render cache has it. progress, if given, is
+    called with each (label_id, paths, seconds, error, cache_stats) result as
+    it completes.
+    Returns a summary dict with counts, timings and errors.
+    """
+    sender_info = list(sender_info or DEFAULT_SENDER_INFO)
+    os.makedirs(output_dir, exist_ok=True)
+
+    if image_format not in IMAGE_EXTENSIONS:
+        raise ValueError(f"Unknown image format: {image_format}")
+
+    basenames = label_basenames(label_id for label_id, _ in receivers)
+    jobs = [(label_id, basename, sender_info, info, output_dir, pdf_backend, output_mode,
+             dither, image_format, use_cache)
+            for (label_id, info), basename in zip(receivers, basenames)]
+    workers = workers or os.cpu_count() or 1
+    workers = max(1, min(workers, len(jobs) or 1))
+
+    results = []
+    start = time.perf_counter()
+    shared_strings = repeated_strings(receivers)
+
+    if workers == 1:
+        warm_worker(shared_strings)
+        for job in jobs:
+            result = render_one(job)
+            results.append(result)
+            if progress:
+                progress(result)
+    else:
+        chunksize = max(1, len(jobs) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=warm_worker,
+                                 initargs=(shared_strings,)) as pool:
+            try:
+                for result in pool.map(render_one, jobs, chunksize=chunksize):
+                    results.append(result)
+                    if progress:
+                        progress(result)
+            except BaseException:
+                # progress may raise to cancel the run; drop queued labels
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+
+    elapsed = time.perf_counter() - start
+    errors = [(result[0], result[3]) for result in results if result[3]]
+    render_times = [result[2] for result in results if not result[3]]
+
+    return {
+        "total": len(jobs),
+        "succeeded": len(jobs) - len(errors),
+        "failed": len(errors),
+        "errors": errors,
+        "workers": workers,
+        "elapsed": elapsed,
+        "labels_per_second": (len(jobs) - len(errors)) / elapsed if elapsed > 0 else 0.0,
+        "mean_label_ms": 1000 * sum(render_times) / len(render_times) if render_times else 0.0,
+        "files": [path for result in results for path in result[1]],
+        "cache": _merge_cache_stats(results),
+    }
+
+
+def print_summary(summary):
+    print(f"✅ Rendered {summary['succeeded']}/{summary['total']} labels "
+          f"with {summary['workers']} worker(s) in {summary['elapsed']:.2f}s")
+    print(f"   Throughput: {summary['labels_per_second']:.1f} labels/s, "
+          f"mean {summary['mean_label_ms']:.1f} ms per label")
+    cache = summary["cache"]
+    print(f"   Shaping cache: {cache['shaping_hit_rate']:.0%} hit rate "
+          f"({cache['shaping_hits']} hits, {cache['shaping_misses']} misses), "
+          f"font cache: {cache['font_hits']} hits, {cache['font_misses']} misses")
+    if cache["render_hits"] or cache["render_misses"]:
+        print(f"   Render cache: {cache['render_hits']} files reused, "
+              f"{cache['render_misses']} rendered")
+    for label_id, error in summary["errors"]:
+        print(f"❌ {label_id}: {error}")
+
+
+def build_parser(parser=None):
+    parser = parser or argparse.ArgumentParser(description="Render address labels in batch")
+    parser.add_argument("receivers", help="CSV or JSONL file with receiver records")
+    parser.add_argument("-o", "--output-dir", default="labels", help="Directory for PNG/PDF files")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Worker processes (default: CPU count)")
+    parser.add_argument("--no-pdf", action="store_true", help="Only write PNG files")
+    parser.add_argument("--pdf-backend", choices=PDF_BACKENDS, default="vector",
+                        help="vector (small, embedded font) or raster (300 DPI bitmap)")
+    parser.add_argument("--mode", choices=OUTPUT_MODES, default="rgb",
+                        help="Image encoding: rgb, gray (8-bit) or mono (1-bit for thermal printers)")
+    parser.add_argument("--dither", action="store_true",
+                        help="Dither instead of threshold in mono mode")
+    parser.add_argument("--image-format", choices=sorted(IMAGE_EXTENSIONS), default="png",
+                        help="png, or tiff (CCITT G4 in mono mode)")
+    parser.add_argument("--sender", help="JSON file with a 4-item sender info list")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Render every label instead of reusing cached files")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    sender_info = None
+    if args.sender:
+        with open(args.sender, encoding='utf-8') as f:
+            sender_info = _normalize_record(json.load(f))
+
+    receivers = read_receivers(args.receivers)
+    if not receivers:
+        print(f"❌ No receivers found in {args.receivers}")
+        return 1
+
+    summary = render_batch(receivers, args.output_dir, workers=args.workers,
+                           sender_info=sender_info,
+                           pdf_backend=None if args.no_pdf else args.pdf_backend,
+                           output_mode=args.mode, dither=args.dither,
+                           image_format=args.image_format, use_cache=not args.no_cache)
+    print_summary(summary)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
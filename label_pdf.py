@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Vector PDF backend for address labels.
+
+Draws the same layout as label_renderer with ReportLab primitives instead of
+embedding a 300 DPI raster. Vazir is registered as a TrueType font, which
+ReportLab embeds as a subset containing only the glyphs used, so a label PDF
+is a few kilobytes.
+"""
+
+from reportlab.pdfgen import canvas
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+import os
+
+from font_registry import LABEL_FONT_SIZES, get_font_path, get_label_fonts
+from instrumentation import trace_stage
+from label_renderer import (BLACK, DARK_GRAY, GRAY, LABEL_DPI, LABEL_HEIGHT, LABEL_WIDTH,
+                            LIGHT_GRAY, WHITE, label_layout, receiver_strings,
+                            render_address_label, save_label_pdf, to_output_mode, wrap_text)
+from persian_text import fix_persian_text, fix_persian_texts
+
+# Label layout is expressed in 300 DPI pixels; PDF user space is in points
+PT_PER_PX = 72.0 / LABEL_DPI
+
+PDF_FONT_NAME = "Vazir"
+FALLBACK_FONT_NAME = "Helvetica"
+
+# "raster" embeds the 300 DPI bitmap like older versions did
+PDF_BACKENDS = ("vector", "raster")
+
+_registered_font = None
+
+
+def register_pdf_font():
+    """Register the Persian TTF with ReportLab once and return its font name"""
+    global _registered_font
+
+    if _registered_font is None:
+        path = get_font_path()
+        try:
+            if not path:
+                raise OSError("No Persian font found")
+            pdfmetrics.registerFont(TTFont(PDF_FONT_NAME, path))
+            _registered_font = PDF_FONT_NAME
+        except Exception:
+            _registered_font = FALLBACK_FONT_NAME
+
+    return _registered_font
+
+
+def label_page_size():
+    """Label size in points (80 x 50 mm for the default layout)"""
+    return LABEL_WIDTH * PT_PER_PX, LABEL_HEIGHT * PT_PER_PX
+
+
+class PdfPainter:
+    """Draws on a ReportLab canvas using the raster layout's pixel coordinates.
+
+    Coordinates are top-left based pixels like PIL's ImageDraw; they are
+    flipped and scaled to PDF points relative to the current canvas origin.
+    """
+
+    def __init__(self, c, width=LABEL_WIDTH, height=LABEL_HEIGHT):
+        self.c = c
+        self.width = width
+        self.height = height
+        self.font_name = register_pdf_font()
+        # PIL faces give the same ascent and ink boxes as the raster path
+        self.fonts = get_label_fonts()
+
+    def _x(self, x):
+        return x * PT_PER_PX
+
+    def _y(self, y):
+        return (self.height - y) * PT_PER_PX
+
+    def _set_fill(self, gray):
+        self.c.setFillGray(gray / 255.0)
+
+    def _set_stroke(self, gray, width):
+        self.c.setStrokeGray(gray / 255.0)
+        self.c.setLineWidth(width * PT_PER_PX)
+
+    def rounded_rectangle(self, box, radius, fill=None, outline=None, width=1):
+        (x0, y0), (x1, y1) = box
+        if outline is not None:
+            # PIL strokes inside the box; PDF strokes centred on the path
+            inset = width / 2.0
+            x0, y0, x1, y1 = x0 + inset, y0 + inset, x1 - inset, y1 - inset
+            radius = max(radius - inset, 0)
+            self._set_stroke(outline, width)
+        if fill is not None:
+            self._set_fill(fill)
+
+        self.c.roundRect(self._x(x0), self._y(y1), (x1 - x0) * PT_PER_PX, (y1 - y0) * PT_PER_PX,
+                         radius * PT_PER_PX, stroke=int(outline is not None),
+                         fill=int(fill is not None))
+
+    def rectangle(self, box, fill):
+        (x0, y0), (x1, y1) = box
+        self._set_fill(fill)
+        self.c.rect(self._x(x0), self._y(y1), (x1 - x0) * PT_PER_PX, (y1 - y0) * PT_PER_PX,
+                    stroke=0, fill=1)
+
+    def line(self, start, end, fill, width=1):
+        self._set_stroke(fill, width)
+        self.c.line(self._x(start[0]), self._y(start[1]), self._x(end[0]), self._y(end[1]))
+
+    def ellipse(self, box, fill):
+        (x0, y0), (x1, y1) = box
+        self._set_fill(fill)
+        self.c.ellipse(self._x(x0), self._y(y1), self._x(x1), self._y(y0), stroke=0, fill=1)
+
+    def text_width(self, text, role):
+        """Width in pixels of already-shaped text in a label font role"""
+        return pdfmetrics.stringWidth(text, self.font_name, LABEL_FONT_SIZES[role])
+
+    def text_height(self, text, role):
+        """Ink height in pixels, as ImageDraw.textbbox reports it"""
+        bbox = self.fonts[role].getbbox(text)
+        return bbox[3] - bbox[1]
+
+    def text(self, xy, text, fill, role):
+        """Draw shaped text with its top (ascender) at xy, like ImageDraw.text"""
+        x, y = xy
+        baseline = y + self.fonts[role].getmetrics()[0]
+        self._set_fill(fill)
+        self.c.setFont(self.font_name, LABEL_FONT_SIZES[role] * PT_PER_PX)
+        self.c.drawString(self._x(x), self._y(baseline), text)
+
+    def text_right(self, right, y, text, fill, role):
+        self.text((right - self.text_width(text, role), y), text, fill, role)
+
+    def text_centered(self, left, span, y, text, fill, role):
+        self.text((left + (span - self.text_width(text, role)) / 2.0, y), text, fill, role)
+
+
+def _draw_badge(painter, layout, label_y, text):
+    label_x = layout["label_x"]
+    label_width = layout["label_width"]
+    label_height = layout["label_height"]
+
+    painter.rounded_rectangle([(label_x+3, label_y+3), (label_x + label_width+3, label_y + label_height+3)],
+                              radius=10, fill=GRAY)
+    painter.rounded_rectangle([(label_x, label_y), (label_x + label_width, label_y + label_height)],
+                              radius=10, fill=DARK_GRAY, outline=BLACK, width=2)
+
+    badge_text = fix_persian_text(text)
+    text_height = painter.text_height(badge_text, "label")
+    painter.text_centered(label_x, label_width, label_y + (label_height - text_height) // 2 - 3,
+                          badge_text, WHITE, "label")
+
+
+def draw_static_layer(c, sender_info, width=LABEL_WIDTH, height=LABEL_HEIGHT):
+    """Draw the label chrome and sender block onto canvas c"""
+    painter = PdfPainter(c, width, height)
+    layout = label_layout(width, height)
+
+    # Main border
+    painter.rounded_rectangle([(10, 10), (width-10, height-10)], radius=20, outline=BLACK, width=4)
+
+    # Header
+    header_height = layout["header_height"]
+
+    painter.rounded_rectangle([(10, 10), (width-10, header_height)], radius=20, fill=LIGHT_GRAY)
+    painter.rectangle([(10, header_height-20), (width-10, header_height)], fill=LIGHT_GRAY)
+    painter.line((10, header_height), (width-10, header_height), fill=BLACK, width=3)
+
+    title_text = fix_persian_text("برچسب پستی")
+    text_height = painter.text_height(title_text, "title")
+    painter.text_centered(0, width, (header_height - text_height) // 2 - 5,
+                          title_text, BLACK, "title")
+
+    # Sender section
+    section1_start = layout["section1_start"]
+    _draw_badge(painter, layout, section1_start, "فرستنده")
+
+    right = width - layout["right_margin"]
+    info_y = section1_start + 5
+
+    painter.text_right(right, info_y, fix_persian_text(f"نام: {sender_info[0]}"), BLACK, "main")
+    info_y += 35
+    painter.text_right(right, info_y, fix_persian_text(f"آدرس: {sender_info[1]}"), BLACK, "info")
+    info_y += 35
+    painter.text_right(right, info_y,
+                       fix_persian_text(f"کدپستی: {sender_info[2]}  |  تلفن: {sender_info[3]}"),
+                       BLACK, "info")
+
+    # Separator
+    middle_y = layout["middle_y"]
+    for x in range(30, width-30, 15):
+        painter.ellipse([(x, middle_y-2), (x+8, middle_y+2)], fill=GRAY)
+
+    # Receiver badge
+    _draw_badge(painter, layout, layout["section2_start"], "گیرنده")
+
+    # Footer
+    footer_y = layout["footer_y"]
+
+    painter.rounded_rectangle([(10, footer_y), (width-10, height-10)], radius=20, fill=LIGHT_GRAY)
+    painter.rectangle([(10, footer_y), (width-10, footer_y+20)], fill=LIGHT_GRAY)
+    painter.line((10, footer_y), (width-10, footer_y), fill=BLACK, width=3)
+
+    first_line_y = footer_y + 15
+
+    website_text = "NokhbehSho.com"
+    phone_text = "021-91091722"
+    separator = " | "
+
+    website_width = painter.text_width(website_text, "website")
+    sep_width = painter.text_width(separator, "website")
+    phone_width = painter.text_width(phone_text, "phone")
+
+    start_x = (width - (website_width + sep_width + phone_width)) / 2.0
+
+    painter.text((start_x, first_line_y), website_text, BLACK, "website")
+    painter.text((start_x + website_width, first_line_y), separator, DARK_GRAY, "website")
+    painter.text((start_x + website_width + sep_width, first_line_y + 2), phone_text, BLACK, "phone")
+
+    painter.text_centered(0, width, footer_y + 45,
+                          fix_persian_text("مرجع تخصصی آموزش رباتیک و هوش مصنوعی کودکان و نوجوانان"),
+                          DARK_GRAY, "tiny")
+
+
+def receiver_lines(receiver_info, width=LABEL_WIDTH, height=LABEL_HEIGHT):
+    """Shaped (name, address lines, contact) for a receiver.
+
+    This is the expensive half of drawing the receiver fields, and it is
+    picklable, so label_sheet can run it in worker processes.
+    """
+    layout = label_layout(width, height)
+    name_text, address_text, contact_text = receiver_strings(receiver_info)
+    name_text, contact_text = fix_persian_texts([name_text, contact_text])
+
+    # Same line breaks as the raster renderer: wrap with the PIL face metrics
+    font_info = get_label_fonts()["info"]
+    wrapped_lines = wrap_text(None, address_text, font_info, layout["max_text_width"])
+    return name_text, fix_persian_texts(wrapped_lines), contact_text
+
+
+def draw_receiver_fields(c, receiver_info, width=LABEL_WIDTH, height=LABEL_HEIGHT, lines=None):
+    """Draw the receiver name, address, postal code and phone onto canvas c.
+
+    lines is receiver_lines(receiver_info) when it was computed beforehand.
+    """
+    painter = PdfPainter(c, width, height)
+    layout = label_layout(width, height)
+    right = width - layout["right_margin"]
+
+    info_y = layout["section2_start"] + 5
+    name_text, address_lines, contact_text = lines or receiver_lines(receiver_info, width, height)
+
+    painter.text_right(right, info_y, name_text, BLACK, "main")
+    info_y += 35
+
+    for line in address_lines:
+        painter.text_right(right, info_y, line, BLACK, "info")
+        info_y += 35
+
+    painter.text_right(right, info_y, contact_text, BLACK, "info")
+
+
+def draw_label(c, sender_info, receiver_info):
+    """Draw a complete label with its top-left corner at the canvas origin"""
+    draw_static_layer(c, sender_info)
+    draw_receiver_fields(c, receiver_info)
+
+
+def create_label_pdf(sender_info, receiver_info, pdf_filename):
+    """Write a single-label vector PDF and return its path"""
+    c = canvas.Canvas(pdf_filename, pagesize=label_page_size(), pageCompression=1)
+    draw_label(c, sender_info, receiver_info)
+    c.showPage()
+    c.save()
+    return pdf_filename
+
+
+def write_label_pdf(sender_info, receiver_info, pdf_filename, backend="vector", img=None,
+                    output_mode="rgb", dither=False, cache=None):
+    """Write a label PDF with the chosen backend.
+
+    The raster backend reuses img (the label as returned by
+    create_address_label) when given, otherwise renders one in output_mode;
+    1-bit labels are embedded as 1-bit images. With a RenderCache the PDF
+    is copied from the cache when the same label was written before.
+    """
+    if backend not in PDF_BACKENDS:
+        raise ValueError(f"Unknown PDF backend: {backend}")
+
+    if cache is not None:
+        # Vector PDFs don't depend on the image encoding
+        options = {"backend": backend}
+        if backend == "raster":
+            options.update(output_mode=output_mode, dither=dither)
+        key = cache.key("pdf", sender_info, receiver_info, **options)
+        with trace_stage("cache_fetch", kind="pdf") as stage:
+            hit = cache.fetch(key, ".pdf", pdf_filename)
+            stage.set(hit=hit)
+        if hit:
+            return pdf_filename
+
+    if backend == "raster" and img is None:
+        img = to_output_mode(render_address_label(sender_info, receiver_info), output_mode, dither)
+
+    with trace_stage("encode_pdf", backend=backend) as stage:
+        if backend == "raster":
+            save_label_pdf(img, pdf_filename)
+        else:
+            create_label_pdf(sender_info, receiver_info, pdf_filename)
+        stage.set(bytes=os.path.getsize(pdf_filename))
+
+    if cache is not None:
+        cache.store(key, ".pdf", pdf_filename)
+
+    return pdf_filename
@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Headless address label rendering.
+
+Everything needed to draw a postal label with PIL lives here so it can be
+used without PyQt6 or a QApplication (batch jobs, servers, tests).
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from PIL import Image, ImageDraw
+
+from font_registry import (LABEL_FONT_SIZES, debug_fonts, font_generation, get_font_path,
+                           get_label_fonts)
+from instrumentation import trace_stage
+from persian_text import fix_persian_text, fix_persian_texts
+
+LABEL_WIDTH = 945
+LABEL_HEIGHT = 591
+LABEL_DPI = 300
+
+# Part of the render cache key: bump it whenever a change to the drawing or
+# encoding code changes the files written for the same input
+LAYOUT_VERSION = 1
+
+WHITE = 255
+BLACK = 0
+GRAY = 100
+LIGHT_GRAY = 220
+DARK_GRAY = 60
+
+# Static label layers keyed by sender info, fonts and dimensions
+MAX_CACHED_TEMPLATES = 8
+
+_template_lock = threading.Lock()
+_templates = OrderedDict()
+_template_stats = {"hits": 0, "misses": 0}
+
+# Shaped advance widths of words and lines, keyed by (font, text)
+WIDTH_CACHE_SIZE = 16384
+
+# Rasterized receiver lines, keyed by (font, shaped text)
+TEXT_MASK_CACHE_SIZE = 256
+
+# How saved labels are encoded: "rgb" is what older versions wrote, "gray"
+# keeps the 8-bit render, "mono" is 1-bit for thermal printers (which
+# threshold anything else themselves)
+OUTPUT_MODES = ("rgb", "gray", "mono")
+
+# Grey levels below this print black in "mono" mode. Keeps the text and
+# badges solid; the light-grey header and footer fills drop to white.
+MONO_THRESHOLD = 128
+_MONO_TABLE = [0] * MONO_THRESHOLD + [255] * (256 - MONO_THRESHOLD)
+
+DEFAULT_SENDER_INFO = [
+    "شرکت هوش مصنوعی اندیشمندان برتر",
+    "شیراز،شهرک آرین بلوار سفیر امید ۲، کوچه ۲/۶",
+    "۷۱۴۵۶۸۳۲۱۰",
+    "۰۲۱۹۱۰۹۱۷۲۲"
+]
+
+
+@lru_cache(maxsize=WIDTH_CACHE_SIZE)
+def shaped_text_width(font, text):
+    """Advance width of logical text once shaped, cached per (font, text)"""
+    return font.getlength(fix_persian_text(text))
+
+
+def wrap_text(draw, text, font, max_width):
+    """Split logical text into lines that fit max_width when drawn with font.
+
+    Each word and the space are measured once per font (cached), and line
+    widths are accumulated as words are added, so wrapping is linear in the
+    number of words. Lines are returned in logical order; shape each one with
+    fix_persian_text before drawing. draw is kept for API compatibility.
+    """
+    words = text.split()
+    if not words:
+        return []
+
+    # Fast path: the whole text fits on one line
+    single_line = " ".join(words)
+    if shaped_text_width(font, single_line) <= max_width:
+        return [single_line]
+
+    space_width = shaped_text_width(font, " ")
+    lines = []
+    current_words = []
+    current_width = 0
+
+    for word in words:
+        word_width = shaped_text_width(font, word)
+
+        if current_words and current_width + space_width + word_width <= max_width:
+            current_words.append(word)
+            current_width += space_width + word_width
+        else:
+            if current_words:
+                lines.append(" ".join(current_words))
+            current_words = [word]
+            current_width = word_width
+
+    if current_words:
+        lines.append(" ".join(current_words))
+
+    return lines
+
+
+def label_layout(width, height):
+    """Positions shared by the static template and the receiver fields"""
+    header_height = 75
+    section1_start = header_height + 20
+    middle_y = section1_start + 140
+    right_margin = 60
+
+    return {
+        "header_height": header_height,
+        "section1_start": section1_start,
+        "middle_y": middle_y,
+        "section2_start": middle_y + 20,
+        "footer_y": height - 85,
+        "right_margin": right_margin,
+        "max_text_width": width - right_margin - 220,
+        "label_x": 50,
+        "label_width": 140,
+        "label_height": 50,
+    }
+
+
+def _draw_badge(draw, layout, label_y, text, font):
+    """Draw a dark rounded badge with a drop shadow ("فرستنده" / "گیرنده")"""
+    label_x = layout["label_x"]
+    label_width = layout["label_width"]
+    label_height = layout["label_height"]
+
+    draw.rounded_rectangle([(label_x+3, label_y+3), (label_x + label_width+3, label_y + label_height+3)],
+                          radius=10, fill=GRAY, outline=None)
+    draw.rounded_rectangle([(label_x, label_y), (label_x + label_width, label_y + label_height)],
+                          radius=10, fill=DARK_GRAY, outline=BLACK, width=2)
+
+    badge_text = fix_persian_text(text)
+    bbox = draw.textbbox((0, 0), badge_text, font=font)
+    text_width = bbox[2] - bbox[0]
+    text_height = bbox[3] - bbox[1]
+    x_label = label_x + (label_width - text_width) // 2
+    y_label = label_y + (label_height - text_height) // 2 - 3
+    draw.text((x_label, y_label), badge_text, WHITE, font=font)
+
+
+def _draw_static_layer(draw, sender_info, fonts, width, height):
+    """Draw everything that does not depend on the receiver"""
+    layout = label_layout(width, height)
+    font_title = fonts["title"]
+    font_label = fonts["label"]
+    font_main = fonts["main"]
+    font_info = fonts["info"]
+    font_website = fonts["website"]
+    font_phone = fonts["phone"]
+    font_tiny = fonts["tiny"]
+
+    # Main border
+    draw.rounded_rectangle([(10, 10), (width-10, height-10)], radius=20, outline=BLACK, width=4)
+
+    # Header
+    header_height = layout["header_height"]
+
+    draw.rounded_rectangle([(10, 10), (width-10, header_height)], radius=20, fill=LIGHT_GRAY, outline=None)
+    draw.rectangle([(10, header_height-20), (width-10, header_height)], fill=LIGHT_GRAY, outline=None)
+    draw.line([(10, header_height), (width-10, header_height)], fill=BLACK, width=3)
+
+    title_text = fix_persian_text("برچسب پستی")
+    bbox = draw.textbbox((0, 0), title_text, font=font_title)
+    text_width = bbox[2] - bbox[0]
+    text_height = bbox[3] - bbox[1]
+    x = (width - text_width) // 2
+    y = (header_height - text_height) // 2 - 5
+    draw.text((x, y), title_text, BLACK, font=font_title)
+
+    # Sender section
+    section1_start = layout["section1_start"]
+    _draw_badge(draw, layout, section1_start, "فرستنده", font_label)
+
+    right_margin = layout["right_margin"]
+    info_y = section1_start + 5
+
+    text = fix_persian_text(f"نام: {sender_info[0]}")
+    bbox = draw.textbbox((0, 0), text, font=font_main)
+    text_width = bbox[2] - bbox[0]
+    draw.text((width - right_margin - text_width, info_y), text, BLACK, font=font_main)
+    info_y += 35
+
+    text = fix_persian_text(f"آدرس: {sender_info[1]}")
+    bbox = draw.textbbox((0, 0), text, font=font_info)
+    text_width = bbox[2] - bbox[0]
+    draw.text((width - right_margin - text_width, info_y), text, BLACK, font=font_info)
+    info_y += 35
+
+    text = fix_persian_text(f"کدپستی: {sender_info[2]}  |  تلفن: {sender_info[3]}")
+    bbox = draw.textbbox((0, 0), text, font=font_info)
+    text_width = bbox[2] - bbox[0]
+    draw.text((width - right_margin - text_width, info_y), text, BLACK, font=font_info)
+
+    # Separator
+    middle_y = layout["middle_y"]
+    for x in range(30, width-30, 15):
+        draw.ellipse([(x, middle_y-2), (x+8, middle_y+2)], fill=GRAY)
+
+    # Receiver badge
+    _draw_badge(draw, layout, layout["section2_start"], "گیرنده", font_label)
+
+    # Footer
+    footer_y = layout["footer_y"]
+
+    draw.rounded_rectangle([(10, footer_y), (width-10, height-10)], radius=20, fill=LIGHT_GRAY, outline=None)
+    draw.rectangle([(10, footer_y), (width-10, footer_y+20)], fill=LIGHT_GRAY, outline=None)
+    draw.line([(10, footer_y), (width-10, footer_y)], fill=BLACK, width=3)
+
+    first_line_y = footer_y + 15
+
+    website_text = "NokhbehSho.com"
+    phone_text = "021-91091722"
+    separator = " | "
+
+    bbox_website = draw.textbbox((0, 0), website_text, font=font_website)
+    website_width = bbox_website[2] - bbox_website[0]
+
+    bbox_sep = draw.textbbox((0, 0), separator, font=font_website)
+    sep_width = bbox_sep[2] - bbox_sep[0]
+
+    bbox_phone = draw.textbbox((0, 0), phone_text, font=font_phone)
+    phone_width = bbox_phone[2] - bbox_phone[0]
+
+    total_width = website_width + sep_width + phone_width
+    start_x = (width - total_width) // 2
+
+    draw.text((start_x, first_line_y), website_text, BLACK, font=font_website)
+    draw.text((start_x + website_width, first_line_y), separator, DARK_GRAY, font=font_website)
+    draw.text((start_x + website_width + sep_width, first_line_y + 2), phone_text, BLACK, font=font_phone)
+
+    desc_text = fix_persian_text("مرجع تخصصی آموزش رباتیک و هوش مصنوعی کودکان و نوجوانان")
+    bbox = draw.textbbox((0, 0), desc_text, font=font_tiny)
+    text_width = bbox[2] - bbox[0]
+    x = (width - text_width) // 2
+    draw.text((x, footer_y + 45), desc_text, DARK_GRAY, font=font_tiny)
+
+
+def receiver_strings(receiver_info):
+    """Logical strings shaped when drawing a receiver, in drawing order"""
+    return [
+        f"نام: {receiver_info[0]}",
+        "آدرس: " + " ".join(receiver_info[1].split()),
+        f"کدپستی: {receiver_info[2]}  |  تلفن: {receiver_info[3]}",
+    ]
+
+
+@lru_cache(maxsize=TEXT_MASK_CACHE_SIZE)
+def _text_mask(font, text):
+    """Rasterize shaped text once; returns (mask, bbox) like textbbox at (0, 0)"""
+    bbox = font.getbbox(text)
+    mask = Image.new('L', (max(bbox[2] - bbox[0], 1), max(bbox[3] - bbox[1], 1)), 0)
+    ImageDraw.Draw(mask).text((-bbox[0], -bbox[1]), text, 255, font=font)
+    return mask, bbox
+
+
+def _draw_text_right(img, right, y, text, fill, font):
+    """Draw text with its ink ending at right, reusing cached glyph masks"""
+    mask, bbox = _text_mask(font, text)
+    x = right - (bbox[2] - bbox[0])
+    img.paste(fill, (x + bbox[0], y + bbox[1]), mask)
+
+
+def _draw_receiver_fields(img, receiver_info, fonts, width, height):
+    """Draw the receiver name, address, postal code and phone.
+
+    Lines are pasted from cached masks, so lines that did not change since
+    the last label (or keystroke) are not rasterized again. Returns the y
+    coordinate just below the last line drawn.
+    """
+    layout = label_layout(width, height)
+    font_main = fonts["main"]
+    font_info = fonts["info"]
+    right = width - layout["right_margin"]
+    max_text_width = layout["max_text_width"]
+
+    info_y = layout["section2_start"] + 5
+    name_text, address_text, contact_text = receiver_strings(receiver_info)
+
+    # Wrap in logical order, then shape each line for display
+    with trace_stage("measure"):
+        wrapped_lines = wrap_text(None, address_text, font_info, max_text_width)
+
+    with trace_stage("shaping"):
+        name_text, contact_text, *address_lines = fix_persian_texts(
+            [name_text, contact_text] + wrapped_lines)
+
+    with trace_stage("draw"):
+        _draw_text_right(img, right, info_y, name_text, BLACK, font_main)
+        info_y += 35
+
+        for line in address_lines:
+            _draw_text_right(img, right, info_y, line, BLACK, font_info)
+            info_y += 35
+
+        _draw_text_right(img, right, info_y, contact_text, BLACK, font_info)
+
+    return info_y + 35
+
+
+def get_label_template(sender_info, width=None, height=None):
+    """Return the cached static label layer for sender_info.
+
+    The template holds the border, header, sender block, separator, receiver
+    badge and footer. It is rebuilt when the sender info, the fonts (path or
+    registry generation) or the label dimensions change. Callers must copy()
+    it before drawing.
+    """
+    width = width or LABEL_WIDTH
+    height = height or LABEL_HEIGHT
+    key = (tuple(sender_info), get_font_path(), font_generation(),
+           tuple(sorted(LABEL_FONT_SIZES.items())), width, height)
+
+    with _template_lock:
+        template = _templates.get(key)
+        if template is not None:
+            _templates.move_to_end(key)
+            _template_stats["hits"] += 1
+            return template
+        _template_stats["misses"] += 1
+
+    template = Image.new('L', (width, height), WHITE)
+    _draw_static_layer(ImageDraw.Draw(template), sender_info, get_label_fonts(), width, height)
+
+    with _template_lock:
+        _templates[key] = template
+        while len(_templates) > MAX_CACHED_TEMPLATES:
+            _templates.popitem(last=False)
+
+    return template
+
+
+def label_template_stats():
+    """Return template cache hit/miss counters"""
+    with _template_lock:
+        stats = dict(_template_stats)
+        stats["cached_templates"] = len(_templates)
+    return stats
+
+
+def clear_label_template_cache():
+    """Drop all cached templates"""
+    with _template_lock:
+        _templates.clear()
+
+
+def receiver_region(width=None, height=None):
+    """Box (left, top, right, bottom) that the receiver fields are drawn in"""
+    width = width or LABEL_WIDTH
+    height = height or LABEL_HEIGHT
+    layout = label_layout(width, height)
+    return (0, layout["section2_start"], width, layout["footer_y"] - 1)
+
+
+def redraw_receiver_fields(img, sender_info, receiver_info):
+    """Replace the receiver fields of an already rendered label in place.
+
+    Only the receiver region is restored from the template and redrawn, so
+    this is much cheaper than rendering a new label. Returns the box that
+    changed.
+    """
+    width, height = img.size
+    with trace_stage("template"):
+        template = get_label_template(sender_info, width, height)
+
+    box = receiver_region(width, height)
+    img.paste(template.crop(box), box)
+
+    with trace_stage("fonts"):
+        fonts = get_label_fonts()
+
+    bottom = _draw_receiver_fields(img, receiver_info, fonts, width, height)
+
+    # Long addresses that run into the footer were hidden behind it when the
+    # footer was drawn last; restore the footer from the template to match.
+    footer_y = label_layout(width, height)["footer_y"]
+    if bottom > footer_y:
+        footer_box = (0, footer_y - 1, width, height)
+        img.paste(template.crop(footer_box), footer_box)
+        box = (box[0], box[1], width, height)
+
+    return box
+
+
+def render_address_label(sender_info, receiver_info):
+    """Draw a label and return it as a greyscale ('L') PIL image"""
+    with trace_stage("template"):
+        img = get_label_template(sender_info, LABEL_WIDTH, LABEL_HEIGHT).copy()
+    redraw_receiver_fields(img, sender_info, receiver_info)
+    return img
+
+
+def to_output_mode(img, output_mode="rgb", dither=False):
+    """Convert a rendered 'L' label to the image saved for output_mode.
+
+    "mono" thresholds at MONO_THRESHOLD, or Floyd-Steinberg dithers when
+    dither is true (keeps grey fills as a dot pattern, softens text edges).
+    """
+    if output_mode == "rgb":
+        return img.convert('RGB')
+    if output_mode == "gray":
+        return img
+    if output_mode == "mono":
+        if dither:
+            return img.convert('1')
+        return img.point(_MONO_TABLE, '1')
+    raise ValueError(f"Unknown output mode: {output_mode}")
+
+
+def save_label_image(img, filename):
+    """Save a converted label at 300 DPI; 1-bit TIFFs are CCITT Group 4 compressed"""
+    params = {"dpi": (LABEL_DPI, LABEL_DPI)}
+    if filename.lower().endswith(('.tif', '.tiff')):
+        params["compression"] = "group4" if img.mode == '1' else "tiff_lzw"
+    elif img.mode != '1':
+        # JPEG quality for PDFs; 1-bit PDFs are G4 and reject the option
+        params["quality"] = 100
+    img.save(filename, **params)
+    return filename
+
+
+def create_address_label(sender_info, receiver_info, output_filename="address_label.png",
+                         output_mode="rgb", dither=False, cache=None):
+    """Render a label, save it as a 300 DPI image and return the saved image.
+
+    The returned image is RGB, 'L' or '1' depending on output_mode (see
+    OUTPUT_MODES); pass it to write_label_pdf to embed the same raster.
+    With a render_cache.RenderCache, a label rendered before is copied
+    from the cache and the returned image is decoded from that file.
+    """
+    ext = os.path.splitext(output_filename)[1].lower() or ".png"
+    # A hit is decoded back from the file, which Pillow can't do for PDFs;
+    # label_pdf.write_label_pdf caches those
+    if ext == ".pdf":
+        cache = None
+    if cache is not None:
+        key = cache.key("image", sender_info, receiver_info, output_mode=output_mode,
+                        dither=dither, format=ext)
+        with trace_stage("cache_fetch", kind="image") as stage:
+            hit = cache.fetch(key, ext, output_filename)
+            stage.set(hit=hit)
+        if hit:
+            img = Image.open(output_filename)
+            img.load()
+            return img
+
+    img = render_address_label(sender_info, receiver_info)
+
+    with trace_stage("convert", image_size=img.size, mode=output_mode):
+        img = to_output_mode(img, output_mode, dither)
+
+    with trace_stage(f"encode_{ext.lstrip('.')}", image_size=img.size, mode=output_mode) as stage:
+        save_label_image(img, output_filename)
+        stage.set(bytes=os.path.getsize(output_filename))
+
+    if cache is not None:
+        cache.store(key, ext, output_filename)
+
+    return img
+
+
+def save_label_pdf(img, pdf_filename):
+    """Save a rendered label as a single-page PDF.
+
+    1-bit ('1') labels are embedded as CCITT G4 bitmaps when Pillow has
+    libtiff, otherwise the image is JPEG encoded like RGB and 'L' labels.
+    """
+    img.save(pdf_filename, "PDF", resolution=float(LABEL_DPI))
+    return pdf_filename
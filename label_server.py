@@ -0,0 +1,568 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Local HTTP service rendering labels and crops for other programs.
+
+Usage:
+    python label_server.py --port 8765 --workers 4
+    python app.py serve --port 8765
+
+    curl -X POST localhost:8765/label -d '{"receiver": {"name": "...", "address": "...",
+         "postal": "...", "phone": "..."}, "format": "pdf"}' -o label.pdf
+    curl -X POST "localhost:8765/crop?dpi=300&format=png" --data-binary @scan.tif -o crop.png
+    curl localhost:8765/metrics
+
+Endpoints:
+    POST /label     JSON {"receiver", "sender"?, "format"?, "mode"?, "backend"?, "dither"?}
+                    format: png, tiff, pdf, zpl, escpos or tspl (default png)
+    POST /crop      the image as the request body (or a multipart "file" field)
+                    with dpi, size_mm and format (png or pdf) in the query string
+    GET  /metrics   Prometheus text: request counts, latency histograms, queue depth
+    GET  /health    "ok"
+
+The server is asyncio on one thread; rendering runs on a process pool whose
+workers load the fonts once at start. At most --queue requests wait for a
+worker; past that the server answers 503 with Retry-After instead of
+queueing without bound. The check runs as soon as a request's headers
+are in, before its body is read, so a full queue also bounds the memory
+held by uploads; /metrics and /health are always answered. It binds to
+127.0.0.1 unless told otherwise.
+"""
+
+import argparse
+import asyncio
+import email.parser
+import email.policy
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Requests admitted beyond the ones running, per worker
+QUEUE_PER_WORKER = 4
+# Big enough for a 40 MP scan; larger files belong to `app.py crop`
+MAX_BODY_MB = 64
+MAX_HEADER_BYTES = 64 * 1024
+# Idle keep-alive connections are closed after this many seconds
+KEEP_ALIVE_TIMEOUT = 15
+# A body must arrive within BODY_TIMEOUT plus its size at MIN_UPLOAD_RATE
+BODY_TIMEOUT = 15
+MIN_UPLOAD_RATE = 64 * 1024     # bytes per second
+RETRY_AFTER_SECONDS = 1
+
+# Latency histogram bucket bounds in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LABEL_FORMATS = {
+    "png": "image/png",
+    "tiff": "image/tiff",
+    "pdf": "application/pdf",
+    "zpl": "application/octet-stream",
+    "escpos": "application/octet-stream",
+    "tspl": "application/octet-stream",
+}
+CROP_FORMATS = {"png": "image/png", "pdf": "application/pdf"}
+
+# Routes that render on the pool, and the ones that answer even when it is full
+POOL_ROUTES = ("/label", "/crop")
+UNMETERED_ROUTES = ("/metrics", "/health")
+
+STATUS_TEXT = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    408: "Request Timeout", 413: "Payload Too Large", 415: "Unsupported Media Type",
+    500: "Internal Server Error", 503: "Service Unavailable",
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message=None):
+        super().__init__(message or STATUS_TEXT.get(status, ""))
+        self.status = status
+
+
+# Work done in the pool processes
+
+def warm_server_worker():
+    """Pool initializer: load fonts so the first request doesn't pay for it"""
+    from label_batch import warm_worker
+    warm_worker()
+
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def render_label(sender_info, receiver_info, fmt="png", output_mode="rgb", backend="vector",
+                 dither=False):
+    """Bytes of one label in fmt (see LABEL_FORMATS), through the render cache"""
+    from render_cache import default_cache
+
+    cache = default_cache()
+    if fmt in ("zpl", "escpos", "tspl"):
+        from printer_raster import raster_label
+        return raster_label(sender_info, receiver_info, fmt, dither, cache=cache)[0]
+
+    # The renderers write files (and the cache copies them); a scratch
+    # directory keeps concurrent requests apart
+    with tempfile.TemporaryDirectory(prefix="imagetools-serve-") as scratch:
+        if fmt == "pdf":
+            from label_pdf import write_label_pdf
+            path = write_label_pdf(sender_info, receiver_info, os.path.join(scratch, "label.pdf"),
+                                   backend=backend, output_mode=output_mode, dither=dither,
+                                   cache=cache)
+        else:
+            from label_renderer import create_address_label
+            path = os.path.join(scratch, "label.tif" if fmt == "tiff" else "label.png")
+            create_address_label(sender_info, receiver_info, path, output_mode, dither, cache)
+        return _read_file(path)
+
+
+def render_crop(data, dpi, size_mm, fmt="png"):
+    """Bytes of the size_mm crop of the uploaded image data at dpi"""
+    from image_cropper import crop_file, save_crop_pdf, save_crop_png
+
+    with tempfile.TemporaryDirectory(prefix="imagetools-serve-") as scratch:
+        # LazyImage reopens the file per decode, so a huge upload is
+        # cropped without decoding all of it
+        source = os.path.join(scratch, "upload")
+        with open(source, "wb") as f:
+            f.write(data)
+        image = crop_file(source, dpi, size_mm)
+
+        if fmt == "pdf":
+            path = save_crop_pdf(image, os.path.join(scratch, "crop.pdf"), size_mm)
+        else:
+            path = save_crop_png(image, os.path.join(scratch, "crop.png"))
+        return _read_file(path)
+
+
+# Metrics
+
+class Metrics:
+    """Request counters and latency histograms in the Prometheus text format"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.requests = {}      # (route, status) -> count
+        self.latency = {}       # route -> [bucket counts..., +Inf count, sum]
+        self.rejected = 0
+        self.pending = 0        # admitted requests running or waiting for a worker
+        self.receiving = 0      # admitted requests whose body is still being read
+
+    def observe(self, route, status, seconds):
+        self.requests[(route, status)] = self.requests.get((route, status), 0) + 1
+        histogram = self.latency.setdefault(route, [0] * (len(LATENCY_BUCKETS) + 1) + [0.0])
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                histogram[index] += 1
+        histogram[len(LATENCY_BUCKETS)] += 1
+        histogram[-1] += seconds
+
+    def render(self, workers, capacity):
+        lines = [
+            "# TYPE imagetools_requests_total counter",
+            *(f'imagetools_requests_total{{route="{route}",status="{status}"}} {count}'
+              for (route, status), count in sorted(self.requests.items())),
+            "# TYPE imagetools_request_seconds histogram",
+        ]
+        for route, histogram in sorted(self.latency.items()):
+            for bound, count in zip(LATENCY_BUCKETS, histogram):
+                lines.append(f'imagetools_request_seconds_bucket{{route="{route}",le="{bound}"}} {count}')
+            total = histogram[len(LATENCY_BUCKETS)]
+            lines += [
+                f'imagetools_request_seconds_bucket{{route="{route}",le="+Inf"}} {total}',
+                f'imagetools_request_seconds_sum{{route="{route}"}} {histogram[-1]:.6f}',
+                f'imagetools_request_seconds_count{{route="{route}"}} {total}',
+            ]
+        lines += [
+            "# TYPE imagetools_rejected_total counter",
+            f"imagetools_rejected_total {self.rejected}",
+            "# TYPE imagetools_in_flight gauge",
+            f"imagetools_in_flight {min(self.pending, workers)}",
+            "# TYPE imagetools_queued gauge",
+            f"imagetools_queued {max(self.pending - workers, 0)}",
+            "# TYPE imagetools_receiving gauge",
+            f"imagetools_receiving {self.receiving}",
+            "# TYPE imagetools_workers gauge",
+            f"imagetools_workers {workers}",
+            "# TYPE imagetools_capacity gauge",
+            f"imagetools_capacity {capacity}",
+            "# TYPE imagetools_uptime_seconds gauge",
+            f"imagetools_uptime_seconds {time.time() - self.started:.1f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+# HTTP
+
+class Request:
+    def __init__(self, method, target, headers, length=0):
+        self.method = method
+        url = urlsplit(target)
+        self.path = url.path
+        self.query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        self.headers = headers
+        self.length = length
+        self.body = b""
+
+    @property
+    def keep_alive(self):
+        return self.headers.get("connection", "").lower() != "close"
+
+
+async def read_head(reader, max_body):
+    """Parse the request line and headers of one HTTP/1.1 request.
+
+    Returns a Request whose body is still unread (see read_body), or None
+    when the client closed the connection.
+    """
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if not e.partial.strip():
+            return None
+        raise HttpError(400, "Incomplete request")
+    except asyncio.LimitOverrunError:
+        raise HttpError(400, "Request header too large")
+
+    request_line, *header_lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _ = request_line.split(" ", 2)
+    except ValueError:
+        raise HttpError(400, "Malformed request line")
+
+    headers = {}
+    for line in header_lines:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        raise HttpError(400, "Chunked request bodies are not supported; send Content-Length")
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HttpError(400, "Bad Content-Length")
+    if length < 0:
+        raise HttpError(400, "Bad Content-Length")
+    if length > max_body:
+        raise HttpError(413, f"Body larger than {max_body // 2**20} MB")
+    return Request(method.upper(), target, headers, length)
+
+
+async def read_body(reader, request):
+    """Read request.body, allowing time in proportion to its size (408 when it runs out)"""
+    if not request.length:
+        return
+    deadline = BODY_TIMEOUT + request.length / MIN_UPLOAD_RATE
+    try:
+        request.body = await asyncio.wait_for(reader.readexactly(request.length), deadline)
+    except asyncio.TimeoutError:
+        raise HttpError(408, f"Body not received within {deadline:.0f}s")
+
+
+def response_bytes(status, body=b"", content_type="text/plain; charset=utf-8", headers=None,
+                   keep_alive=True):
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+             f"Content-Type: {content_type}",
+             f"Content-Length: {len(body)}",
+             f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+
+def multipart_fields(request):
+    """{name: bytes} of a multipart/form-data body"""
+    content_type = request.headers.get("content-type", "")
+    parser = email.parser.BytesParser(policy=email.policy.HTTP)
+    message = parser.parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + request.body)
+    if not message.is_multipart():
+        raise HttpError(400, "Malformed multipart body")
+    return {part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+            for part in message.iter_parts()}
+
+
+def check_record(payload, key):
+    """Return payload[key] if it is an address object or list of strings and numbers, else 400"""
+    record = payload[key]
+    if isinstance(record, dict):
+        values = record.values()
+    elif isinstance(record, list):
+        values = record
+    else:
+        raise HttpError(400, f'"{key}" must be an object or a list of strings')
+    # Numbers (a postal code or phone written without quotes) are kept as text
+    if not all(isinstance(v, (str, int, float)) and not isinstance(v, bool) for v in values):
+        raise HttpError(400, f'"{key}" fields must be strings or numbers')
+    return record
+
+
+class LabelServer:
+    """asyncio front end; rendering is submitted to a ProcessPoolExecutor"""
+
+    def __init__(self, workers=None, queue=None, sender_info=None, max_body_mb=MAX_BODY_MB):
+        from label_renderer import DEFAULT_SENDER_INFO
+
+        self.workers = workers or os.cpu_count() or 1
+        self.capacity = self.workers + (QUEUE_PER_WORKER * self.workers if queue is None else queue)
+        self.sender_info = list(sender_info or DEFAULT_SENDER_INFO)
+        self.max_body = int(max_body_mb * 1024 * 1024)
+        self.metrics = Metrics()
+        self.pool = None
+        self.server = None
+
+    # Lifecycle
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_server_worker)
+        # Start every worker now rather than on the first requests
+        await asyncio.gather(*(asyncio.get_running_loop().run_in_executor(self.pool, os.getpid)
+                               for _ in range(self.workers)))
+        self.server = await asyncio.start_server(self.handle_connection, host, port,
+                                                 limit=MAX_HEADER_BYTES)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    # Pool submission with backpressure
+
+    async def submit(self, fn, *args):
+        """Run fn(*args) on the pool, or raise 503 when capacity is used up"""
+        metrics = self.metrics
+        if metrics.pending >= self.capacity:
+            metrics.rejected += 1
+            raise HttpError(503, "Render queue full, retry shortly")
+
+        # Admitted requests go straight to the pool, whose queue therefore
+        # never holds more than capacity - workers of them
+        metrics.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+        finally:
+            metrics.pending -= 1
+
+    # Routes
+
+    async def handle_label(self, request):
+        try:
+            payload = json.loads(request.body or b"{}")
+        except ValueError as e:
+            raise HttpError(400, f"Invalid JSON: {e}")
+        if not isinstance(payload, dict) or "receiver" not in payload:
+            raise HttpError(400, 'Expected a JSON object with a "receiver"')
+
+        from label_batch import _normalize_record
+        from label_pdf import PDF_BACKENDS
+        from label_renderer import OUTPUT_MODES
+
+        fmt = str(payload.get("format", "png")).lower()
+        output_mode = str(payload.get("mode", "rgb")).lower()
+        backend = str(payload.get("backend", "vector")).lower()
+        if fmt not in LABEL_FORMATS:
+            raise HttpError(400, f"format must be one of {', '.join(LABEL_FORMATS)}")
+        if output_mode not in OUTPUT_MODES:
+            raise HttpError(400, f"mode must be one of {', '.join(OUTPUT_MODES)}")
+        if backend not in PDF_BACKENDS:
+            raise HttpError(400, f"backend must be one of {', '.join(PDF_BACKENDS)}")
+
+        receiver_info = _normalize_record(check_record(payload, "receiver"))
+        if "sender" in payload:
+            sender_info = _normalize_record(check_record(payload, "sender"))
+        else:
+            sender_info = self.sender_info
+        data = await self.submit(render_label, sender_info, receiver_info, fmt, output_mode,
+                                 backend, bool(payload.get("dither")))
+        return 200, data, LABEL_FORMATS[fmt]
+
+    async def handle_crop(self, request):
+        fields = dict(request.query)
+        data = request.body
+        if request.headers.get("content-type", "").startswith("multipart/form-data"):
+            parts = multipart_fields(request)
+            data = parts.pop("file", None)
+            fields.update({name: value.decode("utf-8", "replace") for name, value in parts.items()
+                           if value is not None})
+        if not data:
+            raise HttpError(400, "No image in the request body")
+
+        from image_cropper import CROP_SIZE_MM
+
+        fmt = fields.get("format", "png").lower()
+        if fmt not in CROP_FORMATS:
+            raise HttpError(400, f"format must be one of {', '.join(CROP_FORMATS)}")
+        try:
+            dpi = float(fields.get("dpi", 300))
+            size_mm = float(fields.get("size_mm", CROP_SIZE_MM))
+        except ValueError:
+            raise HttpError(400, "dpi and size_mm must be numbers")
+        if not (0 < dpi <= 4800 and 0 < size_mm <= 1000):
+            raise HttpError(400, "dpi or size_mm out of range")
+
+        from PIL import UnidentifiedImageError
+        from lazy_image import MemoryBudgetExceeded
+
+        try:
+            data = await self.submit(render_crop, data, dpi, size_mm, fmt)
+        except UnidentifiedImageError:
+            raise HttpError(415, "Not an image Pillow can read")
+        except MemoryBudgetExceeded as e:
+            raise HttpError(413, str(e))
+        return 200, data, CROP_FORMATS[fmt]
+
+    async def dispatch(self, request):
+        routes = {
+            "/label": ("POST", self.handle_label),
+            "/crop": ("POST", self.handle_crop),
+        }
+        if request.path == "/metrics":
+            return 200, self.metrics.render(self.workers, self.capacity), "text/plain; version=0.0.4"
+        if request.path == "/health":
+            return 200, "ok\n", "text/plain; charset=utf-8"
+        if request.path not in routes:
+            raise HttpError(404)
+
+        method, handler = routes[request.path]
+        if request.method != method:
+            raise HttpError(405)
+        return await handler(request)
+
+    async def receive(self, reader, request):
+        """Admit a request bound for the pool and read its body, or raise 503 without reading it"""
+        metrics = self.metrics
+        if request.path in UNMETERED_ROUTES or not (request.length or request.path in POOL_ROUTES):
+            await read_body(reader, request)
+            return
+        if metrics.pending + metrics.receiving >= self.capacity:
+            metrics.rejected += 1
+            raise HttpError(503, "Render queue full, retry shortly")
+        metrics.receiving += 1
+        try:
+            await read_body(reader, request)
+        finally:
+            metrics.receiving -= 1
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                # Only the wait for the next request head is an idle timeout
+                try:
+                    request = await asyncio.wait_for(read_head(reader, self.max_body),
+                                                     KEEP_ALIVE_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except HttpError as e:
+                    writer.write(response_bytes(e.status, f"{e}\n", keep_alive=False))
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+
+                start = time.perf_counter()
+                try:
+                    await self.receive(reader, request)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except HttpError as e:
+                    # The unread body leaves the connection out of step: close it
+                    headers = {"Retry-After": str(RETRY_AFTER_SECONDS)} if e.status == 503 else {}
+                    self.metrics.observe(request.path, e.status, time.perf_counter() - start)
+                    writer.write(response_bytes(e.status, f"{e}\n", headers=headers,
+                                                keep_alive=False))
+                    await writer.drain()
+                    break
+
+                headers = {}
+                try:
+                    status, body, content_type = await self.dispatch(request)
+                except HttpError as e:
+                    status, body, content_type = e.status, f"{e}\n", "text/plain; charset=utf-8"
+                    if status == 503:
+                        headers["Retry-After"] = str(RETRY_AFTER_SECONDS)
+                except Exception as e:
+                    # A bad image or receiver fails its request, not the server
+                    status, body, content_type = 500, f"{type(e).__name__}: {e}\n", "text/plain; charset=utf-8"
+
+                if request.path != "/metrics":
+                    self.metrics.observe(request.path, status, time.perf_counter() - start)
+
+                writer.write(response_bytes(status, body, content_type, headers, request.keep_alive))
+                # Slow readers hold up their own connection, not the server
+                await writer.drain()
+                if not request.keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None, queue=None, sender_info=None,
+                ready=None):
+    """Run a LabelServer until cancelled. ready, if given, is called with the bound (host, port)."""
+    server = LabelServer(workers, queue, sender_info)
+    address = await server.start(host, port)
+    if ready:
+        ready(address)
+    else:
+        print(f"🌐 Serving labels on http://{address[0]}:{address[1]} "
+              f"({server.workers} workers, {server.capacity} requests max)")
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+
+
+# CLI
+
+def build_parser(parser=None):
+    parser = parser or argparse.ArgumentParser(description="Local HTTP label and crop service")
+    parser.add_argument("--host", default=DEFAULT_HOST,
+                        help="Interface to bind (default: localhost only)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Render processes (default: CPU count)")
+    parser.add_argument("--queue", type=int, default=None,
+                        help=f"Requests that may wait for a worker before 503 "
+                             f"(default: {QUEUE_PER_WORKER} per worker)")
+    parser.add_argument("--sender", help="JSON file with a 4-item sender info list")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    sender_info = None
+    if args.sender:
+        from label_batch import _normalize_record
+        with open(args.sender, encoding='utf-8') as f:
+            sender_info = _normalize_record(json.load(f))
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.queue, sender_info))
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(f"❌ {args.host}:{args.port}: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Impose address labels on A4 (or A5/Letter) sheets as one vector PDF.
+
+Usage:
+    python label_sheet.py receivers.csv -o sheet.pdf              # 2 x 5 labels per A4 page
+    python label_sheet.py receivers.csv -o sheet.pdf --columns 2 --rows 4 --gap-mm 5
+    python app.py sheet receivers.csv -o sheet.pdf
+
+The static part of a label (frame, header, sender block, badges, footer)
+is drawn once into a PDF form XObject and every slot references it, so
+each further label only adds its receiver text to the file. For large
+sheets the receiver text is shaped on a process pool and drawn in order
+on one canvas.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from reportlab.lib.pagesizes import A4, A5, letter
+from reportlab.lib.units import mm
+from reportlab.pdfgen import canvas
+
+from instrumentation import trace_stage
+from label_batch import _normalize_record, read_receivers, repeated_strings, warm_worker
+from label_pdf import draw_receiver_fields, draw_static_layer, label_page_size, receiver_lines
+from label_renderer import DEFAULT_SENDER_INFO
+
+PAGE_SIZES = {"a4": A4, "a5": A5, "letter": letter}
+
+# 80 x 50 mm labels: 2 x 5 fill an A4 sheet with room for the printer margins
+DEFAULT_COLUMNS = 2
+DEFAULT_ROWS = 5
+DEFAULT_GAP_MM = 2
+
+# Below this many labels a process pool costs more than it saves
+PARALLEL_MIN_LABELS = 200
+
+
+def sheet_slots(page_size, columns, rows, gap_mm=DEFAULT_GAP_MM, margin_mm=None):
+    """Bottom-left corner (in points) of every label slot, row by row from the top.
+
+    The grid is centred on the page unless margin_mm fixes the top-left
+    corner. Raises ValueError when the grid does not fit.
+    """
+    label_width, label_height = label_page_size()
+    page_width, page_height = page_size
+    gap = gap_mm * mm
+    grid_width = columns * label_width + (columns - 1) * gap
+    grid_height = rows * label_height + (rows - 1) * gap
+
+    if margin_mm is None:
+        left = (page_width - grid_width) / 2
+        top = (page_height - grid_height) / 2
+    else:
+        left = top = margin_mm * mm
+
+    # Allow for rounding in the mm -> pt conversion
+    if left < 0 or top < 0 or left + grid_width > page_width + 0.5 or top + grid_height > page_height + 0.5:
+        raise ValueError(f"{columns} x {rows} labels of {label_width / mm:.0f} x "
+                         f"{label_height / mm:.0f} mm do not fit on a "
+                         f"{page_width / mm:.0f} x {page_height / mm:.0f} mm page")
+
+    return [(left + column * (label_width + gap),
+             page_height - top - (row + 1) * label_height - row * gap)
+            for row in range(rows) for column in range(columns)]
+
+
+def shaped_receivers(receivers, workers=None):
+    """receiver_lines() for every receiver, in order, on up to workers processes"""
+    infos = [info for _, info in receivers]
+    workers = workers or os.cpu_count() or 1
+    workers = max(1, min(workers, len(infos) // (PARALLEL_MIN_LABELS // 2) or 1))
+
+    shared_strings = repeated_strings(receivers)
+    if workers == 1 or len(infos) < PARALLEL_MIN_LABELS:
+        warm_worker(shared_strings)
+        return [receiver_lines(info) for info in infos]
+
+    chunksize = max(1, len(infos) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=warm_worker,
+                             initargs=(shared_strings,)) as pool:
+        return list(pool.map(receiver_lines, infos, chunksize=chunksize))
+
+
+def write_label_sheet(receivers, pdf_filename, sender_info=None, columns=DEFAULT_COLUMNS,
+                      rows=DEFAULT_ROWS, page="a4", gap_mm=DEFAULT_GAP_MM, margin_mm=None,
+                      progress=None, workers=None):
+    """Write receivers as a multi-page label sheet PDF and return a summary dict.
+
+    receivers is a list of (label_id, receiver_info) as returned by
+    label_batch.read_receivers. workers caps the processes used to shape
+    the receiver text (default: CPU count; 1 shapes in-process). progress,
+    if given, is called with the number of labels placed so far after each
+    page.
+    """
+    if page not in PAGE_SIZES:
+        raise ValueError(f"Unknown page size: {page}")
+
+    sender_info = list(sender_info or DEFAULT_SENDER_INFO)
+    slots = sheet_slots(PAGE_SIZES[page], columns, rows, gap_mm, margin_mm)
+    start = time.perf_counter()
+    pages = 0
+
+    with trace_stage("shaping", labels=len(receivers)):
+        lines = shaped_receivers(receivers, workers)
+
+    with trace_stage("impose", labels=len(receivers), page=page) as stage:
+        c = canvas.Canvas(pdf_filename, pagesize=PAGE_SIZES[page], pageCompression=1)
+
+        # Drawn once; every slot below is a Do operator plus its receiver text
+        c.beginForm("label_static", 0, 0, *label_page_size())
+        draw_static_layer(c, sender_info)
+        c.endForm()
+
+        for index, (_, receiver_info) in enumerate(receivers):
+            slot = index % len(slots)
+            if slot == 0 and index:
+                c.showPage()
+                pages += 1
+                if progress:
+                    progress(index)
+
+            x, y = slots[slot]
+            c.saveState()
+            c.translate(x, y)
+            c.doForm("label_static")
+            draw_receiver_fields(c, receiver_info, lines=lines[index])
+            c.restoreState()
+
+        c.showPage()
+        c.save()
+        pages += 1
+        if progress:
+            progress(len(receivers))
+        stage.set(bytes=os.path.getsize(pdf_filename), pages=pages)
+
+    elapsed = time.perf_counter() - start
+    return {
+        "labels": len(receivers),
+        "pages": pages,
+        "per_page": len(slots),
+        "bytes": os.path.getsize(pdf_filename),
+        "elapsed": elapsed,
+        "labels_per_second": len(receivers) / elapsed if elapsed > 0 else 0.0,
+        "file": pdf_filename,
+    }
+
+
+def build_parser(parser=None):
+    parser = parser or argparse.ArgumentParser(description="Impose address labels on printable sheets")
+    parser.add_argument("receivers", help="CSV or JSONL file with receiver records")
+    parser.add_argument("-o", "--output", default="labels_sheet.pdf", help="PDF to write")
+    parser.add_argument("--page", choices=sorted(PAGE_SIZES), default="a4")
+    parser.add_argument("--columns", type=int, default=DEFAULT_COLUMNS)
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS)
+    parser.add_argument("--gap-mm", type=float, default=DEFAULT_GAP_MM,
+                        help="Space between neighbouring labels")
+    parser.add_argument("--margin-mm", type=float, default=None,
+                        help="Top/left page margin (default: centre the grid)")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Processes for text shaping (default: CPU count)")
+    parser.add_argument("--sender", help="JSON file with a 4-item sender info list")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    sender_info = None
+    if args.sender:
+        with open(args.sender, encoding='utf-8') as f:
+            sender_info = _normalize_record(json.load(f))
+
+    receivers = read_receivers(args.receivers)
+    if not receivers:
+        print(f"❌ No receivers found in {args.receivers}")
+        return 1
+
+    try:
+        summary = write_label_sheet(receivers, args.output, sender_info, args.columns, args.rows,
+                                    args.page, args.gap_mm, args.margin_mm,
+                                    workers=args.workers)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+
+    print(f"✅ Wrote {summary['labels']} labels on {summary['pages']} page(s) "
+          f"({summary['per_page']} per page) to {summary['file']}")
+    print(f"   {summary['bytes'] / 1024:.0f} KB in {summary['elapsed']:.2f}s "
+          f"({summary['labels_per_second']:.0f} labels/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
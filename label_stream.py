@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Stream a label run of any length into one multi-page PDF or TIFF.
+
+Usage:
+    python label_stream.py receivers.csv -o run.pdf --mode mono
+    python label_stream.py receivers.jsonl -o run.tif --workers 4 --verbose
+    python app.py stream receivers.csv -o run.pdf
+
+Receivers are read lazily and each label is rendered, encoded and appended
+to the output as soon as it is ready; only the page being written and a
+few in flight are ever held in memory, so peak memory is the same for 100
+or 100,000 labels. Pages are 300 DPI rasters: 1-bit labels are CCITT G4
+(in both PDF and TIFF), greyscale and colour are Flate (PDF) or LZW (TIFF).
+"""
+
+import argparse
+import io
+import json
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, features
+
+from instrumentation import trace_stage
+from label_renderer import (DEFAULT_SENDER_INFO, LABEL_DPI, OUTPUT_MODES, render_address_label,
+                            to_output_mode)
+
+STREAM_FORMATS = ("pdf", "tiff")
+
+# Labels rendered ahead of the writer, per worker
+READ_AHEAD_PER_WORKER = 2
+# How often the CLI prints a running total without --verbose
+DEFAULT_REPORT_EVERY = 100
+
+# Classic TIFF offsets are 32-bit
+TIFF_MAX_BYTES = 2**32 - 1
+
+# TIFF field type -> bytes per value
+TIFF_FIELD_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 13: 4}
+# Tags whose values are file offsets (StripOffsets, TileOffsets)
+TIFF_OFFSET_TAGS = (273, 324)
+
+
+# Page encoding (runs in the workers)
+
+def encode_tiff_page(img):
+    """A single-page TIFF of img, compressed like label_renderer.save_label_image"""
+    buffer = io.BytesIO()
+    if img.mode == '1':
+        # One strip, so the page data is also a valid CCITTFaxDecode stream for PDF
+        img.save(buffer, "TIFF", dpi=(LABEL_DPI, LABEL_DPI), compression="group4",
+                 strip_size=-(-img.width // 8) * img.height)
+    else:
+        img.save(buffer, "TIFF", dpi=(LABEL_DPI, LABEL_DPI), compression="tiff_lzw")
+    return buffer.getvalue()
+
+
+def _g4_strip(tiff_bytes):
+    """The CCITT G4 data of a single-strip TIFF page"""
+    with Image.open(io.BytesIO(tiff_bytes)) as page:
+        offset = page.tag_v2[273][0]
+        length = page.tag_v2[279][0]
+    return tiff_bytes[offset:offset + length]
+
+
+def encode_pdf_image(img):
+    """(image XObject dictionary entries, stream data) for img"""
+    width, height = img.size
+    if img.mode == '1' and features.check("libtiff"):
+        entries = (f"/ColorSpace /DeviceGray /BitsPerComponent 1 /Filter /CCITTFaxDecode "
+                   f"/DecodeParms << /K -1 /BlackIs1 true /Columns {width} /Rows {height} >>")
+        return entries, _g4_strip(encode_tiff_page(img))
+
+    # '1' rows are packed 1 = white, which is what DeviceGray at 1 bit means
+    colorspace = "/DeviceRGB" if img.mode == "RGB" else "/DeviceGray"
+    bits = 1 if img.mode == '1' else 8
+    entries = f"/ColorSpace {colorspace} /BitsPerComponent {bits} /Filter /FlateDecode"
+    return entries, zlib.compress(img.tobytes(), 6)
+
+
+def render_page(job):
+    """Render one label and encode it as a page. Returns (label_id, page, seconds, error)."""
+    label_id, sender_info, receiver_info, fmt, output_mode, dither = job
+    start = time.perf_counter()
+    try:
+        img = to_output_mode(render_address_label(sender_info, receiver_info), output_mode, dither)
+        with trace_stage(f"encode_page_{fmt}", image_size=img.size, mode=output_mode) as stage:
+            if fmt == "pdf":
+                page = (img.size,) + encode_pdf_image(img)
+                stage.set(bytes=len(page[2]))
+            else:
+                page = encode_tiff_page(img)
+                stage.set(bytes=len(page))
+        return label_id, page, time.perf_counter() - start, None
+    except Exception as e:
+        return label_id, None, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+
+
+def _warm_stream_worker():
+    from font_registry import warm_fonts
+    warm_fonts()
+
+
+# Writers
+
+class StreamingPdfWriter:
+    """Writes PDF pages straight to a file; only object offsets stay in memory"""
+
+    def __init__(self, path, dpi=LABEL_DPI):
+        self.path = path
+        self.scale = 72.0 / dpi
+        self.file = open(path, "wb")
+        # Object n's offset is at offsets[n - 1]; 1 and 2 are the catalog
+        # and page tree, written last
+        self.offsets = array("Q", [0, 0])
+        self.pages = 0
+        self.file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _object(self, body, stream=None):
+        self.offsets.append(self.file.tell())
+        number = len(self.offsets)
+        self.file.write(f"{number} 0 obj\n".encode("ascii"))
+        if stream is None:
+            self.file.write(body.encode("ascii") + b"\nendobj\n")
+        else:
+            self.file.write(f"<< {body} /Length {len(stream)} >>\nstream\n".encode("ascii"))
+            self.file.write(stream)
+            self.file.write(b"\nendstream\nendobj\n")
+        return number
+
+    def add_page(self, page):
+        """Append a page as returned by render_page for "pdf"; returns the bytes written"""
+        (width, height), entries, data = page
+        start = self.file.tell()
+        width_pt, height_pt = width * self.scale, height * self.scale
+
+        image = self._object(f"/Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                             f"{entries}", data)
+        content = f"q {width_pt:.3f} 0 0 {height_pt:.3f} 0 0 cm /Im0 Do Q".encode("ascii")
+        contents = self._object("", content)
+        self._object(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width_pt:.3f} {height_pt:.3f}] "
+                     f"/Resources << /XObject << /Im0 {image} 0 R >> >> /Contents {contents} 0 R >>")
+        self.pages += 1
+        return self.file.tell() - start
+
+    def close(self):
+        # Page objects are every third object from 5 on
+        self.offsets[1] = self.file.tell()
+        self.file.write(b"2 0 obj\n<< /Type /Pages /Count %d /Kids [" % self.pages)
+        for first in range(0, self.pages, 1024):
+            self.file.write(b"".join(b"%d 0 R " % (5 + 3 * index)
+                                     for index in range(first, min(first + 1024, self.pages))))
+        self.file.write(b"] >>\nendobj\n")
+
+        self.offsets[0] = self.file.tell()
+        self.file.write(b"1 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj\n")
+
+        xref = self.file.tell()
+        self.file.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(self.offsets) + 1))
+        for first in range(0, len(self.offsets), 4096):
+            self.file.write(b"".join(b"%010d 00000 n \n" % offset
+                                     for offset in self.offsets[first:first + 4096]))
+        self.file.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                        % (len(self.offsets) + 1, xref))
+        self.file.close()
+
+
+class StreamingTiffWriter:
+    """Appends single-page TIFFs to one multi-page TIFF in O(1) per page.
+
+    Each page's offsets are rebased before it is written and the previous
+    page's next-IFD pointer is patched, so nothing is re-read from disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "wb")
+        self.byte_order = None
+        self.next_ifd_pointer = None   # file offset of the last page's next-IFD field
+        self.pages = 0
+
+    def add_page(self, page):
+        """Append a page as returned by render_page for "tiff"; returns the bytes written"""
+        base = self.file.seek(0, os.SEEK_END)
+        # IFDs must start on a word boundary
+        if base % 2:
+            self.file.write(b"\0")
+            base += 1
+
+        if self.byte_order is None:
+            self.byte_order = page[:2]
+        elif page[:2] != self.byte_order:
+            raise ValueError("TIFF pages have different byte orders")
+
+        data, ifd, next_pointer = rebase_tiff_page(page, base)
+        if base + len(data) > TIFF_MAX_BYTES:
+            raise ValueError("Multi-page TIFF would pass 4 GB; split the run or write a PDF")
+
+        self.file.write(data)
+        if self.next_ifd_pointer is not None:
+            endian = "<" if self.byte_order == b"II" else ">"
+            self.file.seek(self.next_ifd_pointer)
+            self.file.write(struct.pack(endian + "L", base + ifd))
+        self.next_ifd_pointer = base + next_pointer
+        self.pages += 1
+        return len(data)
+
+    def close(self):
+        self.file.close()
+
+
+def rebase_tiff_page(data, base):
+    """Shift every offset in a single-page TIFF by base.
+
+    Returns (data, IFD offset, next-IFD field offset), offsets relative to
+    the start of data.
+    """
+    data = bytearray(data)
+    endian = "<" if data[:2] == b"II" else ">"
+    (ifd,) = struct.unpack_from(endian + "L", data, 4)
+    (count,) = struct.unpack_from(endian + "H", data, ifd)
+
+    if base:
+        struct.pack_into(endian + "L", data, 4, ifd + base)
+        for entry in range(ifd + 2, ifd + 2 + 12 * count, 12):
+            tag, field_type, values = struct.unpack_from(endian + "HHL", data, entry)
+            size = TIFF_FIELD_SIZES.get(field_type, 1) * values
+            location = entry + 8
+            if size > 4:
+                (location,) = struct.unpack_from(endian + "L", data, entry + 8)
+                struct.pack_into(endian + "L", data, entry + 8, location + base)
+
+            if tag in TIFF_OFFSET_TAGS:
+                if field_type == 3 and values == 1:
+                    # A SHORT offset can't hold base; widen it in place
+                    (offset,) = struct.unpack_from(endian + "H", data, location)
+                    struct.pack_into(endian + "HL", data, entry + 2, 4, 1)
+                    struct.pack_into(endian + "L", data, entry + 8, offset + base)
+                elif field_type == 4:
+                    fmt = f"{endian}{values}L"
+                    offsets = struct.unpack_from(fmt, data, location)
+                    struct.pack_into(fmt, data, location, *(offset + base for offset in offsets))
+                else:
+                    raise ValueError("Unsupported TIFF offset field type")
+
+    return bytes(data), ifd, ifd + 2 + 12 * count
+
+
+# Pipeline
+
+def _rendered_pages(jobs, workers):
+    """render_page() results in order, with at most a few labels in flight"""
+    if workers == 1:
+        for job in jobs:
+            yield render_page(job)
+        return
+
+    window = workers * READ_AHEAD_PER_WORKER
+    with ProcessPoolExecutor(max_workers=workers, initializer=_warm_stream_worker) as pool:
+        try:
+            pending = deque()
+            for job in jobs:
+                pending.append(pool.submit(render_page, job))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        except BaseException:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+
+def stream_labels(receivers, path, sender_info=None, fmt=None, output_mode="mono", dither=False,
+                  workers=1, progress=None):
+    """Render receivers into one multi-page file at path and return a summary dict.
+
+    receivers is any iterable of (label_id, receiver_info), e.g.
+    label_batch.iter_receivers(); it is consumed lazily. fmt is "pdf" or
+    "tiff" (default: from the extension of path). A label that fails to
+    render is skipped and listed in the summary. progress, if given, is
+    called with (label_id, nbytes, seconds, error) after each label is
+    written and may raise to stop the run; the file is still closed valid.
+    """
+    if fmt is None:
+        fmt = "tiff" if path.lower().endswith((".tif", ".tiff")) else "pdf"
+    if fmt not in STREAM_FORMATS:
+        raise ValueError(f"Unknown stream format: {fmt}")
+    if output_mode not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output mode: {output_mode}")
+
+    sender_info = list(sender_info or DEFAULT_SENDER_INFO)
+    jobs = ((label_id, sender_info, receiver_info, fmt, output_mode, dither)
+            for label_id, receiver_info in receivers)
+    writer = StreamingPdfWriter(path) if fmt == "pdf" else StreamingTiffWriter(path)
+
+    if workers == 1:
+        _warm_stream_worker()
+
+    start = time.perf_counter()
+    errors = []
+    total_bytes = 0
+    try:
+        for label_id, page, seconds, error in _rendered_pages(jobs, workers or os.cpu_count() or 1):
+            nbytes = 0
+            if error is None:
+                with trace_stage("append_page", format=fmt) as stage:
+                    nbytes = writer.add_page(page)
+                    stage.set(bytes=nbytes)
+                total_bytes += nbytes
+            else:
+                errors.append((label_id, error))
+            if progress:
+                progress(label_id, nbytes, seconds, error)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "labels": writer.pages,
+        "failed": len(errors),
+        "errors": errors,
+        "bytes": os.path.getsize(path),
+        "page_bytes": total_bytes,
+        "elapsed": elapsed,
+        "labels_per_second": writer.pages / elapsed if elapsed > 0 else 0.0,
+        "format": fmt,
+        "file": path,
+    }
+
+
+# CLI
+
+def build_parser(parser=None):
+    parser = parser or argparse.ArgumentParser(description="Stream labels into one multi-page PDF or TIFF")
+    parser.add_argument("receivers", help="CSV or JSONL file with receiver records")
+    parser.add_argument("-o", "--output", default="labels.pdf",
+                        help="Output file; .tif/.tiff writes a multi-page TIFF, otherwise PDF")
+    parser.add_argument("--mode", choices=OUTPUT_MODES, default="mono",
+                        help="mono: 1-bit G4 pages (default), gray or rgb")
+    parser.add_argument("--dither", action="store_true", help="Dither grey fills in mono mode")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="Render processes (default: 1, 0 for CPU count)")
+    parser.add_argument("--sender", help="JSON file with a 4-item sender info list")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print every label's size and time")
+    parser.add_argument("--report-every", type=int, default=DEFAULT_REPORT_EVERY,
+                        help="Print a running total every N labels")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    # label_batch pulls in the PDF backend; only needed to read receivers
+    from label_batch import _normalize_record, iter_receivers
+
+    sender_info = None
+    if args.sender:
+        with open(args.sender, encoding='utf-8') as f:
+            sender_info = _normalize_record(json.load(f))
+
+    start = time.perf_counter()
+    written = [0, 0]     # labels, bytes
+
+    def report(label_id, nbytes, seconds, error):
+        written[0] += error is None
+        written[1] += nbytes
+        if error:
+            print(f"❌ {label_id}: {error}")
+        elif args.verbose:
+            print(f"   {label_id}: {nbytes / 1024:6.1f} KB {seconds * 1000:7.1f} ms")
+        if args.report_every and written[0] and written[0] % args.report_every == 0 and not error:
+            elapsed = time.perf_counter() - start
+            print(f"📄 {written[0]} labels, {written[1] / 2**20:.1f} MB, "
+                  f"{written[0] / elapsed:.1f} labels/s")
+
+    try:
+        summary = stream_labels(iter_receivers(args.receivers), args.output, sender_info,
+                                output_mode=args.mode, dither=args.dither,
+                                workers=args.workers or None, progress=report)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        return 1
+
+    print(f"✅ Wrote {summary['labels']} labels to {summary['file']} ({summary['format']}, "
+          f"{summary['bytes'] / 2**20:.1f} MB) in {summary['elapsed']:.2f}s "
+          f"({summary['labels_per_second']:.1f} labels/s)")
+    return 1 if summary["failed"] or not summary["labels"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Crop and preview huge scans without decoding the whole image.
+
+LazyImage reads only the header when it is opened. crop() then decodes
+just the part of the file that covers the requested box:
+
+    TIFF (striped or tiled, any compression)   the strips/tiles under the box
+    PNG (not interlaced)                       the rows down to the box bottom
+    anything else                              the whole image
+
+and converts the mode after cropping, so a 16-bit or CMYK scan is never
+converted in full. Every decode is checked against a memory budget first
+and raises MemoryBudgetExceeded instead of swapping the machine to death:
+
+    IMAGETOOLS_MEMORY_BUDGET_MB=256 python app.py
+
+Usage:
+    image = LazyImage("scan.tif")
+    crop = image.crop((1000, 1000, 1401, 1401))
+    thumb = image.preview(400)
+"""
+
+import io
+import math
+import os
+import struct
+
+from PIL import Image, TiffImagePlugin, TiffTags
+
+from instrumentation import trace_stage
+
+MEMORY_BUDGET_ENV = "IMAGETOOLS_MEMORY_BUDGET_MB"
+DEFAULT_MEMORY_BUDGET_MB = 512
+
+# Extra source pixels decoded around a box that is resampled (LANCZOS
+# reaches 3 pixels out)
+RESAMPLE_MARGIN = 3
+
+# Previews of striped/tiled TIFFs are built from bands of at most this size
+PREVIEW_BAND_BYTES = 64 * 1024 * 1024
+
+# Bytes per pixel of Pillow's in-memory modes (3-band modes are padded to 4)
+PIXEL_BYTES = {"1": 1, "L": 1, "P": 1, "I;16": 2, "I;16L": 2, "I;16B": 2, "I;16N": 2}
+
+# TIFF tags
+IMAGE_WIDTH = 256
+IMAGE_LENGTH = 257
+STRIP_OFFSETS = 273
+ORIENTATION = 274
+ROWS_PER_STRIP = 278
+STRIP_BYTE_COUNTS = 279
+PLANAR_CONFIGURATION = 284
+TILE_WIDTH = 322
+TILE_LENGTH = 323
+TILE_OFFSETS = 324
+TILE_BYTE_COUNTS = 325
+
+# Tags copied into a region sub-TIFF: everything libtiff needs to decode
+# the strips/tiles, nothing that points elsewhere into the source file
+REGION_TIFF_TAGS = (
+    258, 259, 262, 266, 277, 282, 283, 284, 296, 317, 320,
+    338, 339, 347, 529, 530, 531, 532,
+)
+
+
+class MemoryBudgetExceeded(MemoryError):
+    """A decode would need more memory than the configured budget"""
+
+
+def default_memory_budget_mb():
+    """The budget from IMAGETOOLS_MEMORY_BUDGET_MB, or the default"""
+    value = os.environ.get(MEMORY_BUDGET_ENV)
+    if not value:
+        return DEFAULT_MEMORY_BUDGET_MB
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{MEMORY_BUDGET_ENV} must be a number of megabytes, got {value!r}")
+
+
+def decoded_bytes(mode, size):
+    """Memory Pillow needs to hold an image of mode and size"""
+    return size[0] * size[1] * PIXEL_BYTES.get(mode, 4)
+
+
+def open_unchecked(fp):
+    """Image.open() without Pillow's decompression-bomb limit.
+
+    The memory budget takes its place: a 1200 DPI A3 scan is over the
+    limit but crops within a few MB here, as LazyImage.check_budget()
+    runs before every decode. The format plugins are called directly, as
+    Image.open() does before its size check; like it they only read the
+    header. Image.MAX_IMAGE_PIXELS is left alone for every other caller.
+    """
+    is_path = isinstance(fp, (str, os.PathLike))
+    if is_path:
+        with open(fp, "rb") as f:
+            prefix = f.read(16)
+    else:
+        start = fp.tell()
+        prefix = fp.read(16)
+
+    Image.init()
+    for name in Image.ID:
+        factory, accept = Image.OPEN[name]
+        accepted = not accept or accept(prefix)
+        if not accepted or isinstance(accepted, str):
+            continue
+        if not is_path:
+            fp.seek(start)
+        try:
+            # Given a path, the image opens the file itself and closes it
+            return factory(fp)
+        except (SyntaxError, IndexError, TypeError, struct.error):
+            continue
+
+    # Not recognised: let Image.open() raise its usual error
+    if not is_path:
+        fp.seek(start)
+    return Image.open(fp)
+
+
+def tiff_header(tags, size, block, tiled, counts, byte_order=b"II"):
+    """Header and IFD of a TIFF whose strips/tiles follow back to back.
+
+    tags maps tag -> (value, type) for everything except the size and the
+    strip/tile layout; counts are the byte counts of the blocks in order.
+    """
+    order = "<" if byte_order == b"II" else ">"
+    header = byte_order + struct.pack(order + "HL", 42, 8)
+    ifd = TiffImagePlugin.ImageFileDirectory_v2(ifh=header)
+    for tag, (value, tagtype) in tags.items():
+        ifd[tag] = value
+        ifd.tagtype[tag] = tagtype
+    ifd[IMAGE_WIDTH], ifd[IMAGE_LENGTH] = size
+    if tiled:
+        ifd[TILE_WIDTH], ifd[TILE_LENGTH] = block
+        offsets_tag, counts_tag = TILE_OFFSETS, TILE_BYTE_COUNTS
+    else:
+        ifd[ROWS_PER_STRIP] = block[1]
+        offsets_tag, counts_tag = STRIP_OFFSETS, STRIP_BYTE_COUNTS
+    for tag in (IMAGE_WIDTH, IMAGE_LENGTH, TILE_WIDTH, TILE_LENGTH, ROWS_PER_STRIP,
+                offsets_tag, counts_tag):
+        if tag in ifd:
+            ifd.tagtype[tag] = TiffTags.LONG
+
+    offsets, position = [], 0
+    for count in counts:
+        offsets.append(position)
+        position += count
+    ifd[counts_tag] = tuple(counts)
+    if tiled:
+        # Pillow rebases StripOffsets past the IFD but writes TileOffsets
+        # as given; the IFD's length doesn't depend on the values, so lay
+        # it out once with placeholders to find where the data starts
+        ifd[offsets_tag] = tuple(0 for _ in counts)
+        data_start = len(header) + len(ifd.tobytes(len(header)))
+        offsets = [data_start + offset for offset in offsets]
+    ifd[offsets_tag] = tuple(offsets)
+
+    return header + ifd.tobytes(len(header))
+
+
+class LazyImage:
+    def __init__(self, path, memory_budget_mb=None):
+        if memory_budget_mb is None:
+            memory_budget_mb = default_memory_budget_mb()
+        self.path = path
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+
+        # Image.open() only parses the header; the file is reopened for
+        # every decode so a LazyImage holds no file handle
+        with open_unchecked(path) as image:
+            self.size = image.size
+            self.mode = image.mode
+            self.format = image.format
+            self.info = dict(image.info)
+            self._layout = self._tiff_layout(image) if image.format == "TIFF" else None
+            self._rows_only = (image.format == "PNG" and not image.info.get("interlace")
+                               and len(image.tile) == 1)
+
+    # Decode planning
+
+    def _tiff_layout(self, image):
+        """Strip/tile grid of the first page, or None if it can't be split"""
+        tags = image.tag_v2
+        if tags.get(ORIENTATION, 1) != 1:
+            return None
+
+        width, height = self.size
+        if TILE_OFFSETS in tags:
+            block = (tags[TILE_WIDTH], tags[TILE_LENGTH])
+            offsets, counts = tags[TILE_OFFSETS], tags[TILE_BYTE_COUNTS]
+        elif STRIP_OFFSETS in tags:
+            block = (width, min(tags.get(ROWS_PER_STRIP, height), height))
+            offsets, counts = tags[STRIP_OFFSETS], tags[STRIP_BYTE_COUNTS]
+        else:
+            return None
+
+        if not isinstance(offsets, tuple):
+            offsets, counts = (offsets,), (counts,)
+        grid = (math.ceil(width / block[0]), math.ceil(height / block[1]))
+        planes = len(offsets) // (grid[0] * grid[1])
+        if planes < 1 or len(offsets) != grid[0] * grid[1] * planes:
+            return None
+
+        return {
+            "tiled": TILE_OFFSETS in tags,
+            "block": block,
+            "grid": grid,
+            "planes": planes,
+            "offsets": offsets,
+            "counts": counts,
+            "tags": {tag: (tags[tag], tags.tagtype[tag]) for tag in REGION_TIFF_TAGS if tag in tags},
+            "byte_order": tags.prefix[:2],
+        }
+
+    def decode_box(self, box):
+        """The region that has to be decoded to get box"""
+        width, height = self.size
+        left, top, right, bottom = (int(math.floor(box[0])), int(math.floor(box[1])),
+                                    int(math.ceil(box[2])), int(math.ceil(box[3])))
+        left, top = max(left, 0), max(top, 0)
+        right, bottom = min(right, width), min(bottom, height)
+
+        if self._layout:
+            block_w, block_h = self._layout["block"]
+            return (left // block_w * block_w, top // block_h * block_h,
+                    min(math.ceil(right / block_w) * block_w, width),
+                    min(math.ceil(bottom / block_h) * block_h, height))
+        if self._rows_only:
+            return (0, 0, width, bottom)
+        return (0, 0, width, height)
+
+    def decode_cost(self, box):
+        """Bytes held while decoding the region that covers box"""
+        region = self.decode_box(box)
+        return decoded_bytes(self.mode, (region[2] - region[0], region[3] - region[1]))
+
+    def check_budget(self, box):
+        cost = self.decode_cost(box)
+        if cost > self.memory_budget:
+            raise MemoryBudgetExceeded(
+                f"decoding {os.path.basename(self.path)} needs {cost / 2**20:.0f} MB, "
+                f"over the {self.memory_budget / 2**20:.0f} MB budget "
+                f"(set {MEMORY_BUDGET_ENV} to raise it)")
+
+    # Decoding
+
+    def _region_tiff(self, region):
+        """A standalone TIFF holding only the strips/tiles of region"""
+        layout = self._layout
+        block_w, block_h = layout["block"]
+        across, down = layout["grid"]
+        columns = range(region[0] // block_w, math.ceil(region[2] / block_w))
+        rows = range(region[1] // block_h, math.ceil(region[3] / block_h))
+        indices = [plane * across * down + row * across + column
+                   for plane in range(layout["planes"]) for row in rows for column in columns]
+
+        counts = [layout["counts"][index] for index in indices]
+        out = io.BytesIO()
+        out.write(tiff_header(layout["tags"], (region[2] - region[0], region[3] - region[1]),
+                              layout["block"], layout["tiled"], counts, layout["byte_order"]))
+        with open(self.path, "rb") as f:
+            for index, count in zip(indices, counts):
+                f.seek(layout["offsets"][index])
+                out.write(f.read(count))
+        out.seek(0)
+        return out
+
+    def decode(self, box):
+        """Decode the region covering box; returns (image, region)"""
+        self.check_budget(box)
+        region = self.decode_box(box)
+        size = (region[2] - region[0], region[3] - region[1])
+
+        with trace_stage("decode_region", source_size=self.size, image_size=size,
+                         format=self.format) as stage:
+            if self._layout:
+                image = open_unchecked(self._region_tiff(region))
+                image.load()
+            elif self._rows_only:
+                image = open_unchecked(self.path)
+                # Decode only the first rows; the decoder stops once the
+                # (shortened) tile is full
+                codec, _, offset, args = image.tile[0]
+                image._size = size
+                image.tile = [(codec, (0, 0) + size, offset, args)]
+                image.load()
+            else:
+                image = open_unchecked(self.path)
+                image.load()
+            stage.set(bytes=decoded_bytes(image.mode, image.size))
+
+        return image, region
+
+    def crop(self, box, mode="RGB"):
+        """Decode box (integer pixels) and convert it to mode"""
+        image, region = self.decode(box)
+        shifted = (box[0] - region[0], box[1] - region[1], box[2] - region[0], box[3] - region[1])
+        cropped = image.crop(shifted)
+        if mode and cropped.mode != mode:
+            cropped = cropped.convert(mode)
+        return cropped
+
+    def resize(self, size, resample=Image.Resampling.LANCZOS, box=None, mode="RGB"):
+        """Image.resize() of box, decoding only box plus the filter margin"""
+        if box is None:
+            box = (0, 0) + self.size
+        margin_box = (box[0] - RESAMPLE_MARGIN, box[1] - RESAMPLE_MARGIN,
+                      box[2] + RESAMPLE_MARGIN, box[3] + RESAMPLE_MARGIN)
+        image, region = self.decode(margin_box)
+        # The resampling filters need a real colour mode; convert the
+        # (small) decoded region rather than the source
+        if mode and image.mode != mode:
+            image = image.convert(mode)
+        shifted = (box[0] - region[0], box[1] - region[1], box[2] - region[0], box[3] - region[1])
+        return image.resize(size, resample, box=shifted)
+
+    def preview(self, max_size=400, mode="RGB"):
+        """A max_size thumbnail, decoded band by band for striped/tiled TIFFs"""
+        width, height = self.size
+        ratio = min(max_size / width, max_size / height, 1)
+        preview_size = (max(1, int(width * ratio)), max(1, int(height * ratio)))
+
+        if self.format == "JPEG":
+            # DCT scaling decodes at 1/2..1/8 size straight away
+            with open_unchecked(self.path) as image:
+                image.draft(mode, preview_size)
+                return image.convert(mode).resize(preview_size, Image.Resampling.LANCZOS)
+
+        if not self._layout:
+            image, _ = self.decode((0, 0, width, height))
+            if image.mode != mode:
+                image = image.convert(mode)
+            return image.resize(preview_size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+        # Bands of preview rows, each decoded from the source rows it covers
+        block_h = self._layout["block"][1]
+        row_bytes = decoded_bytes(self.mode, (width, block_h))
+        source_rows = block_h * max(1, min(PREVIEW_BAND_BYTES, self.memory_budget) // row_bytes)
+        band_rows = max(1, int(source_rows * ratio))
+
+        preview = Image.new(mode, preview_size)
+        for y0 in range(0, preview_size[1], band_rows):
+            y1 = min(y0 + band_rows, preview_size[1])
+            box = (0, y0 / ratio, width, min(y1 / ratio, height))
+            band, region = self.decode(box)
+            if band.mode != mode:
+                band = band.convert(mode)
+            band = band.resize((preview_size[0], y1 - y0), Image.Resampling.BOX,
+                               box=(0, box[1] - region[1], width, box[3] - region[1]))
+            preview.paste(band, (0, y0))
+        return preview
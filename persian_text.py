@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Persian/Arabic shaping for PIL with an LRU cache.
+
+Labels repeat the same strings constantly (section titles, field prefixes,
+city and street names), so reshaping + BiDi reordering results are memoized.
+"""
+
+import re
+from functools import lru_cache
+
+# arabic_reshaper and python-bidi are imported on first use (see _load_bidi);
+# together they add ~50 ms to application startup. None means "not tried yet".
+BIDI_AVAILABLE = None
+arabic_reshaper = None
+get_display = None
+
+SHAPING_CACHE_SIZE = 4096
+
+_ARABIC_RE = re.compile('[\u0600-\u06FF]')
+
+# Search normalisation: Persian and Arabic-Indic digits become ASCII, Arabic
+# letter variants become their Persian forms, diacritics and tatweel go, and
+# ZWNJ becomes a space ("می‌رود" and "می رود" match)
+_SEARCH_TABLE = str.maketrans({
+    **{chr(0x06F0 + digit): str(digit) for digit in range(10)},
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},
+    "\u064A": "\u06CC", "\u0649": "\u06CC", "\u0626": "\u06CC",    # ي ى ئ -> ی
+    "\u0643": "\u06A9",                                            # ك -> ک
+    "\u0629": "\u0647", "\u06C0": "\u0647", "\u06BE": "\u0647",    # ة ۀ ھ -> ه
+    "\u0623": "\u0627", "\u0625": "\u0627", "\u0622": "\u0627", "\u0671": "\u0627",  # أ إ آ ٱ -> ا
+    "\u0624": "\u0648",                                            # ؤ -> و
+    "\u200C": " ",
+    "\u0640": None,
+    **{chr(code): None for code in range(0x064B, 0x0660)},
+    "\u0670": None,
+})
+
+
+def _reverse_if_arabic(text):
+    return text[::-1] if _ARABIC_RE.search(text) else text
+
+
+def _load_bidi():
+    """Import the shaping libraries once, with fallback; return availability"""
+    global BIDI_AVAILABLE, arabic_reshaper, get_display
+
+    if BIDI_AVAILABLE is None:
+        try:
+            from arabic_reshaper import arabic_reshaper as reshaper
+            from bidi.algorithm import get_display as display
+        except ImportError:
+            BIDI_AVAILABLE = False
+        else:
+            arabic_reshaper, get_display = reshaper, display
+            BIDI_AVAILABLE = True
+
+    return BIDI_AVAILABLE
+
+
+@lru_cache(maxsize=SHAPING_CACHE_SIZE)
+def _shape(text):
+    if not _load_bidi():
+        # Simple fallback - reverse Persian text
+        return _reverse_if_arabic(text)
+
+    try:
+        reshaped_text = arabic_reshaper.reshape(text)
+        bidi_text = get_display(reshaped_text)
+        return bidi_text
+    except Exception:
+        return _reverse_if_arabic(text)
+
+
+def fix_persian_text(text):
+    """Fix Persian/Arabic text for proper display in PIL"""
+    if not text or not text.strip():
+        return text
+
+    return _shape(text)
+
+
+def fix_persian_texts(texts):
+    """Shape many strings at once, in order.
+
+    Each distinct string is shaped only once, so repeated city and street
+    names in a batch cost a single reshape.
+    """
+    shaped = {text: fix_persian_text(text) for text in dict.fromkeys(texts)}
+    return [shaped[text] for text in texts]
+
+
+def normalize_persian(text):
+    """Fold digit and letter variants so equivalent Persian/Arabic spellings compare equal"""
+    return text.translate(_SEARCH_TABLE).casefold() if text else ""
+
+
+def shaping_stats():
+    """Return hit/miss counters and hit rate of the shaping cache"""
+    info = _shape.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "cached": info.currsize,
+        "maxsize": info.maxsize,
+        "hit_rate": info.hits / lookups if lookups else 0.0,
+    }
+
+
+def clear_shaping_cache():
+    """Drop all memoized shaping results"""
+    _shape.cache_clear()
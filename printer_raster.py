@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Send labels straight to thermal printers as raster commands.
+
+Usage:
+    python printer_raster.py send receivers.csv --language zpl --target tcp://192.168.1.50:9100
+    python printer_raster.py send receivers.csv --language escpos --target /dev/usb/lp0
+    python printer_raster.py send receivers.csv --language tspl --target - > job.prn
+    python printer_raster.py send receivers.csv --language zpl --dpi 203 --width-dots 812 -t job.zpl
+    python printer_raster.py listen --port 9100 -o received.prn     # fake printer
+
+Labels are rendered to 1-bit bitmaps and packed into ESC/POS `GS v 0`,
+ZPL `^GF` (ASCII run-length or Z64 compressed) or TSPL `BITMAP` commands,
+skipping PNG/PDF and the printer driver entirely. With no driver to scale
+the output, --dpi resamples the 300 DPI render to the printer's resolution
+and --width-dots shrinks it to fit the print head. A batch is streamed over
+a single connection; the next label is rendered while the previous one is
+being sent. Encoded labels are kept in the render cache, so reprints are
+sent without rendering (--no-cache to bypass it).
+"""
+
+import argparse
+import base64
+import binascii
+import json
+import re
+import socket
+import struct
+import sys
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from instrumentation import trace_stage
+from label_renderer import (DEFAULT_SENDER_INFO, LABEL_DPI, LABEL_HEIGHT, LABEL_WIDTH,
+                            render_address_label, to_output_mode)
+
+LANGUAGES = ("zpl", "escpos", "tspl")
+ZPL_COMPRESSIONS = ("acs", "z64", "none")
+
+DEFAULT_PORT = 9100
+DEFAULT_TIMEOUT = 10.0
+
+# ESC/POS printers buffer a limited number of raster rows per command
+ESCPOS_BAND_ROWS = 256
+# Gap between die-cut labels for TSPL printers
+TSPL_GAP_MM = 2
+
+# Byte sequences that end one label in each language (for the fake printer);
+# ESC/POS raster data can contain any bytes, see count_escpos_labels
+LABEL_MARKERS = {
+    "zpl": b"^XZ",
+    "tspl": b"\r\nPRINT ",
+}
+
+_INVERT = bytes(255 - value for value in range(256))
+_ZPL_RUN = re.compile(r"(.)\1+")
+
+
+# Bitmaps
+
+def pad_to_bytes(img):
+    """Pad a '1' image on the right with white to a whole number of bytes per row"""
+    width = (img.width + 7) // 8 * 8
+    if width == img.width:
+        return img
+    padded = Image.new('1', (width, img.height), 1)
+    padded.paste(img, (0, 0))
+    return padded
+
+
+def raster_size(dpi=None, width_dots=None):
+    """(width, height) in dots of a label for a dpi printer whose head is width_dots wide"""
+    scale = (dpi or LABEL_DPI) / LABEL_DPI
+    if width_dots:
+        # Whole bytes per row, so padding never goes past the head
+        width_dots -= width_dots % 8
+        scale = min(scale, width_dots / LABEL_WIDTH)
+    return round(LABEL_WIDTH * scale), round(LABEL_HEIGHT * scale)
+
+
+def label_bitmap(sender_info, receiver_info, dither=False, dpi=None, width_dots=None):
+    """Render a label as a byte-aligned 1-bit image sized by raster_size(dpi, width_dots)"""
+    img = render_address_label(sender_info, receiver_info)
+    size = raster_size(dpi, width_dots)
+    if img.size != size:
+        # Resampled in grey, before thresholding, so strokes keep their weight
+        img = img.resize(size, Image.Resampling.LANCZOS)
+    return pad_to_bytes(to_output_mode(img, "mono", dither))
+
+
+def packed_rows(img, black_is_one=True):
+    """Return (bytes_per_row, packed data) of a byte-aligned '1' image.
+
+    PIL packs white as 1; ESC/POS and ZPL want 1 for a printed (black) dot.
+    """
+    data = img.tobytes()
+    if black_is_one:
+        data = data.translate(_INVERT)
+    return img.width // 8, data
+
+
+# Encoders: each returns the bytes for one label
+
+def encode_escpos(img, cut=True):
+    """ESC/POS GS v 0 raster bands, then feed and (partial) cut"""
+    width_bytes, data = packed_rows(img, black_is_one=True)
+
+    out = bytearray()
+    for top in range(0, img.height, ESCPOS_BAND_ROWS):
+        rows = min(ESCPOS_BAND_ROWS, img.height - top)
+        out += b"\x1dv0\x00" + struct.pack("<HH", width_bytes, rows)
+        out += data[top * width_bytes:(top + rows) * width_bytes]
+
+    out += b"\x1bd\x03"
+    if cut:
+        out += b"\x1dV\x01"
+    return bytes(out)
+
+
+def _zpl_count(count):
+    """ZPL repeat count: G-Y are 1-19, g-z are 20-400"""
+    letters = []
+    while count >= 400:
+        letters.append('z')
+        count -= 400
+    if count >= 20:
+        letters.append(chr(ord('f') + count // 20))
+        count %= 20
+    if count:
+        letters.append(chr(ord('F') + count))
+    return "".join(letters)
+
+
+def _zpl_run(match):
+    run = match.group()
+    return _zpl_count(len(run)) + run[0]
+
+
+def zpl_compress(data, width_bytes):
+    """ZPL ASCII compressed hex (ACS) for packed rows.
+
+    Runs of a hex digit get a repeat count, ',' fills the rest of a row
+    with 0, '!' with F, and ':' repeats the previous row.
+    """
+    rows = []
+    previous = None
+
+    for start in range(0, len(data), width_bytes):
+        row = data[start:start + width_bytes]
+        if row == previous:
+            rows.append(":")
+            continue
+        previous = row
+
+        hex_row = row.hex().upper()
+        body = hex_row.rstrip("0")
+        tail = "," if len(body) < len(hex_row) else ""
+        if not tail:
+            body = hex_row.rstrip("F")
+            tail = "!" if len(body) < len(hex_row) else ""
+
+        rows.append(_ZPL_RUN.sub(_zpl_run, body) + tail)
+
+    return "".join(rows)
+
+
+def encode_zpl(img, compression="acs"):
+    """ZPL ^GF graphic field in a complete ^XA ... ^XZ label"""
+    width_bytes, data = packed_rows(img, black_is_one=True)
+    total = len(data)
+
+    if compression == "acs":
+        field = zpl_compress(data, width_bytes)
+    elif compression == "z64":
+        encoded = base64.b64encode(zlib.compress(data)).decode('ascii')
+        field = f":Z64:{encoded}:{binascii.crc_hqx(encoded.encode('ascii'), 0):04X}"
+    elif compression == "none":
+        field = data.hex().upper()
+    else:
+        raise ValueError(f"Unknown ZPL compression: {compression}")
+
+    return (f"^XA^PW{img.width}^LL{img.height}^FO0,0"
+            f"^GFA,{total},{total},{width_bytes},{field}^FS^XZ\n").encode('ascii')
+
+
+def encode_tspl(img):
+    """TSPL BITMAP in overwrite mode followed by PRINT"""
+    # TSPL prints 0 bits, the same polarity as PIL
+    width_bytes, data = packed_rows(img, black_is_one=False)
+    header = f"CLS\r\nBITMAP 0,0,{width_bytes},{img.height},0,".encode('ascii')
+    return header + data + b"\r\nPRINT 1,1\r\n"
+
+
+def stream_preamble(language, dpi=None, width_dots=None):
+    """Bytes sent once at the start of a connection"""
+    if language == "escpos":
+        return b"\x1b@"
+    if language == "tspl":
+        width, height = raster_size(dpi, width_dots)
+        width_mm = width * 25.4 / (dpi or LABEL_DPI)
+        height_mm = height * 25.4 / (dpi or LABEL_DPI)
+        return (f"SIZE {width_mm:.1f} mm,{height_mm:.1f} mm\r\n"
+                f"GAP {TSPL_GAP_MM} mm,0 mm\r\nDIRECTION 0\r\n").encode('ascii')
+    return b""
+
+
+def encode_label(img, language="zpl", zpl_compression="acs", cut=True):
+    """Encode a byte-aligned '1' label image for language"""
+    if language == "zpl":
+        return encode_zpl(img, zpl_compression)
+    if language == "escpos":
+        return encode_escpos(img, cut)
+    if language == "tspl":
+        return encode_tspl(img)
+    raise ValueError(f"Unknown printer language: {language}")
+
+
+# Output targets
+
+class PrinterConnection:
+    """Byte sink for a file or device path, '-' (stdout) or tcp://host[:port]"""
+
+    def __init__(self, target, timeout=DEFAULT_TIMEOUT):
+        self.target = target
+        self.bytes_written = 0
+        self._sock = None
+        self._file = None
+
+        if target.startswith("tcp://"):
+            host, _, port = target[len("tcp://"):].rpartition(":")
+            if not host:
+                host, port = port, DEFAULT_PORT
+            self._sock = socket.create_connection((host, int(port)), timeout=timeout)
+        elif target == "-":
+            self._file = sys.stdout.buffer
+        else:
+            self._file = open(target, "wb")
+
+    def write(self, data):
+        if self._sock is not None:
+            self._sock.sendall(data)
+        else:
+            self._file.write(data)
+        self.bytes_written += len(data)
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+            self._sock.close()
+            self._sock = None
+        elif self._file is not None:
+            self._file.flush()
+            if self._file is not sys.stdout.buffer:
+                self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def raster_cache_options(language, dither, zpl_compression, cut, dpi=None, width_dots=None):
+    """The encode options that change a label's bytes in language"""
+    options = {"language": language, "dither": dither}
+    if language == "zpl":
+        options["zpl_compression"] = zpl_compression
+    elif language == "escpos":
+        options["cut"] = cut
+    size = raster_size(dpi, width_dots)
+    if size != (LABEL_WIDTH, LABEL_HEIGHT):
+        options["size"] = list(size)
+    return options
+
+
+def raster_label(sender_info, receiver_info, language="zpl", dither=False, zpl_compression="acs",
+                 cut=True, cache=None, dpi=None, width_dots=None):
+    """One label's printer bytes in language, from cache when possible; returns (data, hit)"""
+    options = raster_cache_options(language, dither, zpl_compression, cut, dpi, width_dots)
+    with trace_stage(f"raster_{language}") as stage:
+        data = None
+        if cache is not None:
+            key = cache.key("raster", sender_info, receiver_info, **options)
+            data = cache.get(key, "." + language)
+        hit = data is not None
+        if not hit:
+            img = label_bitmap(sender_info, receiver_info, dither, dpi, width_dots)
+            data = encode_label(img, language, zpl_compression, cut)
+            stage.set(image_size=img.size)
+            if cache is not None:
+                cache.put(key, "." + language, data)
+        stage.set(bytes=len(data), cached=hit)
+    return data, hit
+
+
+def print_labels(receivers, target, language="zpl", sender_info=None, dither=False,
+                 zpl_compression="acs", cut=True, progress=None, cache=None, dpi=None,
+                 width_dots=None):
+    """Render receivers and stream them to target over one connection.
+
+    receivers is a list of (label_id, receiver_info) as returned by
+    label_batch.read_receivers. Rendering the next label overlaps with
+    sending the previous one; at most one encoded label waits in memory.
+    progress, if given, is called with (label_id, nbytes) after each label
+    is encoded. With a render_cache.RenderCache, labels encoded before are
+    sent from the cache. dpi and width_dots size the bitmap for the
+    printer (see raster_size). Returns a summary dict.
+    """
+    sender_info = list(sender_info or DEFAULT_SENDER_INFO)
+    start = time.perf_counter()
+    count = cached = 0
+
+    with PrinterConnection(target) as printer, ThreadPoolExecutor(max_workers=1) as sender:
+        pending = sender.submit(printer.write, stream_preamble(language, dpi, width_dots))
+
+        for label_id, receiver_info in receivers:
+            data, hit = raster_label(sender_info, receiver_info, language, dither,
+                                     zpl_compression, cut, cache, dpi, width_dots)
+            cached += hit
+
+            # Surfaces send errors and keeps one label in flight
+            pending.result()
+            pending = sender.submit(printer.write, data)
+            count += 1
+            if progress:
+                progress(label_id, len(data))
+
+        pending.result()
+        bytes_written = printer.bytes_written
+
+    elapsed = time.perf_counter() - start
+    return {
+        "labels": count,
+        "cached": cached,
+        "bytes": bytes_written,
+        "elapsed": elapsed,
+        "labels_per_second": count / elapsed if elapsed else 0.0,
+        "language": language,
+        "target": target,
+        "size": raster_size(dpi, width_dots),
+    }
+
+
+# Fake printer
+
+def serve_fake_printer(host="127.0.0.1", port=DEFAULT_PORT, output=None, once=False, ready=None):
+    """Accept raw print jobs like a port 9100 printer and report what arrived.
+
+    Received bytes are appended to output when given. ready, if given, is
+    called with the bound (host, port) once the socket listens. Returns the
+    stats of the last job when once is true.
+    """
+    with socket.create_server((host, port)) as server:
+        if ready:
+            ready(server.getsockname()[:2])
+        else:
+            print(f"🖨️ Fake printer listening on {host}:{server.getsockname()[1]}")
+
+        while True:
+            conn, address = server.accept()
+            start = time.perf_counter()
+            chunks = []
+            total = 0
+
+            with conn, (open(output, "ab") if output else _NullFile()) as sink:
+                while True:
+                    chunk = conn.recv(65536)
+                    if not chunk:
+                        break
+                    total += len(chunk)
+                    chunks.append(chunk)
+                    sink.write(chunk)
+
+            received = b"".join(chunks)
+            stats = {"peer": address[0], "bytes": total,
+                     "seconds": time.perf_counter() - start,
+                     "labels": count_labels(received)}
+            if not ready:
+                found = ", ".join(f"{n} {language}" for language, n in stats["labels"].items() if n)
+                print(f"📥 {stats['peer']}: {total} bytes in {stats['seconds']:.2f}s "
+                      f"({found or 'no labels'})")
+            if once:
+                return stats
+
+
+def count_escpos_labels(data):
+    """Labels in an ESC/POS job: the feeds that follow raster bands, skipping band data"""
+    count = 0
+    i = 0
+    while i < len(data):
+        if data.startswith(b"\x1dv0", i) and i + 8 <= len(data):
+            width_bytes, rows = struct.unpack_from("<HH", data, i + 4)
+            i += 8 + width_bytes * rows
+        elif data.startswith(b"\x1bd", i):
+            count += 1
+            i += 3
+        else:
+            i += 1
+    return count
+
+
+def count_labels(data):
+    """Labels per language found in bytes received by the fake printer"""
+    labels = {language: data.count(marker) for language, marker in LABEL_MARKERS.items()}
+    labels["escpos"] = count_escpos_labels(data)
+    return labels
+
+
+class _NullFile:
+    def write(self, data):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+# CLI
+
+def build_parser(parser=None):
+    parser = parser or argparse.ArgumentParser(description="Raster labels for thermal printers")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    send = commands.add_parser("send", help="Render receivers and send them to a printer")
+    send.add_argument("receivers", help="CSV or JSONL file with receiver records")
+    send.add_argument("-l", "--language", choices=LANGUAGES, default="zpl")
+    send.add_argument("-t", "--target", default="-",
+                      help="tcp://host[:port], a file or device path, or - for stdout")
+    send.add_argument("--zpl-compression", choices=ZPL_COMPRESSIONS, default="acs",
+                      help="acs (run-length hex, any ZPL II printer), z64 (zlib) or none")
+    send.add_argument("--dither", action="store_true", help="Dither grey fills instead of thresholding")
+    send.add_argument("--no-cut", action="store_true", help="ESC/POS: do not cut after each label")
+    send.add_argument("--dpi", type=int, default=None,
+                      help=f"Printer resolution, e.g. 203 (default: {LABEL_DPI}, the render's own)")
+    send.add_argument("--width-dots", type=int, default=None,
+                      help="Print head width in dots (e.g. 812 for 4-inch 203 DPI, 576 for 80 mm "
+                           "ESC/POS); wider labels are scaled down to fit")
+    send.add_argument("--sender", help="JSON file with a 4-item sender info list")
+    send.add_argument("--no-cache", action="store_true",
+                      help="Render every label instead of reusing cached raster data")
+
+    listen = commands.add_parser("listen", help="Run a fake network printer for testing")
+    listen.add_argument("--host", default="127.0.0.1")
+    listen.add_argument("--port", type=int, default=DEFAULT_PORT)
+    listen.add_argument("-o", "--output", help="Append received bytes to this file")
+    listen.add_argument("--once", action="store_true", help="Exit after the first job")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.command == "listen":
+        serve_fake_printer(args.host, args.port, args.output, args.once)
+        return 0
+
+    # label_batch pulls in the PDF backend; only needed to read receivers
+    from label_batch import _normalize_record, read_receivers
+    from render_cache import default_cache
+
+    sender_info = None
+    if args.sender:
+        with open(args.sender, encoding='utf-8') as f:
+            sender_info = _normalize_record(json.load(f))
+
+    receivers = read_receivers(args.receivers)
+    if not receivers:
+        print(f"❌ No receivers found in {args.receivers}", file=sys.stderr)
+        return 1
+
+    try:
+        summary = print_labels(receivers, args.target, args.language, sender_info,
+                               dither=args.dither, zpl_compression=args.zpl_compression,
+                               cut=not args.no_cut,
+                               cache=None if args.no_cache else default_cache(),
+                               dpi=args.dpi, width_dots=args.width_dots)
+    except OSError as e:
+        print(f"❌ {args.target}: {e}", file=sys.stderr)
+        return 1
+
+    # stdout may be carrying the print job itself
+    width, height = summary["size"]
+    print(f"✅ Sent {summary['labels']} {summary['language']} label(s) of {width}x{height} dots, "
+          f"{summary['bytes']} bytes in {summary['elapsed']:.2f}s "
+          f"({summary['labels_per_second']:.1f} labels/s, {summary['cached']} from cache)",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
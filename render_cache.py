@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Content-addressed disk cache for finished label files.
+
+Reprints of the same receiver skip rendering and encoding: PNG, TIFF, PDF
+and printer raster bytes are stored under a hash of everything that
+determines them (sender, receiver, output options, the font file and
+label_renderer.LAYOUT_VERSION) and copied straight out of the cache.
+The cache is bounded in size; the least recently used entries go first.
+
+    IMAGETOOLS_CACHE_DIR=/path      cache location (default: the user cache dir)
+    IMAGETOOLS_CACHE_MB=256         size bound
+    IMAGETOOLS_NO_CACHE=1           bypass the cache everywhere
+
+Usage:
+    python app.py cache stats
+    python app.py cache prune --max-mb 64
+    python app.py cache clear
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+
+from font_registry import font_digest
+from label_renderer import LAYOUT_VERSION
+
+CACHE_DIR_ENV = "IMAGETOOLS_CACHE_DIR"
+CACHE_MB_ENV = "IMAGETOOLS_CACHE_MB"
+NO_CACHE_ENV = "IMAGETOOLS_NO_CACHE"
+DEFAULT_CACHE_MB = 256
+
+# A prune frees down to this fraction of the bound so the next few stores
+# don't each trigger another directory scan
+PRUNE_TARGET = 0.9
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def default_cache_dir():
+    if os.environ.get(CACHE_DIR_ENV):
+        return os.environ[CACHE_DIR_ENV]
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "imagetools", "labels")
+
+
+def default_max_bytes():
+    value = os.environ.get(CACHE_MB_ENV)
+    return int(float(value) * 1024 * 1024) if value else DEFAULT_CACHE_MB * 1024 * 1024
+
+
+def cache_disabled():
+    return os.environ.get(NO_CACHE_ENV, "") not in ("", "0")
+
+
+class RenderCache:
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = default_max_bytes() if max_bytes is None else max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size = None    # bytes on disk, scanned on the first store
+
+    # Keys and lookups
+
+    def key(self, kind, sender_info, receiver_info, **options):
+        """Hex digest identifying one output file"""
+        payload = json.dumps({
+            "kind": kind,
+            "layout": LAYOUT_VERSION,
+            "font": font_digest(),
+            "sender": list(sender_info),
+            "receiver": list(receiver_info),
+            "options": options,
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def path(self, key, ext):
+        return os.path.join(self.directory, key[:2], key + ext)
+
+    def _record(self, hit, path):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if hit:
+            # mtime is the LRU clock; atime is often not updated
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+    def get(self, key, ext):
+        """Cached bytes for key, or None"""
+        path = self.path(key, ext)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            self._record(False, path)
+            return None
+        self._record(True, path)
+        return data
+
+    def fetch(self, key, ext, dest):
+        """Copy the cached file for key to dest; False on a miss"""
+        path = self.path(key, ext)
+        try:
+            shutil.copyfile(path, dest)
+        except FileNotFoundError:
+            self._record(False, path)
+            return False
+        self._record(True, path)
+        return True
+
+    # Stores
+
+    def _write(self, key, ext, write):
+        path = self.path(key, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Batch workers may store the same key at once; the rename is atomic
+        temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            write(temp)
+            size = os.path.getsize(temp)
+            os.replace(temp, path)
+        except OSError:
+            # A full or read-only cache must never fail a render
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+            return
+        self._grow(size)
+
+    def put(self, key, ext, data):
+        """Store bytes under key"""
+        def write(temp):
+            with open(temp, "wb") as f:
+                f.write(data)
+        self._write(key, ext, write)
+
+    def store(self, key, ext, source):
+        """Store a copy of the file at source under key"""
+        self._write(key, ext, lambda temp: shutil.copyfile(source, temp))
+
+    def _grow(self, nbytes):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self.entries())
+            else:
+                self._size += nbytes
+            over = self._size > self.max_bytes
+        if over:
+            self.prune()
+
+    # Inspection and eviction
+
+    def entries(self):
+        """(path, size, mtime) of every entry"""
+        try:
+            shards = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return []
+
+        found = []
+        for shard in shards:
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                found.append((entry.path, stat.st_size, stat.st_mtime))
+        return found
+
+    def prune(self, max_bytes=None):
+        """Evict least recently used entries until the cache fits; returns (files, bytes) removed"""
+        if max_bytes is None:
+            max_bytes = int(self.max_bytes * PRUNE_TARGET)
+
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        removed = freed = 0
+        for path, size, _ in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+            freed += size
+
+        with self._lock:
+            self._size = total
+        return removed, freed
+
+    def clear(self):
+        return self.prune(0)
+
+    def stats(self):
+        entries = self.entries()
+        by_type = {}
+        for path, size, _ in entries:
+            ext = os.path.splitext(path)[1] or "(none)"
+            count, nbytes = by_type.get(ext, (0, 0))
+            by_type[ext] = (count + 1, nbytes + size)
+        mtimes = [mtime for _, _, mtime in entries]
+        return {
+            "directory": self.directory,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "by_type": by_type,
+            "oldest": min(mtimes) if mtimes else None,
+            "newest": max(mtimes) if mtimes else None,
+        }
+
+
+def default_cache():
+    """The process-wide cache, or None when IMAGETOOLS_NO_CACHE is set"""
+    global _default_cache
+
+    if cache_disabled():
+        return None
+    if _default_cache is None:
+        with _default_lock:
+            if _default_cache is None:
+                _default_cache = RenderCache()
+    return _default_cache
+
+
+def cache_counters():
+    """Hits and misses of this process's default cache"""
+    cache = _default_cache
+    if cache is None:
+        return {"hits": 0, "misses": 0}
+    with cache._lock:
+        return {"hits": cache.hits, "misses": cache.misses}
+
+
+# CLI
+
+def _format_time(timestamp):
+    if timestamp is None:
+        return "-"
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(timestamp))
+
+
+def build_parser(parser=None):
+    parser = parser or argparse.ArgumentParser(description="Inspect or prune the label render cache")
+    parser.add_argument("--dir", help=f"Cache directory (default: ${CACHE_DIR_ENV} or the user cache dir)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="Show entries and size")
+    prune = commands.add_parser("prune", help="Evict least recently used entries")
+    prune.add_argument("--max-mb", type=float, default=None,
+                       help="Shrink to this size (default: the configured bound)")
+    commands.add_parser("clear", help="Remove every entry")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    cache = RenderCache(args.dir)
+
+    if args.command == "stats":
+        stats = cache.stats()
+        print(f"📊 {stats['directory']}")
+        print(f"   {stats['entries']} entries, {stats['bytes'] / 2**20:.1f} MB "
+              f"of {stats['max_bytes'] / 2**20:.0f} MB")
+        for ext, (count, nbytes) in sorted(stats["by_type"].items()):
+            print(f"   {ext:<8} {count:6d} files {nbytes / 2**20:8.1f} MB")
+        print(f"   oldest {_format_time(stats['oldest'])}, newest {_format_time(stats['newest'])}")
+        return 0
+
+    if args.command == "prune":
+        max_bytes = cache.max_bytes if args.max_mb is None else int(args.max_mb * 1024 * 1024)
+        removed, freed = cache.prune(max_bytes)
+    else:
+        removed, freed = cache.clear()
+    print(f"✅ Removed {removed} entries ({freed / 2**20:.1f} MB) from {cache.directory}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Startup timing for `app.py --startup-profile`.
+
+install() wraps the import statement so every import that loads new
+modules is timed (inclusive of what it pulls in), and mark() records
+milestones such as "window built" and "first paint". report() prints the
+milestones and the slowest imports and writes them to startup_profile.json.
+
+Times are measured from the moment this module is imported, which app.py
+does before any other import.
+"""
+
+import builtins
+import json
+import sys
+import threading
+import time
+
+REPORT_FILENAME = "startup_profile.json"
+SLOWEST_IMPORTS = 15
+
+START = time.perf_counter()
+
+_lock = threading.Lock()
+_local = threading.local()
+_imports = []     # (module, seconds, nesting depth, thread name)
+_marks = []       # (milestone, seconds since START)
+_original_import = None
+
+
+def _elapsed():
+    return time.perf_counter() - START
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    depth = getattr(_local, "depth", 0)
+    before = len(sys.modules)
+    _local.depth = depth + 1
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        _local.depth = depth
+        if len(sys.modules) > before:
+            seconds = time.perf_counter() - start
+            label = name
+            if level:
+                # "from . import x" inside a package: report the package
+                package = (globals or {}).get("__package__") or ""
+                label = ".".join(part for part in (package, name) if part)
+            with _lock:
+                _imports.append((label, seconds, depth, threading.current_thread().name))
+
+
+def install():
+    """Start timing imports; safe to call more than once"""
+    global _original_import
+
+    if _original_import is None:
+        _original_import = builtins.__import__
+        builtins.__import__ = _timed_import
+
+
+def uninstall():
+    global _original_import
+
+    if _original_import is not None:
+        builtins.__import__ = _original_import
+        _original_import = None
+
+
+def mark(milestone):
+    """Record a milestone at the current time (first occurrence wins)"""
+    with _lock:
+        if all(name != milestone for name, _ in _marks):
+            _marks.append((milestone, _elapsed()))
+
+
+def watch_first_paint(app, on_painted=None):
+    """Mark "first paint" when any widget receives its first paint event"""
+    from PyQt6.QtCore import QEvent, QObject
+
+    class FirstPaintFilter(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Type.Paint:
+                mark("first paint")
+                app.removeEventFilter(self)
+                if on_painted:
+                    on_painted()
+            return False
+
+    paint_filter = FirstPaintFilter(app)
+    app.installEventFilter(paint_filter)
+    return paint_filter
+
+
+def profile_data():
+    """Milestones and top-level imports, slowest first"""
+    with _lock:
+        marks = list(_marks)
+        imports = [entry for entry in _imports if entry[2] == 0]
+
+    imports.sort(key=lambda entry: entry[1], reverse=True)
+    return {
+        "milestones_ms": {name: round(seconds * 1000, 1) for name, seconds in marks},
+        "imports_ms": [
+            {"module": module, "ms": round(seconds * 1000, 1), "thread": thread}
+            for module, seconds, _, thread in imports
+        ],
+        "frozen": bool(getattr(sys, "frozen", False)),
+        "python": sys.version.split()[0],
+    }
+
+
+def report(path=REPORT_FILENAME):
+    """Print the profile (when there is a console) and write it as JSON"""
+    data = profile_data()
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+    # Windowed PyInstaller builds have no stdout
+    if sys.stdout is None:
+        return data
+
+    print("⏱️ Startup profile (ms since app.py started)")
+    for name, ms in data["milestones_ms"].items():
+        print(f"   {name:<22} {ms:8.1f}")
+    print(f"⏱️ Slowest imports (inclusive, top {SLOWEST_IMPORTS})")
+    for entry in data["imports_ms"][:SLOWEST_IMPORTS]:
+        thread = "" if entry["thread"] == "MainThread" else f"  [{entry['thread']}]"
+        print(f"   {entry['module']:<40} {entry['ms']:8.1f}{thread}")
+    print(f"✅ Saved {path}")
+
+    return data
@@ -0,0 +1,69 @@
+import asyncio
+import json
+
+from label_server import LabelServer
+
+
+async def request(address, method, path, body=b"", headers=None):
+    """(status, body) of one request sent on its own connection"""
+    reader, writer = await asyncio.open_connection(*address)
+    head = f"{method} {path} HTTP/1.1\r\nHost: test\r\nConnection: close\r\n"
+    for name, value in (headers or {"Content-Length": str(len(body))}).items():
+        head += f"{name}: {value}\r\n"
+    writer.write(head.encode("ascii") + b"\r\n" + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    status_line, _, rest = response.partition(b"\r\n")
+    return int(status_line.split()[1]), rest.partition(b"\r\n\r\n")[2]
+
+
+def run_server(test, **options):
+    async def main():
+        server = LabelServer(**options)
+        address = await server.start("127.0.0.1", 0)
+        try:
+            await test(server, address)
+        finally:
+            await server.close()
+    asyncio.run(main())
+
+
+def test_metrics_and_health_answer_while_full():
+    async def test(server, address):
+        # A slow upload holds the only slot
+        reader, writer = await asyncio.open_connection(*address)
+        writer.write(b"POST /crop HTTP/1.1\r\nHost: test\r\nContent-Length: 100000\r\n\r\npartial")
+        await writer.drain()
+        while not server.metrics.receiving:
+            await asyncio.sleep(0.01)
+
+        status, _ = await request(address, "POST", "/label", b'{"receiver": ["a", "b", "c", "d"]}')
+        assert status == 503
+        rejected = server.metrics.rejected
+
+        status, body = await request(address, "GET", "/health", headers={})
+        assert (status, body) == (200, b"ok\n")
+        status, body = await request(address, "GET", "/metrics", headers={})
+        assert status == 200
+        assert b"imagetools_receiving 1" in body
+        assert server.metrics.rejected == rejected
+        writer.close()
+
+    run_server(test, workers=1, queue=0)
+
+
+def test_label_accepts_numeric_postal_and_phone():
+    async def test(server, address):
+        receiver = {"name": "Ali", "address": "Tehran", "postal": 1234567890, "phone": 9121234567}
+        status, body = await request(address, "POST", "/label",
+                                     json.dumps({"receiver": receiver}).encode())
+        assert status == 200
+        assert body.startswith(b"\x89PNG")
+
+        for bad in ({"name": None}, {"name": ["Ali"]}, {"name": {"first": "Ali"}}, [True], "Ali"):
+            status, _ = await request(address, "POST", "/label",
+                                      json.dumps({"receiver": bad}).encode())
+            assert status == 400, bad
+
+    run_server(test, workers=1)
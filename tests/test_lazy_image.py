@@ -0,0 +1,31 @@
+import pytest
+from PIL import Image
+
+from lazy_image import LazyImage
+
+
+@pytest.mark.parametrize("name, fmt", [("scan.tif", "TIFF"), ("scan.png", "PNG")])
+def test_opens_past_the_pixel_limit_without_changing_it(tmp_path, monkeypatch, name, fmt):
+    path = tmp_path / name
+    # 32-row strips, so a TIFF crop decodes only the strips under it
+    Image.new("L", (2000, 1000), 255).save(path, tiffinfo={278: 32})
+    # More than twice the limit, so Image.open() refuses the file; the
+    # rows decoded for the crop are within it
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 200000)
+
+    # Other threads see the limit while the file is being opened
+    limits = []
+    Image.init()
+    factory, accept = Image.OPEN[fmt]
+
+    def recording_factory(*args, **kwargs):
+        limits.append(Image.MAX_IMAGE_PIXELS)
+        return factory(*args, **kwargs)
+
+    monkeypatch.setitem(Image.OPEN, fmt, (recording_factory, accept))
+
+    image = LazyImage(str(path))
+    assert image.crop((10, 10, 60, 40)).size == (50, 30)
+    assert limits and set(limits) == {200000}
+    with pytest.raises(Image.DecompressionBombError):
+        Image.open(path)
@@ -0,0 +1,28 @@
+import re
+import struct
+
+from label_renderer import DEFAULT_SENDER_INFO
+from printer_raster import raster_label, raster_size, stream_preamble
+
+RECEIVER = ["علی رضایی", "تهران، خیابان آزادی، پلاک ۱۲", "1234567890", "09121234567"]
+
+
+def test_203_dpi_zpl_fits_the_head():
+    data, _ = raster_label(DEFAULT_SENDER_INFO, RECEIVER, "zpl", dpi=203, width_dots=812)
+    width, height = map(int, re.match(rb"\^XA\^PW(\d+)\^LL(\d+)", data).groups())
+    # The 80 x 50 mm label at 203 DPI, not the 300 DPI render's 945 dots
+    assert (width, height) == (640, 400)
+    assert width <= 812
+
+
+def test_escpos_is_scaled_to_a_576_dot_head():
+    data, _ = raster_label(DEFAULT_SENDER_INFO, RECEIVER, "escpos", width_dots=576)
+    assert data.startswith(b"\x1dv0\x00")
+    width_bytes, _ = struct.unpack_from("<HH", data, 4)
+    assert width_bytes * 8 == 576
+    assert raster_size(width_dots=576) == (576, 360)
+
+
+def test_tspl_size_keeps_the_label_dimensions():
+    assert stream_preamble("tspl", dpi=203).startswith(b"SIZE 80.0 mm,50.0 mm\r\n")
+    assert stream_preamble("tspl").startswith(b"SIZE 80.0 mm,50.0 mm\r\n")